@@ -3,10 +3,22 @@
 Administrative Mesh - Task routing and orchestration
 """
 
+import importlib
+
 __version__ = "1.0.0"
 
-from .admin_dispatcher import dispatch
-from .task_parser import parse_task
-from .council_router import select_admin
+# Resolved on first access so importing a submodule does not load the whole mesh
+_LAZY_ATTRIBUTES = {
+    "dispatch": ".admin_dispatcher",
+    "parse_task": ".task_parser",
+    "select_admin": ".council_router",
+}
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        value = getattr(importlib.import_module(_LAZY_ATTRIBUTES[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 __all__ = ["dispatch", "parse_task", "select_admin"]
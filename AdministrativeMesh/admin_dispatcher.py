@@ -6,15 +6,19 @@ import sys
 project_root = os.path.dirname(os.path.dirname(__file__))
 sys.path.append(project_root)
 
-from .council_router import select_admin
-from .attention_router import get_context_slice
+from .council_router import select_admin, council_classify
+from .attention_router import get_context_slice, get_semantic_context_slice
 from .task_parser import parse_task
 from .memory_expander import expand_memory
 from .task_lifecycle import log_task_event
 from .function_courier_parser import get_function_signature
+from .code_indexer import get_relevant_definitions
+from .planner_agent import build_plan
+from .plan_executor import get_plan_executor
+from .model_cascade import run_cascade
 
-# Import from LLM_Mesh
-from LLM_Mesh.mesh_manager import MeshManager
+from LLM_Mesh.candidate_search import get_candidate_search
+from config import CANDIDATE_SETTINGS, CASCADE_SETTINGS, COUNCIL_SETTINGS
 
 # Global mesh manager instance
 _mesh_manager = None
@@ -23,53 +27,143 @@ async def get_mesh_manager():
     """Get or create mesh manager instance."""
     global _mesh_manager
     if _mesh_manager is None:
+        from LLM_Mesh.mesh_manager import MeshManager
         _mesh_manager = MeshManager()
-        await _mesh_manager.initialize_models()
+    # Single-flight inside MeshManager: concurrent first requests share one initialization
+    await _mesh_manager.initialize_models()
     return _mesh_manager
 
-async def dispatch(prompt: str):
-    """Main dispatch function for handling user requests."""
+async def _prepare_payload(task: dict) -> dict:
+    """Load context for a parsed task and package the worker payload."""
+    # Step 3: Load context memory and compress to fit
+    loop = asyncio.get_event_loop()
+    raw_context = get_context_slice(task)
+    semantic_context = await loop.run_in_executor(None, get_semantic_context_slice, task)
+    if semantic_context:
+        raw_context = f"{raw_context}\n\n{semantic_context}".strip()
+    compressed_context = expand_memory(raw_context, task['window_tier'])
+
+    # Step 3.5: Attach only the repository definitions the prompt refers to
+    related_code = await loop.run_in_executor(None, get_relevant_definitions, task)
+    if related_code:
+        compressed_context = f"{compressed_context}\n\nRelevant definitions:\n{related_code}".strip()
+
+    # Step 4.5: Load function signature
+    function_sig = get_function_signature(task["type"])
+
+    # Step 5: Package payload
+    return {
+        "code_str": task.get("code", ""),
+        "error_msg": task.get("error", ""),
+        "context": compressed_context,
+        "summary": task.get("summary", ""),
+        "tests": task.get("tests", ""),
+        "function_sig": function_sig
+    }
+
+async def _dispatch_candidates(task: dict, payload: dict, mesh_manager) -> str:
+    """Generate fix candidates concurrently and return the first that compiles and passes the tests."""
+    async def generate(seed: int) -> str:
+        return await mesh_manager.generate_candidate(task["type"], payload, seed, CANDIDATE_SETTINGS["temperature"])
+
+    search = await get_candidate_search().search(
+        payload["code_str"], payload["error_msg"], generate, tests=payload["tests"]
+    )
+    log_task_event(task["id"], phase="candidates", status=f"{search.stage} after {search.attempts} attempts")
+    if search.passed:
+        return search.text
+    # No candidate verified: fall back to the regular handler
+    return await mesh_manager.handle_task(task["type"], payload)
+
+async def dispatch(prompt: str, code: str = None, error: str = None, tests: str = None):
+    """
+    Main dispatch function for handling user requests.
+    Callers that already hold the code (editor sessions) pass it separately,
+    so only the instruction is parsed. ``tests`` are run against fix
+    candidates when candidate search is enabled; they execute on this host,
+    so they must come from the server, never from a client.
+    """
     try:
         # Step 1: Classify task
         task = parse_task(prompt)
+        if code is not None:
+            task["code"] = code
+        if error is not None:
+            task["error"] = error
+        if tests is not None:
+            task["tests"] = tests
 
         # Step 2: Select admin model (or could be fixed)
         admin = select_admin(task)
 
-        # Step 3: Load context memory and compress to fit
-        raw_context = get_context_slice(task)
-        compressed_context = expand_memory(raw_context, task['window_tier'])
+        # Step 2.5: Let the admin council settle the task type concurrently
+        if COUNCIL_SETTINGS["enabled"]:
+            decision = await council_classify(task)
+            if decision.choice:
+                task["type"] = decision.choice
+                admin = f"council({', '.join(decision.votes)})"
+
+        # Steps 3-5: Context, signature and payload
+        payload = await _prepare_payload(task)
 
         # Step 4: Log dispatch phase
         log_task_event(task['id'], phase="dispatch", admin=admin)
 
-        # Step 4.5: Load function signature
-        function_sig = get_function_signature(task["type"])
-
-        # Step 5: Package payload
-        payload = {
-            "code_str": task.get("code", ""),
-            "error_msg": task.get("error", ""),
-            "context": compressed_context,
-            "summary": task.get("summary", ""),
-            "function_sig": function_sig
-        }
-
-        # Step 6: Call mesh manager
+        # Step 6: Call mesh manager (local model first in cascade mode)
         mesh_manager = await get_mesh_manager()
-        result = await mesh_manager.handle_task(task["type"], payload)
+        if CANDIDATE_SETTINGS["enabled"] and task["type"] in CANDIDATE_SETTINGS["task_types"] and payload["code_str"]:
+            result = await _dispatch_candidates(task, payload, mesh_manager)
+        elif CASCADE_SETTINGS["enabled"]:
+            cascade = await run_cascade(task["type"], payload, mesh_manager)
+            log_task_event(task["id"], phase=f"cascade_{cascade.tier}", status=cascade.reason)
+            result = cascade.text
+        else:
+            result = await mesh_manager.handle_task(task["type"], payload)
 
         # Step 7: Log execution phase
         log_task_event(task["id"], phase="executed", status="complete")
 
         return result
         
+    except asyncio.CancelledError:
+        # The client went away; cancellation propagates down to the nodes
+        if 'task' in locals():
+            log_task_event(task.get("id", "unknown"), phase="cancelled")
+        raise
     except Exception as e:
         # Step 7b: Log error and return fallback
         if 'task' in locals():
             log_task_event(task.get("id", "unknown"), phase="error", status=str(e))
         return f"[ERROR]: Dispatch failed: {str(e)}"
 
+async def dispatch_plan(prompt: str):
+    """Run a multi-step plan for the request, yielding each step result as it finishes."""
+    task = parse_task(prompt)
+    admin = select_admin(task)
+    payload = await _prepare_payload(task)
+    plan = build_plan(task)
+
+    log_task_event(task["id"], phase="plan", admin=admin)
+    async for result in get_plan_executor().execute(plan, payload):
+        log_task_event(task["id"], phase=f"step_{result.step}_{result.task}", status=result.status)
+        yield result
+    log_task_event(task["id"], phase="executed", status="complete")
+
+async def dispatch_planned(prompt: str) -> str:
+    """Run the request's plan to completion; the answer is the last step's output."""
+    try:
+        answer = ""
+        async for result in dispatch_plan(prompt):
+            if result.status == "failed":
+                return f"[ERROR]: Plan step {result.step} ({result.task}) failed: {result.output}"
+            if result.status != "skipped":
+                answer = result.output
+        return answer
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        return f"[ERROR]: Plan failed: {str(e)}"
+
 # Standalone for CLI test
 if __name__ == "__main__":
     prompt = "Fix this TypeError in utils.py"
@@ -1,6 +1,22 @@
 import json
 
+from .vector_index import get_vector_index, sync_vector_index
+from .code_indexer import get_repository_indexer
+from config import VECTOR_INDEX_SETTINGS
+
 def get_context_slice(task):
     with open("NeuralCodingAssistant/AgentMemory/ContextMap.json") as f:
         context_map = json.load(f)
     return context_map.get(task["type"], "")
+
+def get_semantic_context_slice(task):
+    """Retrieve the AgentMemory and repository entries most similar to the task text."""
+    index = get_vector_index()
+    if index is None:
+        return ""
+    # Unchanged entries are skipped by content hash, so this only embeds new text
+    sync_vector_index(get_repository_indexer())
+    hits = index.search([task["text"]], k=VECTOR_INDEX_SETTINGS["top_k"])[0]
+    return "\n\n".join(
+        f"[{hit.source}] {hit.text}" for hit in hits if hit.score >= VECTOR_INDEX_SETTINGS["min_score"]
+    )
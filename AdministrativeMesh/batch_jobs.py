@@ -0,0 +1,383 @@
+"""
+Batch Jobs
+==========
+
+Bulk code tasks (e.g. hundreds of files from CI) submitted as one JSONL upload
+instead of one blocking chat call each. Every line is a task:
+
+    {"custom_id": "src/a.py", "prompt": "Fix this code: ..."}
+    {"custom_id": "src/b.py", "messages": [{"role": "user", "content": "..."}]}
+
+Jobs are persisted as JSON files, so unfinished ones resume after a restart.
+Tasks run in the background through ``dispatch`` at lower priority: batch
+workers only pick up a task while interactive requests leave capacity idle.
+Results can be polled or streamed as they finish.
+
+With several gateway workers (a shared state store), only the worker holding
+the ``batch_runner`` lease runs jobs. The others persist new jobs for it to pick
+up, answer lookups from the persisted records and leave a cancel marker for
+the runner.
+"""
+
+import asyncio
+import json
+import os
+import re
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+# Add project root to path for imports
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from config import BATCH_SETTINGS
+from error_handling import request_deadline
+from LLM_Mesh.request_scheduler import request_priority
+from shared_state import get_shared_store, worker_id
+
+JOB_ID = re.compile(r"batch_[0-9a-f]{16}")
+
+# Interactive chat requests currently in flight; batch work yields to them
+INTERACTIVE_LOAD = {"in_flight": 0}
+
+@contextmanager
+def interactive_request():
+    """Mark an interactive request as in flight for the duration of the block."""
+    INTERACTIVE_LOAD["in_flight"] += 1
+    try:
+        yield
+    finally:
+        INTERACTIVE_LOAD["in_flight"] -= 1
+
+@dataclass
+class BatchTask:
+    """One line of a batch upload."""
+    index: int
+    custom_id: str
+    prompt: str
+    status: str = "pending"  # pending, completed, failed
+    result: Optional[str] = None
+    error: Optional[str] = None
+    duration: Optional[float] = None
+
+@dataclass
+class BatchJob:
+    """A persisted batch of tasks."""
+    id: str
+    created_at: str
+    status: str = "queued"  # queued, running, completed, cancelled
+    finished_at: Optional[str] = None
+    owner: Optional[str] = None  # Submitting API key; the scheduler's tenant
+    tasks: List[BatchTask] = field(default_factory=list)
+
+    def counts(self) -> Dict[str, int]:
+        counts = {"total": len(self.tasks), "pending": 0, "completed": 0, "failed": 0}
+        for task in self.tasks:
+            counts[task.status] += 1
+        return counts
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "object": "batch",
+            "status": self.status,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "request_counts": self.counts()
+        }
+
+def parse_jsonl(text: str, max_tasks: int = None) -> List[BatchTask]:
+    """Parse an upload into tasks; raises ValueError naming the first bad line."""
+    tasks = []
+    for number, line in enumerate(text.splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Line {number} is not valid JSON: {str(e)}")
+        prompt = item.get("prompt") if isinstance(item, dict) else None
+        if prompt is None and isinstance(item, dict) and item.get("messages"):
+            prompt = item["messages"][-1].get("content")
+        if not isinstance(prompt, str) or not prompt.strip():
+            raise ValueError(f"Line {number} has no prompt or messages")
+        tasks.append(BatchTask(len(tasks), str(item.get("custom_id", len(tasks))), prompt))
+    if not tasks:
+        raise ValueError("Batch contains no tasks")
+    if max_tasks and len(tasks) > max_tasks:
+        raise ValueError(f"Batch has {len(tasks)} tasks; the limit is {max_tasks}")
+    return tasks
+
+class BatchJobManager:
+    """Persists batch jobs and runs them in the background at low priority."""
+
+    def __init__(self, settings: Dict[str, Any] = None, directory: str = None, runner=None, store=None):
+        self.settings = {**BATCH_SETTINGS, **(settings or {})}
+        self.directory = directory or os.path.join(project_root, self.settings["directory"])
+        self.runner = runner  # async (prompt) -> str; dispatch by default
+        self.store = store  # Shared state store in multi-worker mode
+        self.jobs: Dict[str, BatchJob] = {}
+        self.updates: Dict[str, asyncio.Condition] = {}
+        self.workers: Dict[str, asyncio.Task] = {}
+        self.started = False
+        self.leader = store is None  # Whether this process runs jobs
+        self.lease_loop: Optional[asyncio.Task] = None
+
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def _save(self, job: BatchJob):
+        # Write then rename, so a crash never leaves a half-written record
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = self._path(job.id) + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(asdict(job), f)
+        os.replace(temp_path, self._path(job.id))
+
+    def _read(self, job_id: str) -> Optional[BatchJob]:
+        if not JOB_ID.fullmatch(job_id):
+            return None
+        try:
+            with open(self._path(job_id)) as f:
+                data = json.load(f)
+            return BatchJob(**{**data, "tasks": [BatchTask(**task) for task in data["tasks"]]})
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, TypeError, KeyError) as e:
+            print(f"⚠️  Skipping unreadable batch record {job_id}: {str(e)}")
+            return None
+
+    def _record_ids(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return [name[:-5] for name in sorted(os.listdir(self.directory)) if name.endswith(".json")]
+
+    def _load_all(self):
+        for job_id in self._record_ids():
+            if job_id not in self.workers:
+                job = self._read(job_id)
+                if job is not None:
+                    self.jobs[job.id] = job
+
+    def _resume_unfinished(self) -> int:
+        self._load_all()
+        resumed = 0
+        for job in list(self.jobs.values()):
+            if job.status in ("queued", "running") and job.id not in self.workers:
+                self._schedule(job)
+                resumed += 1
+        if resumed:
+            print(f"📦 Resumed {resumed} unfinished batch job(s)")
+        return resumed
+
+    def start(self) -> int:
+        """Load persisted jobs and resume the unfinished ones; returns how many resumed."""
+        if self.started:
+            return 0
+        self.started = True
+        if self.store is not None:
+            # Multi-worker: only the lease holder runs jobs
+            self.lease_loop = asyncio.ensure_future(self._run_lease_loop())
+            return 0
+        return self._resume_unfinished()
+
+    async def _run_lease_loop(self):
+        """Hold (or wait for) the runner lease; the holder resumes new and orphaned jobs."""
+        interval = self.settings["lease_interval"]
+        owner = worker_id()
+        while True:
+            try:
+                held = await self.store.run(self.store.acquire_lease, "batch_runner", owner, interval * 3)
+            except Exception as e:
+                print(f"⚠️  Batch lease check failed: {str(e)}")
+                held = False
+            if held:
+                if not self.leader:
+                    print(f"📦 Worker {owner} is now the batch runner")
+                self.leader = True
+                self._resume_unfinished()
+                await self._apply_cancel_markers()
+            elif self.leader:
+                # Lost the lease (e.g. stalled); the new holder resumes the pending tasks
+                self.leader = False
+                await self._stop_workers()
+            await asyncio.sleep(interval)
+
+    async def _stop_workers(self):
+        workers = list(self.workers.values())
+        self.workers.clear()
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    def _cancel_marker(self, job_id: str) -> str:
+        return self._path(job_id) + ".cancel"
+
+    async def _apply_cancel_markers(self):
+        for name in os.listdir(self.directory) if os.path.isdir(self.directory) else []:
+            if name.endswith(".json.cancel"):
+                job_id = name[:-len(".json.cancel")]
+                await self.cancel_job(job_id)
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+
+    def create_job(self, jsonl: str, owner: str = None) -> BatchJob:
+        """Persist a new job from a JSONL upload and start it in the background."""
+        tasks = parse_jsonl(jsonl, self.settings["max_tasks"])
+        job = BatchJob(f"batch_{uuid.uuid4().hex[:16]}", datetime.now().isoformat(), tasks=tasks, owner=owner)
+        self.jobs[job.id] = job
+        self._save(job)
+        if self.leader:
+            self._schedule(job)  # Otherwise the runner picks it up from its record
+        print(f"📦 Batch {job.id} accepted with {len(tasks)} tasks")
+        return job
+
+    def get_job(self, job_id: str) -> Optional[BatchJob]:
+        if job_id in self.workers or (self.store is None and job_id in self.jobs):
+            return self.jobs[job_id]
+        return self._read(job_id)  # Finished, or run by another worker
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        jobs = {job_id: self.get_job(job_id) for job_id in self._record_ids()}
+        jobs.update({job_id: self.jobs[job_id] for job_id in self.workers})
+        return [job.summary() for job in sorted(filter(None, jobs.values()), key=lambda j: j.created_at, reverse=True)]
+
+    async def cancel_job(self, job_id: str) -> Optional[BatchJob]:
+        job = self.get_job(job_id)
+        if job is None or job.status in ("completed", "cancelled"):
+            return job
+        if not self.leader:
+            # The runner is another worker; it cancels the job on its next lease check
+            with open(self._cancel_marker(job_id), "w"):
+                pass
+            job.status = "cancelling"
+            return job
+        worker = self.workers.pop(job_id, None)
+        if worker:
+            worker.cancel()
+            await asyncio.gather(worker, return_exceptions=True)
+        job.status = "cancelled"
+        job.finished_at = datetime.now().isoformat()
+        self._save(job)
+        await self._notify(job)
+        return job
+
+    def _schedule(self, job: BatchJob):
+        self.updates.setdefault(job.id, asyncio.Condition())
+        self.workers[job.id] = asyncio.ensure_future(self._run_job(job))
+
+    async def _notify(self, job: BatchJob):
+        condition = self.updates.setdefault(job.id, asyncio.Condition())
+        async with condition:
+            condition.notify_all()
+
+    async def _wait_for_idle_capacity(self):
+        """Batch tasks start only while interactive load is within the headroom."""
+        while INTERACTIVE_LOAD["in_flight"] > self.settings["interactive_headroom"]:
+            await asyncio.sleep(self.settings["idle_poll_interval"])
+
+    async def _run_task(self, job: BatchJob, task: BatchTask):
+        if self.runner is None:
+            from .admin_dispatcher import dispatch
+            self.runner = dispatch
+        start = time.monotonic()
+        try:
+            # Batch class: host slots go to interactive and chat requests first
+            with request_deadline(self.settings["task_timeout"]), request_priority("batch", job.owner or job.id):
+                result = await asyncio.wait_for(self.runner(task.prompt), self.settings["task_timeout"])
+            if isinstance(result, str) and result.startswith("[ERROR]"):
+                task.status, task.error = "failed", result
+            else:
+                task.status, task.result = "completed", result
+        except asyncio.TimeoutError:
+            task.status, task.error = "failed", f"Timed out after {self.settings['task_timeout']}s"
+        except Exception as e:
+            task.status, task.error = "failed", str(e)
+        task.duration = round(time.monotonic() - start, 3)
+        self._save(job)
+        await self._notify(job)
+
+    async def _run_job(self, job: BatchJob):
+        job.status = "running"
+        self._save(job)
+        pending = asyncio.Queue()
+        for task in job.tasks:
+            if task.status == "pending":
+                pending.put_nowait(task)
+
+        async def worker():
+            while not pending.empty():
+                await self._wait_for_idle_capacity()
+                try:
+                    task = pending.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                await self._run_task(job, task)
+
+        workers = [asyncio.ensure_future(worker()) for _ in range(self.settings["concurrency"])]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+        job.status = "completed"
+        job.finished_at = datetime.now().isoformat()
+        self._save(job)
+        self.workers.pop(job.id, None)
+        await self._notify(job)
+        counts = job.counts()
+        print(f"📦 Batch {job.id} finished: {counts['completed']} completed, {counts['failed']} failed")
+
+    async def _poll_results(self, job_id: str) -> AsyncIterator[Dict[str, Any]]:
+        """Results of a job run by another worker, read from its record."""
+        sent = set()
+        while True:
+            job = self._read(job_id)
+            if job is None:
+                return
+            for task in job.tasks:
+                if task.status != "pending" and task.index not in sent:
+                    sent.add(task.index)
+                    yield asdict(task)
+            if job.status in ("completed", "cancelled"):
+                return
+            await asyncio.sleep(self.settings["shared_poll_interval"])
+
+    async def stream_results(self, job_id: str) -> AsyncIterator[Dict[str, Any]]:
+        """Yield each task's result as it finishes, until the job is done."""
+        if job_id not in self.workers and (self.store is not None or job_id not in self.jobs):
+            async for result in self._poll_results(job_id):
+                yield result
+            return
+        job = self.jobs[job_id]
+        condition = self.updates.setdefault(job_id, asyncio.Condition())
+        sent = set()
+        while True:
+            # Check under the condition's lock so no notification is missed
+            async with condition:
+                ready = [task for task in job.tasks if task.status != "pending" and task.index not in sent]
+                done = job.status in ("completed", "cancelled")
+                if not ready and not done:
+                    await condition.wait()
+                    continue
+            for task in ready:
+                sent.add(task.index)
+                yield asdict(task)
+            if done:
+                return
+
+# Shared manager used by the API
+_batch_manager: Optional[BatchJobManager] = None
+
+def get_batch_manager() -> BatchJobManager:
+    global _batch_manager
+    if _batch_manager is None:
+        _batch_manager = BatchJobManager(store=get_shared_store())
+    return _batch_manager
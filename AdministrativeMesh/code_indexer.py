@@ -0,0 +1,375 @@
+"""
+Repository Code Indexer
+=======================
+
+Splits Python sources into function and class chunks with ``ast`` and keeps a
+symbol table plus an import graph, so dispatch can attach only the definitions
+a task refers to instead of the user pasting whole files.
+
+One lock covers updates and lookups, since dispatch reads the index from
+executor threads. Dispatch refreshes it at most once per ``refresh_interval``.
+"""
+
+import ast
+import hashlib
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+# Add project root to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import CODE_INDEX_SETTINGS
+
+IDENTIFIER_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)*")
+FILE_PATTERN = re.compile(r"[\w./-]+\.py\b")
+
+@dataclass
+class CodeChunk:
+    """A single function, method or class definition."""
+    name: str  # Qualified name, e.g. "MeshManager.route_task"
+    kind: str  # "function" or "class"
+    path: str
+    module: str
+    start_line: int
+    end_line: int
+    source: str
+
+@dataclass
+class IndexedFile:
+    """Index entry for one source file, keyed by its content hash."""
+    path: str
+    module: str
+    content_hash: str
+    mtime: float
+    size: int
+    chunks: List[CodeChunk] = field(default_factory=list)
+    imports: List[str] = field(default_factory=list)
+    parse_error: Optional[str] = None
+
+def hash_source(source: str) -> str:
+    """Content hash used to decide whether a file needs re-indexing."""
+    return hashlib.sha256(source.encode("utf-8", errors="replace")).hexdigest()
+
+def module_name_for(path: str, root: str) -> str:
+    """Convert a file path into a dotted module name relative to the root."""
+    relative = os.path.relpath(path, root)
+    module = os.path.splitext(relative)[0].replace(os.sep, ".")
+    if module.endswith(".__init__"):
+        module = module[: -len(".__init__")]
+    return module
+
+def _resolve_import(module: str, node: ast.ImportFrom) -> str:
+    """Resolve a (possibly relative) ``from ... import`` to an absolute module."""
+    if not node.level:
+        return node.module or ""
+    package_parts = module.split(".")[: -node.level]
+    if node.module:
+        package_parts.append(node.module)
+    return ".".join(part for part in package_parts if part)
+
+def parse_python_source(path: str, source: str, module: str) -> Tuple[List[CodeChunk], List[str]]:
+    """Split source into definition chunks and collect imported modules."""
+    tree = ast.parse(source, filename=path)
+    lines = source.splitlines()
+    chunks: List[CodeChunk] = []
+    imports: List[str] = []
+
+    def add_chunk(node, qualified_name: str, kind: str):
+        # Include decorators so the chunk is self-contained
+        start = min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])])
+        end = getattr(node, "end_lineno", None) or node.lineno
+        chunks.append(CodeChunk(
+            name=qualified_name,
+            kind=kind,
+            path=path,
+            module=module,
+            start_line=start,
+            end_line=end,
+            source="\n".join(lines[start - 1:end])
+        ))
+
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            add_chunk(node, node.name, "function")
+        elif isinstance(node, ast.ClassDef):
+            add_chunk(node, node.name, "class")
+            for child in node.body:
+                if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                    add_chunk(child, f"{node.name}.{child.name}", "function")
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            imports.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            resolved = _resolve_import(module, node)
+            if resolved:
+                imports.append(resolved)
+
+    return chunks, sorted(set(imports))
+
+def index_file(path: str, root: str) -> Optional[IndexedFile]:
+    """Read and index a single file. Top-level so it can run in a process pool."""
+    try:
+        stat = os.stat(path)
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            source = f.read()
+    except OSError:
+        return None
+
+    module = module_name_for(path, root)
+    entry = IndexedFile(
+        path=path,
+        module=module,
+        content_hash=hash_source(source),
+        mtime=stat.st_mtime,
+        size=stat.st_size
+    )
+    try:
+        entry.chunks, entry.imports = parse_python_source(path, source, module)
+    except (SyntaxError, ValueError) as e:
+        # Keep the hash so an unchanged broken file is not re-parsed every refresh
+        entry.parse_error = str(e)
+    return entry
+
+def _index_file_star(args: Tuple[str, str]) -> Optional[IndexedFile]:
+    return index_file(*args)
+
+class RepositoryIndexer:
+    """
+    Incremental index of a Python repository.
+    Files are re-parsed only when their content hash changes.
+    """
+
+    def __init__(self, root: str, exclude_dirs: Optional[List[str]] = None):
+        self.root = os.path.abspath(root)
+        self.exclude_dirs = set(exclude_dirs or CODE_INDEX_SETTINGS["exclude_dirs"])
+        self.files: Dict[str, IndexedFile] = {}
+        self.symbols: Dict[str, List[CodeChunk]] = {}
+        self.import_graph: Dict[str, Set[str]] = {}
+        self.built = False
+        self.refreshed_at = 0.0  # Monotonic time of the last build or refresh
+        self.lock = threading.RLock()  # Guards the tables; held only to read or swap them
+        self.refresh_lock = threading.RLock()  # One build or refresh at a time; never blocks lookups
+
+    def discover_files(self) -> List[str]:
+        """List Python files under the root, skipping excluded directories."""
+        found = []
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [d for d in dirnames if d not in self.exclude_dirs and not d.startswith(".")]
+            for filename in filenames:
+                if filename.endswith(".py"):
+                    found.append(os.path.join(dirpath, filename))
+        return sorted(found)
+
+    def build(self, max_workers: Optional[int] = None) -> int:
+        """Index the whole repository, fanning parsing out over a process pool."""
+        with self.refresh_lock:
+            paths = self.discover_files()
+            jobs = [(path, self.root) for path in paths]
+            entries: List[Optional[IndexedFile]] = []
+
+            if len(jobs) >= CODE_INDEX_SETTINGS["parallel_threshold"]:
+                try:
+                    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                        entries = list(pool.map(_index_file_star, jobs, chunksize=16))
+                except (OSError, RuntimeError) as e:
+                    # Restricted environments may not allow worker processes
+                    print(f"⚠️  Process pool unavailable for indexing ({e}), indexing serially")
+                    entries = []
+
+            if not entries:
+                entries = [index_file(path, self.root) for path in paths]
+
+            # Parsing happens outside the lock; lookups only wait for the swap
+            with self.lock:
+                self.files.clear()
+                self.symbols.clear()
+                self.import_graph.clear()
+                for entry in entries:
+                    if entry:
+                        self._register(entry)
+
+                self.built = True
+                self.refreshed_at = time.monotonic()
+                return len(self.files)
+
+    def update_file(self, path: str) -> bool:
+        """Re-index one file if its content changed. Returns True if it was updated."""
+        path = os.path.abspath(path)
+        if not os.path.exists(path):
+            return self.remove_file(path)
+
+        # Parse outside the lock; only the table update holds it
+        entry = index_file(path, self.root)
+        if entry is None:
+            return False
+        with self.lock:
+            existing = self.files.get(path)
+            if existing and existing.content_hash == entry.content_hash:
+                existing.mtime, existing.size = entry.mtime, entry.size
+                return False
+
+            if existing:
+                self._unregister(existing)
+            self._register(entry)
+            return True
+
+    def remove_file(self, path: str) -> bool:
+        """Drop a deleted file from the index."""
+        with self.lock:
+            existing = self.files.get(os.path.abspath(path))
+            if not existing:
+                return False
+            self._unregister(existing)
+            return True
+
+    def refresh(self) -> Dict[str, int]:
+        """Bring the index up to date, re-parsing only files whose content changed."""
+        with self.refresh_lock:
+            if not self.built:
+                return {"added": self.build(), "updated": 0, "removed": 0}
+
+            stats = {"added": 0, "updated": 0, "removed": 0}
+            current = set(self.discover_files())
+            with self.lock:
+                known = {path: (entry.mtime, entry.size) for path, entry in self.files.items()}
+
+            for path in known:
+                if path not in current:
+                    self.remove_file(path)
+                    stats["removed"] += 1
+
+            for path in current:
+                if path in known:
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    # Cheap mtime/size check before hashing the content
+                    if (stat.st_mtime, stat.st_size) == known[path]:
+                        continue
+                    if self.update_file(path):
+                        stats["updated"] += 1
+                elif self.update_file(path):
+                    stats["added"] += 1
+
+            self.refreshed_at = time.monotonic()
+            return stats
+
+    def refresh_if_stale(self, interval: float = None) -> Optional[Dict[str, int]]:
+        """Refresh unless the index was refreshed less than ``interval`` seconds ago."""
+        interval = CODE_INDEX_SETTINGS["refresh_interval"] if interval is None else interval
+        if self.built and time.monotonic() - self.refreshed_at < interval:
+            return None
+        with self.refresh_lock:
+            # Another thread may have refreshed while this one waited
+            if self.built and time.monotonic() - self.refreshed_at < interval:
+                return None
+            return self.refresh()
+
+    def _register(self, entry: IndexedFile):
+        self.files[entry.path] = entry
+        self.import_graph[entry.module] = set(entry.imports)
+        for chunk in entry.chunks:
+            self.symbols.setdefault(chunk.name, []).append(chunk)
+            simple_name = chunk.name.rsplit(".", 1)[-1]
+            if simple_name != chunk.name:
+                self.symbols.setdefault(simple_name, []).append(chunk)
+
+    def _unregister(self, entry: IndexedFile):
+        self.files.pop(entry.path, None)
+        self.import_graph.pop(entry.module, None)
+        for chunk in entry.chunks:
+            for key in {chunk.name, chunk.name.rsplit(".", 1)[-1]}:
+                remaining = [c for c in self.symbols.get(key, []) if c.path != entry.path]
+                if remaining:
+                    self.symbols[key] = remaining
+                else:
+                    self.symbols.pop(key, None)
+
+    def lookup(self, name: str) -> List[CodeChunk]:
+        """Find definitions by simple or qualified name."""
+        with self.lock:
+            return list(self.symbols.get(name, []))
+
+    def dependents(self, module: str) -> Set[str]:
+        """Modules that import the given module."""
+        with self.lock:
+            return {mod for mod, imports in self.import_graph.items() if module in imports}
+
+    def find_relevant_chunks(self, text: str, limit: int = 5) -> List[CodeChunk]:
+        """Pick the definitions a prompt refers to by symbol or file name."""
+        with self.lock:
+            scored: Dict[Tuple[str, str], Tuple[int, CodeChunk]] = {}
+
+            def consider(chunk: CodeChunk, score: int):
+                key = (chunk.path, chunk.name)
+                if key not in scored or scored[key][0] < score:
+                    scored[key] = (score, chunk)
+
+            for token in set(IDENTIFIER_PATTERN.findall(text)):
+                # Qualified names ("Class.method") beat bare identifiers
+                for chunk in self.symbols.get(token, []):
+                    consider(chunk, 3 if "." in token else 2)
+                tail = token.rsplit(".", 1)[-1]
+                if tail != token:
+                    for chunk in self.symbols.get(tail, []):
+                        consider(chunk, 1)
+
+            mentioned_files = {os.path.normpath(m) for m in FILE_PATTERN.findall(text)}
+            if mentioned_files:
+                for entry in self.files.values():
+                    relative = os.path.relpath(entry.path, self.root)
+                    if any(relative.endswith(m) for m in mentioned_files):
+                        for chunk in entry.chunks:
+                            if "." not in chunk.name:
+                                consider(chunk, 1)
+
+            ranked = sorted(scored.values(), key=lambda item: (-item[0], len(item[1].source)))
+            return [chunk for _, chunk in ranked[:limit]]
+
+    def render_context(self, chunks: List[CodeChunk], max_chars: int) -> str:
+        """Render chunks as a compact context block within a character budget."""
+        parts = []
+        used = 0
+        for chunk in chunks:
+            relative = os.path.relpath(chunk.path, self.root)
+            block = f"# {relative}:{chunk.start_line}-{chunk.end_line}\n{chunk.source}"
+            if used + len(block) > max_chars:
+                break
+            parts.append(block)
+            used += len(block)
+        return "\n\n".join(parts)
+
+# Global indexer instance, created on first use
+_repository_indexer = None
+
+def get_repository_indexer() -> Optional[RepositoryIndexer]:
+    """Get the workspace indexer, or None if no workspace root is configured."""
+    global _repository_indexer
+    root = CODE_INDEX_SETTINGS["root"]
+    if not root or not os.path.isdir(root):
+        return None
+    if _repository_indexer is None:
+        _repository_indexer = RepositoryIndexer(root)
+    return _repository_indexer
+
+def get_relevant_definitions(task: dict) -> str:
+    """Return the repository definitions relevant to a parsed task."""
+    indexer = get_repository_indexer()
+    if indexer is None:
+        return ""
+    indexer.refresh_if_stale()
+    chunks = indexer.find_relevant_chunks(task.get("text", ""), CODE_INDEX_SETTINGS["max_chunks"])
+    return indexer.render_context(chunks, CODE_INDEX_SETTINGS["max_chars"])
+
+if __name__ == "__main__":
+    indexer = RepositoryIndexer(sys.argv[1] if len(sys.argv) > 1 else ".")
+    count = indexer.build()
+    print(f"✅ Indexed {count} files, {len(indexer.symbols)} symbols")
@@ -1,3 +1,14 @@
+import os
+import sys
+from typing import List, Optional
+
+# Add project root to path
+project_root = os.path.dirname(os.path.dirname(__file__))
+sys.path.append(project_root)
+
+from config import COUNCIL_SETTINGS, FUNCTION_SIGNATURES
+from .vote_system import CouncilDecision, CouncilMember, concurrent_council_vote
+
 def select_admin(task):
     """Select the best administrative model based on task characteristics."""
     if task["length"] > 16000:
@@ -7,3 +18,47 @@ def select_admin(task):
     if "tool" in task["keywords"] or "steps" in task["text"] or task["type"] == "debug":
         return "qwen1.5-72b-chat"  # Tool usage and debugging
     return "deepseek-llm-67b-chat"  # Default to deepseek for general tasks
+
+def select_council(task) -> List[CouncilMember]:
+    """Council members for a task; the admin select_admin would pick gets a weight bonus."""
+    preferred = select_admin(task)
+    return [
+        CouncilMember(
+            model=member["model"],
+            weight=member["weight"] * (COUNCIL_SETTINGS["preferred_bonus"] if member["model"] == preferred else 1.0),
+            timeout=member.get("timeout", COUNCIL_SETTINGS["timeout"])
+        )
+        for member in COUNCIL_SETTINGS["members"]
+    ]
+
+def _parse_task_type(response: str) -> Optional[str]:
+    """Read a task type from a member's reply, or None if it gave no usable answer."""
+    if not response or response.startswith("[FALLBACK"):
+        return None
+    words = response.strip().lower().replace(".", " ").split()
+    for word in words[:5]:
+        if word in FUNCTION_SIGNATURES:
+            return word
+    return None
+
+async def council_classify(task) -> CouncilDecision:
+    """Ask the admin council concurrently which task type the request is."""
+    from .mesh_manager import run_model_inference
+
+    options = ", ".join(FUNCTION_SIGNATURES)
+    prompt = (
+        f"Classify the following coding request as exactly one of: {options}.\n"
+        f"Request: {task['text'][:2000]}\n"
+        f"Answer with a single word:"
+    )
+
+    async def ask(member: CouncilMember) -> Optional[str]:
+        response = await run_model_inference(member.model, prompt, max_tokens=4)
+        return _parse_task_type(response)
+
+    return await concurrent_council_vote(
+        select_council(task),
+        ask,
+        quorum=COUNCIL_SETTINGS["quorum"],
+        decisive_margin=COUNCIL_SETTINGS["decisive_margin"]
+    )
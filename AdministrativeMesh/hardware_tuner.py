@@ -0,0 +1,171 @@
+"""
+Hardware Auto-Tuner for llama.cpp
+=================================
+
+Benchmarks each local model on this machine across thread counts, batch sizes
+and context sizes, and writes the best runtime profile to disk. Profiles are
+keyed by model file, since each quantized variant of a model has its own best
+settings. ``load_model`` applies the profile of the file it loads.
+
+Usage:
+    python -m AdministrativeMesh.hardware_tuner [model-name ...]
+"""
+
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+# Add project root to path for imports
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from config import RUNTIME_TUNING_SETTINGS
+
+PROFILE_PATH = os.path.join(project_root, RUNTIME_TUNING_SETTINGS["profile_path"])
+
+# Used when a model has no profile for this machine
+DEFAULT_RUNTIME_PROFILE = {"n_ctx": 4096, "n_threads": 4, "n_batch": 512}
+
+BENCHMARK_PROMPT = (
+    "def parse_config(path):\n"
+    "    with open(path) as f:\n"
+    "        data = json.load(f)\n"
+    "    return data['settings']\n\n"
+    "Explain what this function does and how it could fail:"
+)
+
+BenchmarkFn = Callable[[str, Dict[str, int]], Optional[float]]
+
+def thread_candidates(cpu_count: int = None) -> List[int]:
+    """Thread counts worth trying: powers of two up to the core count, plus the core count."""
+    cpu_count = cpu_count or os.cpu_count() or 4
+    candidates = {cpu_count}
+    n = 1
+    while n < cpu_count:
+        candidates.add(n)
+        n *= 2
+    # Very small counts are never the winner on multi-core machines
+    return sorted(c for c in candidates if c >= min(2, cpu_count))
+
+def benchmark_llama(model_path: str, params: Dict[str, int]) -> Optional[float]:
+    """Load the model with the given parameters and measure generated tokens/sec."""
+    try:
+        from llama_cpp import Llama
+    except ImportError:
+        return None
+
+    try:
+        model = Llama(model_path=model_path, verbose=False, **params)
+        # Warm-up call so one-off allocation does not skew the measurement
+        model(BENCHMARK_PROMPT, max_tokens=4)
+        start = time.monotonic()
+        response = model(BENCHMARK_PROMPT, max_tokens=RUNTIME_TUNING_SETTINGS["benchmark_tokens"])
+        elapsed = time.monotonic() - start
+        generated = response.get("usage", {}).get("completion_tokens", 0)
+        del model
+        return generated / elapsed if elapsed > 0 and generated else None
+    except Exception as e:
+        print(f"⚠️  Benchmark failed for {params}: {str(e)}")
+        return None
+
+def tune_model(model_path: str, benchmark: BenchmarkFn = benchmark_llama,
+               cpu_count: int = None) -> Optional[Dict[str, Any]]:
+    """
+    Coordinate search at the smallest configured context: threads first, then
+    batch size, then the largest context size that keeps throughput within
+    tolerance of the best run.
+    """
+    context_sizes = sorted(RUNTIME_TUNING_SETTINGS["context_sizes"])
+    best = {**DEFAULT_RUNTIME_PROFILE, "n_ctx": context_sizes[0]}
+    best_speed = None
+
+    def measure(params: Dict[str, int]) -> Optional[float]:
+        speed = benchmark(model_path, params)
+        print(f"   {params} → {speed:.2f} tok/s" if speed else f"   {params} → failed")
+        return speed
+
+    for n_threads in thread_candidates(cpu_count):
+        speed = measure({**best, "n_threads": n_threads})
+        if speed and (best_speed is None or speed > best_speed):
+            best_speed, best["n_threads"] = speed, n_threads
+
+    if best_speed is None:
+        return None
+
+    for n_batch in RUNTIME_TUNING_SETTINGS["batch_sizes"]:
+        if n_batch == best["n_batch"]:
+            continue
+        speed = measure({**best, "n_batch": n_batch})
+        if speed and speed > best_speed:
+            best_speed, best["n_batch"] = speed, n_batch
+
+    # Prefer the largest context that does not cost meaningful throughput (or fail to load)
+    tolerance = RUNTIME_TUNING_SETTINGS["context_tolerance"]
+    for n_ctx in context_sizes[1:]:
+        speed = measure({**best, "n_ctx": n_ctx})
+        if not speed or speed < best_speed * (1 - tolerance):
+            break
+        best["n_ctx"] = n_ctx
+
+    return {**best, "tokens_per_sec": round(best_speed, 2)}
+
+# Cached profiles, re-read only when the file changes
+_profile_cache = {"mtime": None, "profiles": {}}
+
+def load_profiles() -> Dict[str, Any]:
+    """Saved profiles keyed by model file path."""
+    try:
+        mtime = os.path.getmtime(PROFILE_PATH)
+    except OSError:
+        return {}
+    if _profile_cache["mtime"] != mtime:
+        try:
+            with open(PROFILE_PATH, "r") as f:
+                _profile_cache["profiles"] = json.load(f)
+            _profile_cache["mtime"] = mtime
+        except (OSError, ValueError):
+            return {}
+    return dict(_profile_cache["profiles"])
+
+def save_profiles(profiles: Dict[str, Any]):
+    os.makedirs(os.path.dirname(PROFILE_PATH), exist_ok=True)
+    with open(PROFILE_PATH, "w") as f:
+        json.dump(profiles, f, indent=2)
+
+def get_runtime_profile(model_path: Optional[str]) -> Dict[str, int]:
+    """Runtime parameters for a model file, tuned for this machine when a profile exists."""
+    profile = load_profiles().get(os.path.normpath(model_path)) if model_path else None
+    # Profiles tuned on different hardware do not apply
+    if not profile or profile.get("cpu_count") != os.cpu_count():
+        return dict(DEFAULT_RUNTIME_PROFILE)
+    return {key: profile.get(key, value) for key, value in DEFAULT_RUNTIME_PROFILE.items()}
+
+def tune_models(model_paths: Dict[str, str], model_names: List[str] = None,
+                benchmark: BenchmarkFn = benchmark_llama) -> Dict[str, Any]:
+    """Tune the given models' files (all by default) and persist their profiles."""
+    profiles = load_profiles()
+    for model_name in model_names or list(model_paths):
+        model_path = model_paths.get(model_name)
+        if not model_path or not os.path.exists(model_path):
+            print(f"⚠️  Skipping {model_name}: model file not found")
+            continue
+
+        print(f"🔧 Tuning {model_name}...")
+        profile = tune_model(model_path, benchmark)
+        if profile is None:
+            print(f"❌ Could not benchmark {model_name}")
+            continue
+
+        profile.update({"model": model_name, "cpu_count": os.cpu_count(), "tuned_at": datetime.now().isoformat()})
+        profiles[os.path.normpath(model_path)] = profile
+        save_profiles(profiles)
+        print(f"✅ {model_name}: {profile}")
+    return profiles
+
+if __name__ == "__main__":
+    # The files load_model would pick on this machine, variants included
+    from AdministrativeMesh.mesh_manager import MODEL_PATHS, resolve_model_file
+    tune_models({name: resolve_model_file(name)[1] for name in MODEL_PATHS}, sys.argv[1:] or None)
@@ -1,17 +1,30 @@
 import asyncio
 import json
 import importlib
+import importlib.util
+import math
 import sys
+import threading
+import time
 import os
 
 # Add project root to path for imports
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-try:
-    from llama_cpp import Llama
-    LLAMA_CPP_AVAILABLE = True
-except ImportError:
-    LLAMA_CPP_AVAILABLE = False
+from LLM_Mesh.prompt_packer import PromptSection, pack_prompt
+from LLM_Mesh.core_allocator import core_allocator
+from LLM_Mesh.generation_limits import generation_limits
+from LLM_Mesh.model_variants import record_serving_variant, select_local_variant
+from LLM_Mesh.output_grammar import compile_grammar, constrain_instruction, get_output_shape, validate_output
+from .model_executor import ModelBusyError, get_model_executor
+from .hardware_tuner import get_runtime_profile
+from .model_process_pool import ModelProcessError, get_process_supervisor
+from config import CORE_ALLOCATION_SETTINGS, LOCAL_INFERENCE_SETTINGS, PATCH_SETTINGS
+from error_handling import time_remaining
+
+# llama_cpp itself is imported on first model load; importing it costs seconds
+LLAMA_CPP_AVAILABLE = importlib.util.find_spec("llama_cpp") is not None
+if not LLAMA_CPP_AVAILABLE:
     print("⚠️  llama-cpp-python not found. Install with: pip install llama-cpp-python")
 
 # Model paths
@@ -31,6 +44,11 @@ MODEL_PATHS = {
 
 # Model cache to avoid reloading
 model_cache = {}
+model_files = {}  # Model name → file it was loaded from (a variant or the pinned path)
+
+# Default generation length and stops for local models, until generation_limits has learned better
+DEFAULT_MAX_TOKENS = 512
+DEFAULT_STOP = ["</s>", "\n\n"]
 
 # Mapping task types to worker models and their functions
 TASK_MAP = {
@@ -42,6 +60,15 @@ TASK_MAP = {
     "refactor": ("wizardcoder-python-34b", "run_advanced_refactor")
 }
 
+def resolve_model_file(model_name: str):
+    """(variant, path) load_model would use: the best downloaded quantization that fits free memory, else MODEL_PATHS."""
+    variant = select_local_variant(model_name)
+    return variant, variant.path if variant else MODEL_PATHS.get(model_name)
+
+def model_file(model_name: str):
+    """The file serving ``model_name``, or the one it would be loaded from."""
+    return model_files.get(model_name) or resolve_model_file(model_name)[1]
+
 # Load model with caching
 def load_model(model_name: str):
     """Load a GGUF/GGML model with caching."""
@@ -52,50 +79,159 @@ def load_model(model_name: str):
     if model_name in model_cache:
         return model_cache[model_name]
     
-    if model_name not in MODEL_PATHS:
+    variant, model_path = resolve_model_file(model_name)
+    if model_path is None:
         print(f"❌ Model {model_name} not found in MODEL_PATHS")
         return None
     
-    model_path = MODEL_PATHS[model_name]
     if not os.path.exists(model_path):
         print(f"❌ Model file not found: {model_path}")
         return None
     
     try:
-        print(f"📥 Loading {model_name}...")
+        # Tuned per machine and per variant file by hardware_tuner; defaults when no profile exists
+        from llama_cpp import Llama
+        profile = get_runtime_profile(model_path)
+        n_threads = profile["n_threads"]
+        if CORE_ALLOCATION_SETTINGS["enabled"]:
+            # A disjoint CPU set for this model; the other resident models are rebalanced
+            n_threads = min(n_threads, len(core_allocator.register(model_name, weight=n_threads)) or n_threads)
+        print(f"📥 Loading {model_name} (n_ctx={profile['n_ctx']}, n_threads={n_threads}, n_batch={profile['n_batch']})...")
         model = Llama(
             model_path=model_path,
-            n_ctx=4096,  # Context window
-            n_threads=4,  # CPU threads
+            n_ctx=profile["n_ctx"],  # Context window
+            n_threads=n_threads,  # CPU threads
+            n_batch=profile["n_batch"],  # Prompt processing batch size
             verbose=False
         )
         model_cache[model_name] = model
+        model_files[model_name] = model_path
+        if variant:
+            record_serving_variant(variant)
         print(f"✅ {model_name} loaded successfully")
         return model
     except Exception as e:
         print(f"❌ Failed to load {model_name}: {str(e)}")
+        core_allocator.release(model_name)
+        return None
+
+def unload_model(model_name: str) -> bool:
+    """Drop a cached model and give its CPUs back to the other resident models."""
+    if model_cache.pop(model_name, None) is None:
+        return False
+    model_files.pop(model_name, None)
+    core_allocator.release(model_name)
+    print(f"📤 {model_name} unloaded")
+    return True
+
+def _pin_model_threads(model_name: str, model):
+    """Pin the decode thread to the model's CPU set; llama.cpp threads never exceed it or the tuned count."""
+    cpus = core_allocator.pin_current_thread(model_name)
+    if not cpus:
+        return
+    n_threads = min(len(cpus), get_runtime_profile(model_file(model_name))["n_threads"])
+    if getattr(model, "n_threads", n_threads) == n_threads:
+        return
+    try:
+        import llama_cpp
+        llama_cpp.llama_set_n_threads(model.ctx, n_threads, n_threads)
+        model.n_threads = n_threads
+    except Exception:
+        pass  # Older llama-cpp-python: threads stay pinned, count unchanged
+
+def _fallback(model_name: str, prompt: str, reason: str = "") -> dict:
+    text = f"[FALLBACK {model_name}]: {reason}{_generate_fallback_response(prompt, model_name)}"
+    return {"text": text, "confidence": None, "fallback": True, "tokens": None, "finish_reason": None}
+
+def _confidence(response: dict):
+    """Geometric-mean token probability of a completion, when logprobs were requested."""
+    logprobs = (response['choices'][0].get('logprobs') or {}).get('token_logprobs') or []
+    logprobs = [lp for lp in logprobs if lp is not None]
+    if not logprobs:
         return None
+    return math.exp(sum(logprobs) / len(logprobs))
 
-# Async wrapper for model inference
-async def run_model_inference(model_name: str, prompt: str, max_tokens: int = 512) -> str:
-    """Run inference on a GGUF model asynchronously."""
+# Async wrappers for model inference
+async def run_model_completion(model_name: str, prompt: str, max_tokens: int = DEFAULT_MAX_TOKENS,
+                               output_shape: str = None, stop: list = None, logprobs: bool = False) -> dict:
+    """
+    Run inference on a GGUF model asynchronously.
+    Returns the text, a confidence score (with logprobs), whether a fallback
+    answered, and the model's completion token count and finish reason.
+    With an output_shape, decoding is constrained to that shape's grammar and
+    stops when the structure is complete.
+    """
     if not LLAMA_CPP_AVAILABLE:
-        return f"[FALLBACK {model_name}]: {_generate_fallback_response(prompt, model_name)}"
+        return _fallback(model_name, prompt)
     
-    model = load_model(model_name)
-    if not model:
-        return f"[FALLBACK {model_name}]: {_generate_fallback_response(prompt, model_name)}"
+    if stop is None:
+        stop = DEFAULT_STOP
+    if output_shape:
+        # A blank line ends free text, but is legitimate inside a constrained code block or report
+        stop = [s for s in stop if s != "\n\n"]
     
-    try:
-        # Run inference in a thread pool to avoid blocking
-        loop = asyncio.get_event_loop()
-        response = await loop.run_in_executor(
-            None, 
-            lambda: model(prompt, max_tokens=max_tokens, stop=["</s>", "\n\n"])
+    abandoned = threading.Event()  # Set when the caller is cancelled mid-generation
+    
+    def load_and_generate():
+        if abandoned.is_set():
+            return None
+        # Loading happens on the model's own thread too, so concurrent first requests load it once
+        model = load_model(model_name)
+        if not model:
+            return None
+        _pin_model_threads(model_name, model)
+        from llama_cpp import StoppingCriteriaList
+        options = {"logprobs": 1} if logprobs else {}
+        # Checked after every token, so an abandoned request frees the model within one token
+        options["stopping_criteria"] = StoppingCriteriaList([lambda input_ids, logits: abandoned.is_set()])
+        grammar = compile_grammar(output_shape)
+        if grammar is not None:
+            options["grammar"] = grammar
+        start = time.monotonic()
+        response = model(prompt, max_tokens=max_tokens, stop=stop, **options)
+        tokens = response.get("usage", {}).get("completion_tokens", 0)
+        core_allocator.record_throughput(model_name, tokens, time.monotonic() - start)
+        return response
+    
+    def generate_in_worker_process():
+        # Crashes and OOMs stay inside the supervised worker process; the grammar is compiled there.
+        # An abandoned request kills the worker rather than letting it decode to the end.
+        if abandoned.is_set():
+            return None
+        options = {"logprobs": 1} if logprobs else {}
+        return get_process_supervisor(model_name).generate(
+            prompt, abandoned=abandoned, max_tokens=max_tokens, stop=stop, output_shape=output_shape, **options
         )
-        return response['choices'][0]['text'].strip()
+    
+    try:
+        # Decode on the model's dedicated executor; calls for one model are serialized
+        generate = generate_in_worker_process if LOCAL_INFERENCE_SETTINGS["mode"] == "process" else load_and_generate
+        # Queueing and decoding both count against the request deadline
+        response = await asyncio.wait_for(get_model_executor(model_name).submit(generate), time_remaining())
+        if response is None:
+            return _fallback(model_name, prompt)
+        choice = response['choices'][0]
+        return {"text": choice['text'].strip(), "confidence": _confidence(response), "fallback": False,
+                "tokens": response.get("usage", {}).get("completion_tokens"),
+                "finish_reason": choice.get("finish_reason")}
+    except asyncio.CancelledError:
+        abandoned.set()
+        raise
+    except asyncio.TimeoutError:
+        abandoned.set()
+        return _fallback(model_name, prompt, "Deadline exceeded - ")
+    except ModelProcessError:
+        return _fallback(model_name, prompt, "Model worker unavailable - ")
+    except ModelBusyError:
+        return _fallback(model_name, prompt, "Model busy - ")
     except Exception as e:
-        return f"[FALLBACK {model_name}]: Error during inference - {_generate_fallback_response(prompt, model_name)}"
+        return _fallback(model_name, prompt, "Error during inference - ")
+
+async def run_model_inference(model_name: str, prompt: str, max_tokens: int = DEFAULT_MAX_TOKENS,
+                              output_shape: str = None, stop: list = None) -> str:
+    """Run inference on a GGUF model asynchronously and return the text."""
+    result = await run_model_completion(model_name, prompt, max_tokens, output_shape, stop)
+    return result["text"]
 
 def _generate_fallback_response(prompt: str, model_name: str) -> str:
     """Generate a fallback response when models are not available."""
@@ -113,10 +249,18 @@ def _generate_fallback_response(prompt: str, model_name: str) -> str:
 # Main router
 async def handle_task(task_type: str, payload: dict) -> str:
     """Route task to appropriate model for processing."""
+    result = await run_task(task_type, payload)
+    return result["text"]
+
+async def run_task(task_type: str, payload: dict, model_name: str = None, logprobs: bool = False) -> dict:
+    """
+    Build the task prompt and run it on a local model.
+    model_name overrides the TASK_MAP model (the cascade uses a small local model).
+    """
     if task_type not in TASK_MAP:
-        return f"[ERROR]: Unknown task_type '{task_type}'"
+        return {"text": f"[ERROR]: Unknown task_type '{task_type}'", "confidence": None, "fallback": True, "model": None}
 
-    model_name, func_name = TASK_MAP[task_type]
+    model_name = model_name or TASK_MAP[task_type][0]
     
     # Build prompt based on task type and function signature
     function_sig = payload.get('function_sig', '')
@@ -124,59 +268,70 @@ async def handle_task(task_type: str, payload: dict) -> str:
     code_str = payload.get('code_str', '')
     error_msg = payload.get('error_msg', '')
     
-    # Create task-specific prompts
-    if task_type == "debug":
-        prompt = f"""You are a debugging assistant. {function_sig}
-
-Code to debug:
-{code_str}
-
-Error message:
-{error_msg}
-
-Context:
-{context}
+    # Diff mode: the model writes a patch for fixer_helper instead of the whole file
+    diff_mode = task_type == "fix" and payload.get("output_mode") == "diff"
+    limits_key = "fix_diff" if diff_mode else task_type
+    
+    # Create task-specific prompts, packed into the model's context window
+    code_section = PromptSection("Code", code_str, priority=0, is_code=True)
+    error_section = PromptSection("Error message", error_msg, priority=1, min_tokens=64)
+    context_section = PromptSection("Context", context, priority=3, strip_boilerplate=True)
 
-Please provide a clear analysis and fix:"""
+    if task_type == "debug":
+        code_section.label = "Code to debug"
+        preamble = f"You are a debugging assistant. {function_sig}"
+        sections = [code_section, error_section, context_section]
+        instruction = "Please provide a clear analysis and fix:"
     
     elif task_type == "analyze":
-        prompt = f"""You are a code analysis expert. {function_sig}
-
-Code to analyze:
-{code_str}
-
-Context:
-{context}
-
-Please provide detailed analysis and insights:"""
+        code_section.label = "Code to analyze"
+        preamble = f"You are a code analysis expert. {function_sig}"
+        sections = [code_section, context_section]
+        instruction = "Please provide detailed analysis and insights:"
     
     elif task_type == "fix":
-        prompt = f"""You are a code fixing specialist. {function_sig}
-
-Code to fix:
-{code_str}
-
-Context:
-{context}
-
-Error to fix:
-{error_msg}
-
-Please provide the corrected code:"""
+        code_section.label = "Code to fix"
+        error_section.label = "Error to fix"
+        preamble = f"You are a code fixing specialist. {function_sig}"
+        sections = [code_section, context_section, error_section]
+        instruction = "Please provide the corrected code:"
+        if diff_mode:
+            instruction = "Please provide only the changes, quoting a few unchanged lines around each:"
     
     elif task_type == "clean":
-        prompt = f"""You are a code cleanup expert. {function_sig}
-
-Code to clean:
-{code_str}
-
-Please remove dead code and optimize:"""
+        code_section.label = "Code to clean"
+        preamble = f"You are a code cleanup expert. {function_sig}"
+        sections = [code_section]
+        instruction = "Please remove dead code and optimize:"
         
     else:
-        prompt = f"{function_sig}\n\nTask: {task_type}\nCode: {code_str}\nContext: {context}"
+        code_section.label = "Code"
+        preamble = f"{function_sig}\n\nTask: {task_type}"
+        sections = [code_section, context_section]
+        instruction = ""
+    
+    output_shape = get_output_shape("fix_helper" if diff_mode else task_type)
+    instruction = constrain_instruction(instruction, output_shape)
+    if diff_mode and not output_shape:
+        instruction += "\nUse a unified diff, or <<<<<<< SEARCH / ======= / >>>>>>> REPLACE blocks."
+    
+    # Sized from what this task has actually needed on this model; diffs learn their own lengths
+    default_tokens = PATCH_SETTINGS["diff_max_tokens"] if diff_mode else DEFAULT_MAX_TOKENS
+    max_tokens = generation_limits.max_tokens_for(limits_key, model_name, default_tokens)
+    # Blank lines are part of a diff, so only the end-of-sequence stop applies
+    stop = generation_limits.stop_sequences_for(limits_key, ["</s>"] if diff_mode else DEFAULT_STOP)
+    
+    context_window = get_runtime_profile(model_file(model_name))["n_ctx"]
+    prompt, _ = pack_prompt(preamble, sections, instruction, context_window - max_tokens)
     
     # Run inference on the selected model
-    result = await run_model_inference(model_name, prompt)
-    return result
+    result = await run_model_completion(model_name, prompt, max_tokens, output_shape, stop, logprobs)
+    if not result["fallback"]:
+        # The model's own count and stop reason: "length" means it ran out of max_tokens
+        generation_limits.record(limits_key, model_name, result["text"], max_tokens, None if output_shape else stop,
+                                 tokens=result["tokens"],
+                                 truncated=result["finish_reason"] == "length" if result["finish_reason"] else None)
+        validate_output(output_shape, result["text"])
+    return {**result, "model": model_name}
 
 
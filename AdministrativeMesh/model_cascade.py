@@ -0,0 +1,114 @@
+"""
+Local-First Model Cascade
+=========================
+
+A small local GGUF model answers first. The request escalates to the task's
+model on the distributed mesh only when cheap checks say the local answer is
+not good enough:
+- the input is too long for the small model,
+- the local model is unavailable,
+- the output is empty or does not parse,
+- the token log-probabilities show low confidence.
+"""
+
+import ast
+import os
+import re
+import sys
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+# Add project root to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import CASCADE_SETTINGS
+from LLM_Mesh.output_grammar import VALIDATORS, get_output_shape
+from LLM_Mesh.prompt_packer import estimate_tokens
+
+# Tasks whose answer is code, which must at least parse
+CODE_TASKS = {"fix", "clean", "refactor", "optimize"}
+
+CASCADE_STATS: Dict[str, Any] = {"local": 0, "escalated": 0, "reasons": {}}
+
+@dataclass
+class CascadeResult:
+    """Which tier answered a request, and why it escalated if it did."""
+    text: str
+    tier: str  # "local" or "mesh"
+    model: Optional[str] = None
+    confidence: Optional[float] = None
+    reason: Optional[str] = None
+
+def extract_code(text: str) -> Optional[str]:
+    """Code from the first fenced block, or the whole text when it is unfenced."""
+    match = re.search(r"```(?:python)?\n(.*?)```", text, re.DOTALL)
+    if match:
+        return match.group(1)
+    return None if "```" in text else text
+
+def escalation_reason_before(task_type: str, payload: Dict[str, Any],
+                             settings: Dict[str, Any]) -> Optional[str]:
+    """Checks that can send a request straight to the mesh."""
+    if task_type in settings["remote_only"]:
+        return "task type"
+    size = sum(estimate_tokens(payload.get(key, "")) for key in ("code_str", "error_msg", "context"))
+    if size > settings["max_local_input_tokens"]:
+        return "input too long"
+    return None
+
+def escalation_reason_after(task_type: str, local: Dict[str, Any], settings: Dict[str, Any]) -> Optional[str]:
+    """Cheap checks on the local answer."""
+    text = local["text"]
+    if local.get("fallback") or text.startswith("[ERROR]"):
+        return "local model unavailable"
+    if len(text.strip()) < settings["min_output_chars"]:
+        return "empty output"
+
+    shape = get_output_shape(task_type)
+    if shape and not VALIDATORS[shape](text):
+        return "wrong output shape"
+    if not shape and task_type in CODE_TASKS:
+        code = extract_code(text)
+        try:
+            if code is None:
+                return "output does not parse"
+            ast.parse(code)
+        except SyntaxError:
+            return "output does not parse"
+
+    confidence = local.get("confidence")
+    if confidence is not None and confidence < settings["min_confidence"]:
+        return "low confidence"
+    return None
+
+def _count(tier: str, reason: Optional[str] = None):
+    CASCADE_STATS[tier] += 1
+    if reason:
+        CASCADE_STATS["reasons"][reason] = CASCADE_STATS["reasons"].get(reason, 0) + 1
+
+async def run_cascade(task_type: str, payload: Dict[str, Any], mesh_manager,
+                      settings: Dict[str, Any] = None) -> CascadeResult:
+    """Answer locally when the cheap checks pass, otherwise escalate to the mesh."""
+    from .mesh_manager import run_task
+    settings = {**CASCADE_SETTINGS, **(settings or {})}
+
+    local = None
+    reason = escalation_reason_before(task_type, payload, settings)
+    if reason is None:
+        local = await run_task(task_type, payload, model_name=settings["local_model"], logprobs=True)
+        reason = escalation_reason_after(task_type, local, settings)
+        if reason is None:
+            _count("local")
+            return CascadeResult(local["text"], "local", local["model"], local["confidence"])
+
+    print(f"⬆️  Escalating {task_type} to the mesh: {reason}")
+    _count("escalated", reason)
+    text = await mesh_manager.handle_task(task_type, payload)
+
+    # A usable local answer beats a mesh error
+    if text.startswith("[ERROR]") and local and not local.get("fallback"):
+        return CascadeResult(local["text"], "local", local["model"], local["confidence"], reason)
+    return CascadeResult(text, "mesh", reason=reason)
+
+def get_cascade_stats() -> Dict[str, Any]:
+    return {**CASCADE_STATS, "reasons": dict(CASCADE_STATS["reasons"])}
@@ -0,0 +1,127 @@
+"""
+Per-Model Inference Executors
+=============================
+
+Each locally cached model gets its own executor and bounded request queue.
+A ``llama_cpp.Llama`` instance is not thread-safe, so decode calls for one
+model are serialized on that model's thread(s) while other models keep their
+own capacity instead of competing for the shared default thread pool.
+"""
+
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict
+
+# Add project root to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import MODEL_EXECUTOR_SETTINGS
+
+class ModelBusyError(Exception):
+    """Raised when a model's request queue is full."""
+    pass
+
+@dataclass
+class ExecutorMetrics:
+    """Queue and timing metrics for one model executor."""
+    submitted: int = 0
+    completed: int = 0
+    failed: int = 0
+    rejected: int = 0
+    queue_depth: int = 0
+    max_queue_depth: int = 0
+    total_wait_time: float = 0.0
+    max_wait_time: float = 0.0
+    total_run_time: float = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        started = self.completed + self.failed
+        return {
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "avg_wait_time": self.total_wait_time / started if started else 0.0,
+            "max_wait_time": self.max_wait_time,
+            "avg_run_time": self.total_run_time / started if started else 0.0
+        }
+
+class ModelExecutor:
+    """
+    Dedicated executor for one model.
+    ``max_concurrency`` calls run at once; up to ``max_queue`` more may wait.
+    """
+
+    def __init__(self, model_name: str, max_concurrency: int = 1, max_queue: int = 8):
+        self.model_name = model_name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.metrics = ExecutorMetrics()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix=f"model-{model_name}")
+        self._slots = None
+
+    async def submit(self, fn: Callable, *args, **kwargs) -> Any:
+        """Queue a blocking call on this model's executor and await its result."""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+
+        if self.metrics.queue_depth >= self.max_queue:
+            self.metrics.rejected += 1
+            raise ModelBusyError(f"Request queue for {self.model_name} is full ({self.max_queue} waiting)")
+
+        self.metrics.submitted += 1
+        self.metrics.queue_depth += 1
+        self.metrics.max_queue_depth = max(self.metrics.max_queue_depth, self.metrics.queue_depth)
+        enqueued_at = time.monotonic()
+        dequeued = False
+
+        try:
+            async with self._slots:
+                self.metrics.queue_depth -= 1
+                dequeued = True
+                wait_time = time.monotonic() - enqueued_at
+                self.metrics.total_wait_time += wait_time
+                self.metrics.max_wait_time = max(self.metrics.max_wait_time, wait_time)
+
+                started_at = time.monotonic()
+                loop = asyncio.get_event_loop()
+                try:
+                    result = await loop.run_in_executor(self._executor, lambda: fn(*args, **kwargs))
+                except Exception:
+                    self.metrics.failed += 1
+                    raise
+                finally:
+                    self.metrics.total_run_time += time.monotonic() - started_at
+                self.metrics.completed += 1
+                return result
+        finally:
+            if not dequeued:
+                # Cancelled while still waiting for a slot
+                self.metrics.queue_depth -= 1
+
+    def shutdown(self, wait: bool = False):
+        self._executor.shutdown(wait=wait)
+
+# One executor per model name
+model_executors: Dict[str, ModelExecutor] = {}
+
+def get_model_executor(model_name: str) -> ModelExecutor:
+    """Get or create the executor for a model using its configured limits."""
+    if model_name not in model_executors:
+        settings = {**MODEL_EXECUTOR_SETTINGS["default"], **MODEL_EXECUTOR_SETTINGS["overrides"].get(model_name, {})}
+        model_executors[model_name] = ModelExecutor(
+            model_name,
+            max_concurrency=settings["max_concurrency"],
+            max_queue=settings["max_queue"]
+        )
+    return model_executors[model_name]
+
+def get_executor_metrics() -> Dict[str, Dict[str, Any]]:
+    """Queue depth and wait-time metrics for every model executor."""
+    return {name: executor.metrics.to_dict() for name, executor in model_executors.items()}
@@ -0,0 +1,266 @@
+"""
+Process Isolation for Local Model Inference
+===========================================
+
+Optional mode that hosts each local GGUF model in a supervised worker process
+instead of inside the API process. Requests and responses travel over a pipe,
+so a llama.cpp crash or OOM only kills the worker: the supervisor promotes a
+warm standby (if configured), restarts a replacement in the background and the
+API process stays responsive. A worker cannot be interrupted mid-generation,
+so when its caller abandons a request the worker is killed and replaced.
+"""
+
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+# Add project root to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import LOCAL_INFERENCE_SETTINGS
+
+class ModelProcessError(Exception):
+    """Raised when a model worker process fails or cannot be started."""
+    pass
+
+class RequestAbandoned(ModelProcessError):
+    """Raised when the caller gave up on a request; the worker was killed to stop it."""
+    pass
+
+def load_local_model(model_name: str):
+    """Default loader run inside the worker process."""
+    from AdministrativeMesh.mesh_manager import load_model
+    return load_model(model_name)
+
+def _apply_memory_limit(memory_limit_mb: Optional[int]):
+    """Cap the worker's address space so a runaway model fails alone."""
+    if not memory_limit_mb:
+        return
+    try:
+        import resource
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ImportError, ValueError, OSError) as e:
+        print(f"⚠️  Could not apply memory limit in model worker: {str(e)}")
+
+def _worker_main(model_name: str, conn, loader: Callable, memory_limit_mb: Optional[int]):
+    """Entry point of a model worker process: load once, then serve requests until closed."""
+    _apply_memory_limit(memory_limit_mb)
+    try:
+        model = loader(model_name)
+    except Exception as e:
+        model = None
+        reason = str(e)
+    else:
+        reason = "model could not be loaded"
+
+    if model is None:
+        conn.send(("failed", None, reason))
+        conn.close()
+        return
+    conn.send(("ready", None, os.getpid()))
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+        if message is None:
+            break
+        request_id, prompt, kwargs = message
+        # Compiled grammars cannot cross the pipe, so they are built in the worker
+        output_shape = kwargs.pop("output_shape", None)
+        if output_shape:
+            from LLM_Mesh.output_grammar import compile_grammar
+            grammar = compile_grammar(output_shape)
+            if grammar is not None:
+                kwargs["grammar"] = grammar
+        try:
+            conn.send(("ok", request_id, model(prompt, **kwargs)))
+        except Exception as e:
+            conn.send(("error", request_id, str(e)))
+    conn.close()
+
+class ModelWorkerProcess:
+    """One worker process hosting a single model."""
+
+    def __init__(self, model_name: str, loader: Callable, memory_limit_mb: Optional[int], start_method: str):
+        context = multiprocessing.get_context(start_method)
+        self.model_name = model_name
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main,
+            args=(model_name, child_conn, loader, memory_limit_mb),
+            name=f"model-worker-{model_name}",
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.ready = False
+        self.failed = False
+
+    def wait_ready(self, timeout: float) -> bool:
+        """Block until the model has loaded in the worker."""
+        if self.ready:
+            return True
+        if not self.conn.poll(timeout):
+            return False
+        try:
+            status, _, detail = self.conn.recv()
+        except (EOFError, OSError):
+            return False
+        if status != "ready":
+            print(f"❌ Model worker for {self.model_name} failed to start: {detail}")
+            return False
+        self.ready = True
+        return True
+
+    def is_alive(self) -> bool:
+        return not self.failed and self.process.is_alive()
+
+    def kill(self):
+        """Mark the worker failed and reap it."""
+        self.failed = True
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join(timeout=2)
+
+    def request(self, prompt: str, kwargs: Dict[str, Any], timeout: float,
+                abandoned: Optional[threading.Event] = None, poll_interval: float = 0.1) -> Any:
+        request_id = uuid.uuid4().hex
+        self.conn.send((request_id, prompt, kwargs))
+        deadline = time.monotonic() + timeout
+        while not self.conn.poll(max(0.0, min(poll_interval, deadline - time.monotonic()))):
+            if abandoned is not None and abandoned.is_set():
+                raise RequestAbandoned(f"Request to {self.model_name} abandoned by its caller")
+            if time.monotonic() >= deadline:
+                raise ModelProcessError(f"Model worker for {self.model_name} timed out after {timeout}s")
+        status, response_id, result = self.conn.recv()
+        if status == "error":
+            raise RuntimeError(result)
+        return result
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout=2)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join(timeout=2)
+        self.conn.close()
+
+class ModelProcessSupervisor:
+    """
+    Supervises the active worker (and an optional warm standby) for one model.
+    ``generate`` is blocking and is meant to run on the model's executor thread.
+    """
+
+    def __init__(self, model_name: str, loader: Callable = load_local_model,
+                 settings: Optional[Dict[str, Any]] = None):
+        self.model_name = model_name
+        self.loader = loader
+        self.settings = {**LOCAL_INFERENCE_SETTINGS, **(settings or {})}
+        self.memory_limit_mb = self.settings["memory_limit_mb"].get(model_name, self.settings["memory_limit_mb"].get("default"))
+        self.active: Optional[ModelWorkerProcess] = None
+        self.standby: Optional[ModelWorkerProcess] = None
+        self.restarts = deque()
+        self.lock = threading.Lock()
+
+    def _spawn(self) -> ModelWorkerProcess:
+        return ModelWorkerProcess(self.model_name, self.loader, self.memory_limit_mb, self.settings["start_method"])
+
+    def _ensure_standby(self):
+        if self.settings["warm_standby"] and (self.standby is None or not self.standby.is_alive()):
+            self.standby = self._spawn()
+
+    def _ensure_active(self):
+        if self.active is not None and self.active.is_alive():
+            return
+
+        # Give up if the model keeps crashing instead of restarting forever
+        now = time.monotonic()
+        while self.restarts and now - self.restarts[0] > self.settings["restart_window"]:
+            self.restarts.popleft()
+        if self.active is not None:
+            if len(self.restarts) >= self.settings["max_restarts"]:
+                raise ModelProcessError(f"{self.model_name} restarted {len(self.restarts)} times recently, giving up")
+            self.restarts.append(now)
+            print(f"🔄 Restarting model worker for {self.model_name}")
+            self.active.stop()
+
+        if self.standby is not None and self.standby.is_alive():
+            self.active, self.standby = self.standby, None
+        else:
+            self.active = self._spawn()
+
+        if not self.active.wait_ready(self.settings["load_timeout"]):
+            self.active.stop()
+            self.active = None
+            raise ModelProcessError(f"Model worker for {self.model_name} did not become ready")
+        self._ensure_standby()
+
+    def generate(self, prompt: str, abandoned: Optional[threading.Event] = None, **kwargs) -> Any:
+        """
+        Run one completion in the worker process, restarting it if it has died.
+        Setting ``abandoned`` kills the worker instead of letting it finish.
+        """
+        with self.lock:
+            self._ensure_active()
+            try:
+                return self.active.request(prompt, kwargs, self.settings["request_timeout"],
+                                           abandoned, self.settings["abort_poll_interval"])
+            except RequestAbandoned:
+                # Not a crash: replace the worker without counting a restart
+                print(f"🛑 Stopping model worker for {self.model_name}: request abandoned")
+                self.active.kill()
+                self.active.conn.close()
+                self.active = None
+                raise
+            except (EOFError, OSError, ModelProcessError) as e:
+                # Crash, OOM kill or hang: discard the worker; the next call restarts it
+                print(f"❌ Model worker for {self.model_name} failed: {str(e) or type(e).__name__}")
+                self.active.kill()
+                raise ModelProcessError(f"Model worker for {self.model_name} failed") from e
+
+    def start(self):
+        """Start the worker ahead of the first request."""
+        with self.lock:
+            self._ensure_active()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "active_pid": self.active.process.pid if self.active and self.active.is_alive() else None,
+            "standby_pid": self.standby.process.pid if self.standby and self.standby.is_alive() else None,
+            "recent_restarts": len(self.restarts),
+            "memory_limit_mb": self.memory_limit_mb
+        }
+
+    def shutdown(self):
+        with self.lock:
+            for worker in (self.active, self.standby):
+                if worker is not None:
+                    worker.stop()
+            self.active = self.standby = None
+
+# One supervisor per model name
+process_supervisors: Dict[str, ModelProcessSupervisor] = {}
+
+def get_process_supervisor(model_name: str) -> ModelProcessSupervisor:
+    if model_name not in process_supervisors:
+        process_supervisors[model_name] = ModelProcessSupervisor(model_name)
+    return process_supervisors[model_name]
+
+def get_process_status() -> Dict[str, Dict[str, Any]]:
+    return {name: supervisor.status() for name, supervisor in process_supervisors.items()}
+
+def shutdown_process_pool():
+    for supervisor in process_supervisors.values():
+        supervisor.shutdown()
+    process_supervisors.clear()
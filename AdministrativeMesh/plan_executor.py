@@ -0,0 +1,215 @@
+"""
+Plan Executor
+=============
+
+Runs multi-step plans from ``planner_agent.build_plan`` as a DAG. Steps whose
+dependencies are satisfied run concurrently across the mesh, results are
+streamed as each step finishes, and step outputs are memoized by input hash so
+re-running a plan after a small edit only recomputes the affected steps.
+
+A step may list the payload fields it reads in ``inputs``; it then sees and is
+keyed on only those (plus its upstream outputs). ``code_from`` names an
+upstream step whose output becomes the step's code.
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from config import PLAN_SETTINGS
+from LLM_Mesh.candidate_search import extract_code
+
+StepRunner = Callable[[str, Dict[str, Any]], Awaitable[str]]
+
+@dataclass
+class StepResult:
+    """Outcome of a single plan step."""
+    step: int
+    task: str
+    status: str  # "complete", "cached", "failed" or "skipped"
+    output: str
+    duration: float = 0.0
+    input_hash: str = ""
+
+def validate_plan(plan: List[Dict[str, Any]]) -> List[List[int]]:
+    """
+    Check step ids and dependencies and return the plan as topological levels.
+    Raises ValueError for unknown dependencies or cycles.
+    """
+    steps = {step["step"]: step for step in plan}
+    if len(steps) != len(plan):
+        raise ValueError("Plan contains duplicate step ids")
+
+    indegree = {step_id: 0 for step_id in steps}
+    for step_id, step in steps.items():
+        for dependency in step.get("depends_on", []):
+            if dependency not in steps:
+                raise ValueError(f"Step {step_id} depends on unknown step {dependency}")
+            indegree[step_id] += 1
+
+    levels = []
+    ready = sorted(step_id for step_id, degree in indegree.items() if degree == 0)
+    visited = 0
+    while ready:
+        levels.append(ready)
+        visited += len(ready)
+        next_ready = []
+        for step_id in ready:
+            for other_id, other in steps.items():
+                if step_id in other.get("depends_on", []):
+                    indegree[other_id] -= 1
+                    if indegree[other_id] == 0:
+                        next_ready.append(other_id)
+        ready = sorted(next_ready)
+
+    if visited != len(steps):
+        raise ValueError("Plan contains a dependency cycle")
+    return levels
+
+async def _run_on_mesh(task_type: str, payload: Dict[str, Any]) -> str:
+    """Default step runner: route the step through the shared mesh manager."""
+    from .admin_dispatcher import get_mesh_manager
+    mesh_manager = await get_mesh_manager()
+    return await mesh_manager.handle_task(task_type, payload)
+
+class PlanExecutor:
+    """Executes plan DAGs with bounded concurrency and input-hash memoization."""
+
+    def __init__(self, run_step: StepRunner = None, max_concurrency: int = None, cache_size: int = None):
+        self.run_step = run_step or _run_on_mesh
+        self.max_concurrency = max_concurrency or PLAN_SETTINGS["max_concurrency"]
+        self.cache_size = cache_size or PLAN_SETTINGS["cache_size"]
+        self.cache: "OrderedDict[str, str]" = OrderedDict()
+
+    @staticmethod
+    def step_inputs(step: Dict[str, Any], payload: Dict[str, Any]) -> Dict[str, Any]:
+        """The payload fields a step reads: its declared ``inputs``, or all of them."""
+        if "inputs" not in step:
+            return dict(payload)
+        return {key: payload.get(key, "") for key in step["inputs"]}
+
+    @staticmethod
+    def step_input_hash(step: Dict[str, Any], payload: Dict[str, Any], upstream: Dict[int, str]) -> str:
+        """Hash everything a step's output depends on; ``payload`` is the step's own inputs."""
+        material = json.dumps(
+            {"task": step["task"], "payload": payload, "upstream": upstream},
+            sort_keys=True,
+            default=str
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def step_payload(payload: Dict[str, Any], upstream: Dict[int, str],
+                     tasks: Dict[int, str] = None, code_from: int = None) -> Dict[str, Any]:
+        """Hand upstream step outputs, keyed by step id, to a step as extra context."""
+        if not upstream:
+            return dict(payload)
+        if code_from in upstream:
+            output = upstream[code_from]
+            payload = {**payload, "code_str": extract_code(output) or output}
+        tasks = tasks or {}
+        upstream_text = "\n\n".join(
+            f"[step {step_id} {tasks[step_id]} result]\n{output}" if step_id in tasks
+            else f"[step {step_id} result]\n{output}"
+            for step_id, output in upstream.items()
+        )
+        context = payload.get("context", "")
+        return {
+            **payload,
+            "context": f"{context}\n\n{upstream_text}".strip(),
+            "upstream": dict(upstream)
+        }
+
+    def _remember(self, key: str, output: str):
+        self.cache[key] = output
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    async def execute(self, plan: List[Dict[str, Any]], payload: Dict[str, Any]) -> AsyncIterator[StepResult]:
+        """Run the plan, yielding each step's result as soon as it is available."""
+        validate_plan(plan)
+        steps = {step["step"]: step for step in plan}
+        results: Dict[int, StepResult] = {}
+        running: Dict[asyncio.Task, int] = {}
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run_one(step: Dict[str, Any], step_payload: Dict[str, Any], key: str) -> StepResult:
+            async with semaphore:
+                start = time.monotonic()
+                output = await self.run_step(step["task"], step_payload)
+                duration = time.monotonic() - start
+            status = "failed" if str(output).startswith("[ERROR]") else "complete"
+            if status == "complete":
+                self._remember(key, output)
+            return StepResult(step["step"], step["task"], status, output, duration, key)
+
+        def ready_steps() -> List[int]:
+            scheduled = set(results) | set(running.values())
+            return [
+                step_id for step_id, step in steps.items()
+                if step_id not in scheduled
+                and all(dep in results for dep in step.get("depends_on", []))
+            ]
+
+        try:
+            while len(results) < len(steps):
+                for step_id in ready_steps():
+                    step = steps[step_id]
+                    dependencies = [results[dep] for dep in step.get("depends_on", [])]
+
+                    if any(dep.status in ("failed", "skipped") for dep in dependencies):
+                        results[step_id] = StepResult(step_id, step["task"], "skipped",
+                                                      "Skipped: an upstream step failed")
+                        yield results[step_id]
+                        continue
+
+                    # By step id: two upstream steps may run the same task
+                    upstream = {dep.step: dep.output for dep in dependencies}
+                    inputs = self.step_inputs(step, payload)
+                    key = self.step_input_hash(step, inputs, upstream)
+                    if key in self.cache:
+                        self.cache.move_to_end(key)
+                        results[step_id] = StepResult(step_id, step["task"], "cached", self.cache[key], 0.0, key)
+                        yield results[step_id]
+                        continue
+
+                    tasks = {dep.step: dep.task for dep in dependencies}
+                    step_payload = self.step_payload(inputs, upstream, tasks, step.get("code_from"))
+                    task = asyncio.create_task(run_one(step, step_payload, key))
+                    running[task] = step_id
+
+                if not running:
+                    # Everything left was resolved from cache or skipped this round
+                    continue
+
+                done, _ = await asyncio.wait(running.keys(), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    step_id = running.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        result = StepResult(step_id, steps[step_id]["task"], "failed", f"[ERROR]: {str(e)}")
+                    results[step_id] = result
+                    yield result
+        finally:
+            # Stop in-flight steps if the consumer goes away early
+            for task in running:
+                task.cancel()
+
+    async def run(self, plan: List[Dict[str, Any]], payload: Dict[str, Any]) -> Dict[int, StepResult]:
+        """Run the plan to completion and return results keyed by step id."""
+        return {result.step: result async for result in self.execute(plan, payload)}
+
+# Shared executor so memoized step outputs survive across requests
+_plan_executor: Optional[PlanExecutor] = None
+
+def get_plan_executor() -> PlanExecutor:
+    global _plan_executor
+    if _plan_executor is None:
+        _plan_executor = PlanExecutor()
+    return _plan_executor
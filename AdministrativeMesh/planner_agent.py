@@ -1,6 +1,16 @@
 def build_plan(task):
-    return [
-        {"step": 1, "task": "analyze", "target": "analyzer_worker"},
-        {"step": 2, "task": "fix", "target": "fixer_worker"},
-        {"step": 3, "task": "clean", "target": "cleaner_worker"}
-    ]
+    """
+    Plan a request as a DAG. Analysis and, when there is an error, debugging
+    are independent and run in parallel; the fix uses both, and the cleanup
+    works on the fixed code. ``inputs`` are the payload fields a step reads,
+    so a step is only recomputed when those or its upstream outputs change.
+    """
+    plan = [{"step": 1, "task": "analyze", "target": "analyzer_worker", "depends_on": [], "inputs": ["code_str"]}]
+    if task.get("error"):
+        plan.append({"step": 2, "task": "debug", "target": "debugger_worker", "depends_on": [],
+                     "inputs": ["code_str", "error_msg"]})
+    plan.append({"step": 3, "task": "fix", "target": "fixer_worker", "depends_on": [step["step"] for step in plan],
+                 "inputs": ["code_str", "error_msg", "context"]})
+    plan.append({"step": 4, "task": "clean", "target": "cleaner_worker", "depends_on": [3],
+                 "inputs": [], "code_from": 3})
+    return plan
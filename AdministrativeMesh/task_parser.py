@@ -23,5 +23,6 @@ def parse_task(prompt: str) -> dict:
         "window_tier": 2,
         "code": "",
         "error": "",
+        "tests": "",
         "summary": ""
     }
@@ -0,0 +1,454 @@
+"""
+Local Vector Index
+==================
+
+Offline semantic retrieval for AgentMemory entries and repository chunks.
+Texts are embedded with a hashing embedder (word and character n-gram
+features), stored in a memory-mapped float32 matrix on disk, and searched in
+batches. Once the corpus is large, an IVF-style coarse partition limits each
+query to the closest lists.
+
+Row changes are appended to a log rather than rewriting all metadata on every
+update; the log is folded into ``meta.json`` once it grows as large as the
+index. Removed rows are tombstoned and compacted away when they make up
+``compact_ratio`` of the matrix. One lock serialises updates and searches.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+import zlib
+import hashlib
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# Add project root to path for imports
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from config import VECTOR_INDEX_SETTINGS
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+@dataclass
+class SearchHit:
+    """A single search result."""
+    id: str
+    score: float
+    text: str
+    source: str
+
+class HashingEmbedder:
+    """
+    Stateless embedder using the hashing trick over word and character n-grams.
+    Uses crc32 rather than ``hash()`` so vectors stay stable across processes.
+    """
+
+    def __init__(self, dim: int = 512, ngram_range: Tuple[int, int] = (3, 5)):
+        self.dim = dim
+        self.ngram_range = ngram_range
+
+    def _features(self, text: str) -> List[str]:
+        words = "".join(c if c.isalnum() or c == "_" else " " for c in text.lower()).split()
+        features = [f"w:{word}" for word in words]
+        low, high = self.ngram_range
+        for word in words:
+            padded = f"<{word}>"
+            for n in range(low, high + 1):
+                features.extend(padded[i:i + n] for i in range(max(len(padded) - n + 1, 0)))
+        return features
+
+    def embed(self, texts: Sequence[str]) -> "np.ndarray":
+        """Embed a batch of texts into L2-normalised float32 rows."""
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                h = zlib.crc32(feature.encode("utf-8"))
+                # Low bits pick the bucket, a high bit picks the sign
+                matrix[row, h % self.dim] += 1.0 if (h >> 31) & 1 else -1.0
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+class VectorIndex:
+    """
+    Persistent vector index backed by a memory-mapped float32 matrix.
+
+    Layout of the index directory:
+        vectors.f32   - row-major (capacity, dim) matrix
+        meta.json     - ids, texts, sources and content hashes per row
+        meta.log      - rows changed since meta.json was written, one JSON line each
+        ivf.npz       - coarse centroids and row assignments (large corpora only)
+    """
+
+    def __init__(self, directory: str, dim: int = None, embedder: HashingEmbedder = None):
+        if not NUMPY_AVAILABLE:
+            raise ImportError("numpy is required for the vector index. Install with: pip install numpy")
+
+        self.directory = directory
+        self.dim = dim or VECTOR_INDEX_SETTINGS["dim"]
+        self.embedder = embedder or HashingEmbedder(self.dim)
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self.meta_path = os.path.join(directory, "meta.json")
+        self.ivf_path = os.path.join(directory, "ivf.npz")
+        self.log_path = os.path.join(directory, "meta.log")
+
+        self.count = 0
+        self.capacity = 0
+        self.rows: List[Dict[str, Any]] = []  # id, text, source, hash, deleted
+        self.id_to_row: Dict[str, int] = {}
+        self.vectors = None
+        self.centroids = None
+        self.assignments = None
+        self.ivf_built_at = 0
+        self.logged_rows = 0
+        self.lock = threading.RLock()
+
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        """Open an existing index without re-embedding anything."""
+        if not os.path.exists(self.meta_path):
+            self._reset()
+            return
+
+        with open(self.meta_path, "r") as f:
+            meta = json.load(f)
+
+        if meta.get("dim") != self.dim:
+            print(f"⚠️  Vector index dimension changed ({meta.get('dim')} → {self.dim}), rebuilding")
+            self._reset()
+            return
+
+        self.count = meta["count"]
+        self.capacity = meta["capacity"]
+        self.rows = meta["rows"]
+        self.ivf_built_at = meta.get("ivf_built_at", 0)
+        self.id_to_row = {row["id"]: i for i, row in enumerate(self.rows) if not row.get("deleted")}
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(self.capacity, self.dim))
+
+        if os.path.exists(self.ivf_path):
+            ivf = np.load(self.ivf_path)
+            self.centroids = ivf["centroids"]
+            self.assignments = ivf["assignments"]
+        if os.path.exists(self.log_path):
+            self._replay_log()
+
+    def _reset(self):
+        """Start an empty index; a log left without its meta.json has nothing to apply to."""
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
+        self._allocate(VECTOR_INDEX_SETTINGS["initial_capacity"])
+
+    def _replay_log(self):
+        """Apply the row changes logged since meta.json was written."""
+        with open(self.log_path, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break  # A write cut short by a crash; nothing after it was committed
+                row = entry.pop("row")
+                partition = entry.pop("partition", None)
+                if row == len(self.rows):
+                    self.rows.append(entry)
+                else:
+                    self.rows[row] = entry
+                if partition is not None and self.assignments is not None:
+                    self._set_partition(row, partition)
+                self.logged_rows += 1
+        self.count = len(self.rows)
+        self.id_to_row = {row["id"]: i for i, row in enumerate(self.rows) if not row.get("deleted")}
+
+    def _allocate(self, capacity: int):
+        """Create (or grow) the memory-mapped matrix, preserving existing rows."""
+        new_vectors = np.memmap(self.vectors_path + ".tmp", dtype=np.float32, mode="w+", shape=(capacity, self.dim))
+        if self.vectors is not None and self.count:
+            new_vectors[:self.count] = self.vectors[:self.count]
+        new_vectors.flush()
+        del new_vectors
+        self.vectors = None
+        os.replace(self.vectors_path + ".tmp", self.vectors_path)
+        self.capacity = capacity
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+
+    def save(self):
+        """Flush vectors and write all metadata, folding in the row log."""
+        self.vectors.flush()
+        meta = {
+            "dim": self.dim,
+            "count": self.count,
+            "capacity": self.capacity,
+            "ivf_built_at": self.ivf_built_at,
+            "rows": self.rows
+        }
+        with open(self.meta_path + ".tmp", "w") as f:
+            json.dump(meta, f)
+        os.replace(self.meta_path + ".tmp", self.meta_path)
+        if self.centroids is not None:
+            np.savez(self.ivf_path, centroids=self.centroids, assignments=self.assignments)
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
+        self.logged_rows = 0
+
+    def _log_rows(self, rows: Sequence[int]):
+        """Flush vectors and append the changed rows to the log instead of rewriting meta.json."""
+        if not os.path.exists(self.meta_path) or self.logged_rows + len(rows) > max(self.count, 64):
+            self.save()
+            return
+        self.vectors.flush()
+        with open(self.log_path, "a") as f:
+            for row in rows:
+                entry = {"row": row, **self.rows[row]}
+                if self.assignments is not None:
+                    entry["partition"] = int(self.assignments[row])
+                f.write(json.dumps(entry) + "\n")
+        self.logged_rows += len(rows)
+
+    @staticmethod
+    def _content_hash(text: str) -> str:
+        return hashlib.sha1(text.encode("utf-8", errors="replace")).hexdigest()
+
+    def add(self, items: Sequence[Tuple[str, str, str]]) -> int:
+        """
+        Add or update (id, text, source) items. Unchanged items are skipped,
+        so re-syncing the same corpus costs no embedding work.
+        Returns the number of rows embedded.
+        """
+        with self.lock:
+            pending = []
+            for item_id, text, source in items:
+                content_hash = self._content_hash(text)
+                row = self.id_to_row.get(item_id)
+                if row is not None and self.rows[row]["hash"] == content_hash:
+                    continue
+                pending.append((item_id, text, source, content_hash, row))
+
+            if not pending:
+                return 0
+
+            embeddings = self.embedder.embed([text for _, text, _, _, _ in pending])
+            new_rows = sum(1 for p in pending if p[4] is None)
+            # A new capacity or partition has to be written out in full
+            rewrite = self.count + new_rows > self.capacity
+            if rewrite:
+                self._allocate(max(self.capacity * 2, self.count + new_rows))
+
+            changed = []
+            for (item_id, text, source, content_hash, row), vector in zip(pending, embeddings):
+                if row is None:
+                    row = self.count
+                    self.count += 1
+                    self.rows.append({})
+                self._assign_to_partition(row, vector)
+                self.vectors[row] = vector
+                self.rows[row] = {"id": item_id, "text": text, "source": source, "hash": content_hash}
+                self.id_to_row[item_id] = row
+                changed.append(row)
+
+            # Rebuild the coarse partition when the corpus outgrows it
+            if self.count >= VECTOR_INDEX_SETTINGS["ivf_threshold"] and self.count >= 2 * self.ivf_built_at:
+                self.build_ivf()
+                rewrite = True
+
+            if rewrite:
+                self.save()
+            else:
+                self._log_rows(changed)
+            return len(pending)
+
+    def remove(self, ids: Sequence[str]) -> int:
+        """Tombstone rows so they no longer appear in results; compact once tombstones pile up."""
+        with self.lock:
+            removed = []
+            for item_id in ids:
+                row = self.id_to_row.pop(item_id, None)
+                if row is not None:
+                    self.rows[row]["deleted"] = True
+                    removed.append(row)
+            if not removed:
+                return 0
+            if self.count - len(self.id_to_row) > self.count * VECTOR_INDEX_SETTINGS["compact_ratio"]:
+                self._compact()
+            else:
+                self._log_rows(removed)
+            return len(removed)
+
+    def _compact(self):
+        """Move live rows down over the tombstones and rewrite the metadata."""
+        live = [i for i, row in enumerate(self.rows) if not row.get("deleted")]
+        if live:
+            self.vectors[:len(live)] = np.asarray(self.vectors[live])
+        if self.assignments is not None:
+            kept = self.assignments[live]
+            self.assignments = np.full(self.capacity, -1, dtype=np.int32)
+            self.assignments[:len(live)] = kept
+        self.rows = [self.rows[i] for i in live]
+        self.count = len(live)
+        self.id_to_row = {row["id"]: i for i, row in enumerate(self.rows)}
+        self.save()
+
+    def _set_partition(self, row: int, partition: int):
+        if row >= len(self.assignments):
+            self.assignments = np.resize(self.assignments, max(self.capacity, row + 1))
+        self.assignments[row] = partition
+
+    def _assign_to_partition(self, row: int, vector: "np.ndarray"):
+        if self.centroids is None:
+            return
+        self._set_partition(row, int(np.argmax(self.centroids @ vector)))
+
+    def build_ivf(self, n_lists: int = None, iterations: int = 8):
+        """Cluster stored vectors into coarse lists with a few rounds of spherical k-means."""
+        with self.lock:
+            data = np.asarray(self.vectors[:self.count])
+            n_lists = n_lists or max(1, int(np.sqrt(self.count)))
+            n_lists = min(n_lists, self.count)
+            rng = np.random.default_rng(0)
+            centroids = data[rng.choice(self.count, n_lists, replace=False)].copy()
+
+            for _ in range(iterations):
+                assignments = np.argmax(data @ centroids.T, axis=1)
+                for c in range(n_lists):
+                    members = data[assignments == c]
+                    if len(members):
+                        centroid = members.sum(axis=0)
+                        norm = np.linalg.norm(centroid)
+                        centroids[c] = centroid / norm if norm else centroid
+
+            self.centroids = centroids.astype(np.float32)
+            self.assignments = np.full(self.capacity, -1, dtype=np.int32)
+            self.assignments[:self.count] = np.argmax(data @ self.centroids.T, axis=1)
+            self.ivf_built_at = self.count
+
+    def search(self, queries: Sequence[str], k: int = 5, nprobe: int = None) -> List[List[SearchHit]]:
+        """Batched top-k cosine search. Uses the coarse partition when one exists."""
+        if not queries or self.count == 0:
+            return [[] for _ in queries]
+
+        query_matrix = self.embedder.embed(list(queries))
+        with self.lock:
+            return self._search(query_matrix, k, nprobe)
+
+    def _search(self, query_matrix: "np.ndarray", k: int, nprobe: int) -> List[List[SearchHit]]:
+        live = np.array([not row.get("deleted") for row in self.rows[:self.count]], dtype=bool)
+        nprobe = nprobe or VECTOR_INDEX_SETTINGS["nprobe"]
+        results = []
+
+        if self.centroids is None:
+            # Exhaustive: one matrix product for the whole batch
+            scores = query_matrix @ np.asarray(self.vectors[:self.count]).T
+            scores[:, ~live] = -np.inf
+            for query_scores in scores:
+                results.append(self._top_k(np.arange(self.count), query_scores, k))
+            return results
+
+        probe_lists = np.argsort(-(query_matrix @ self.centroids.T), axis=1)[:, :nprobe]
+        assignments = self.assignments[:self.count]
+        for query_vector, lists in zip(query_matrix, probe_lists):
+            candidates = np.nonzero(np.isin(assignments, lists) & live)[0]
+            if len(candidates) == 0:
+                results.append([])
+                continue
+            query_scores = np.asarray(self.vectors[candidates]) @ query_vector
+            results.append(self._top_k(candidates, query_scores, k))
+        return results
+
+    def _top_k(self, rows: "np.ndarray", scores: "np.ndarray", k: int) -> List[SearchHit]:
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        hits = []
+        for i in top:
+            if not np.isfinite(scores[i]):
+                continue
+            row = self.rows[int(rows[i])]
+            hits.append(SearchHit(id=row["id"], score=float(scores[i]), text=row["text"], source=row["source"]))
+        return hits
+
+def collect_memory_items(memory_dir: str) -> List[Tuple[str, str, str]]:
+    """Split AgentMemory JSON files into one item per top-level entry."""
+    items = []
+    for dirpath, dirnames, filenames in os.walk(memory_dir):
+        dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+        for filename in sorted(filenames):
+            if not filename.endswith(".json"):
+                continue
+            path = os.path.join(dirpath, filename)
+            relative = os.path.relpath(path, memory_dir)
+            try:
+                with open(path, "r") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            entries = data.items() if isinstance(data, dict) else enumerate(data if isinstance(data, list) else [data])
+            for key, value in entries:
+                text = f"{key}: {json.dumps(value)}"
+                items.append((f"memory:{relative}:{key}", text, relative))
+    return items
+
+def collect_code_items(indexer) -> List[Tuple[str, str, str]]:
+    """Turn repository indexer chunks into index items."""
+    items = []
+    with indexer.lock:
+        for entry in indexer.files.values():
+            relative = os.path.relpath(entry.path, indexer.root)
+            for chunk in entry.chunks:
+                items.append((f"code:{relative}:{chunk.name}", chunk.source, relative))
+    return items
+
+# Global index instance, opened on first use
+_vector_index = None
+_last_sync = None  # Monotonic time of the last sync_vector_index
+_sync_lock = threading.Lock()
+
+def get_vector_index() -> Optional[VectorIndex]:
+    """Open the persisted index, or None when numpy is unavailable or it is disabled."""
+    global _vector_index
+    if not NUMPY_AVAILABLE or not VECTOR_INDEX_SETTINGS["enabled"]:
+        return None
+    if _vector_index is None:
+        _vector_index = VectorIndex(os.path.join(project_root, VECTOR_INDEX_SETTINGS["path"]))
+    return _vector_index
+
+def sync_vector_index(indexer=None, force: bool = False) -> int:
+    """
+    Bring AgentMemory (and optionally repository chunks) into the index, at
+    most once per ``sync_interval`` unless forced.
+    """
+    global _last_sync
+    index = get_vector_index()
+    if index is None:
+        return 0
+    with _sync_lock:
+        now = time.monotonic()
+        if not force and _last_sync is not None and now - _last_sync < VECTOR_INDEX_SETTINGS["sync_interval"]:
+            return 0
+        _last_sync = now
+    memory_dir = os.path.join(project_root, VECTOR_INDEX_SETTINGS["memory_dir"])
+    items = collect_memory_items(memory_dir)
+    # An unbuilt indexer (e.g. just after a restart) knows no chunks yet; its
+    # empty view must not tombstone the persisted code rows
+    code_known = indexer is not None and indexer.built
+    if code_known:
+        items.extend(collect_code_items(indexer))
+    with index.lock:
+        if code_known:
+            # Drop code chunks that no longer exist in the repository
+            current = {item_id for item_id, _, _ in items}
+            stale = [item_id for item_id in index.id_to_row if item_id.startswith("code:") and item_id not in current]
+            index.remove(stale)
+        return index.add(items)
+
+if __name__ == "__main__":
+    embedded = sync_vector_index(force=True)
+    print(f"✅ Vector index synced ({embedded} rows embedded)")
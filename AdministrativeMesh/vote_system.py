@@ -1,2 +1,88 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
 def council_vote(scores: dict):
     return max(scores.items(), key=lambda x: x[1])[0]
+
+@dataclass
+class CouncilMember:
+    """An administrative model taking part in a council vote."""
+    model: str
+    weight: float = 1.0
+    timeout: float = 30.0
+
+@dataclass
+class CouncilDecision:
+    """Result of a concurrent council vote."""
+    choice: Optional[str]
+    tallies: Dict[str, float] = field(default_factory=dict)
+    votes: Dict[str, str] = field(default_factory=dict)
+    abstained: List[str] = field(default_factory=list)
+    cancelled: List[str] = field(default_factory=list)
+    early: bool = False
+    elapsed: float = 0.0
+
+async def concurrent_council_vote(
+    members: List[CouncilMember],
+    ask: Callable[[CouncilMember], Awaitable[Optional[str]]],
+    quorum: float = 0.5,
+    decisive_margin: Optional[float] = None
+) -> CouncilDecision:
+    """
+    Query all members concurrently and stop as soon as the outcome is settled.
+
+    The vote ends early when one choice holds more than ``quorum`` of the total
+    weight, when it leads the runner-up by ``decisive_margin`` of the total
+    weight, or when the members still pending could no longer overturn it.
+    Members that time out, fail or return None abstain.
+    """
+    start = time.monotonic()
+    decision = CouncilDecision(choice=None)
+    total_weight = sum(member.weight for member in members)
+    if not members or total_weight <= 0:
+        return decision
+
+    async def ballot(member: CouncilMember) -> Optional[str]:
+        return await asyncio.wait_for(ask(member), timeout=member.timeout)
+
+    pending = {asyncio.create_task(ballot(member)): member for member in members}
+
+    def settled() -> bool:
+        ranked = sorted(decision.tallies.values(), reverse=True) + [0.0, 0.0]
+        leader, runner_up = ranked[0], ranked[1]
+        remaining = sum(member.weight for member in pending.values())
+        if leader > quorum * total_weight:
+            return True
+        if decisive_margin is not None and leader - runner_up >= decisive_margin * total_weight:
+            return True
+        return leader > 0 and leader - runner_up > remaining
+
+    try:
+        while pending:
+            done, _ = await asyncio.wait(pending.keys(), return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                member = pending.pop(task)
+                try:
+                    choice = task.result()
+                except Exception:
+                    choice = None
+                if choice is None:
+                    decision.abstained.append(member.model)
+                    continue
+                decision.votes[member.model] = choice
+                decision.tallies[choice] = decision.tallies.get(choice, 0.0) + member.weight
+
+            if pending and settled():
+                decision.early = True
+                break
+    finally:
+        for task, member in pending.items():
+            task.cancel()
+            decision.cancelled.append(member.model)
+
+    if decision.tallies:
+        decision.choice = council_vote(decision.tallies)
+    decision.elapsed = time.monotonic() - start
+    return decision
@@ -0,0 +1,86 @@
+"""
+Background Warmup
+=================
+
+Started when the API comes up. Initializes the mesh manager, probes the
+distributed model hosts and preloads configured local models concurrently,
+without blocking requests: a request that arrives first simply shares the
+single-flight initialization already in progress.
+"""
+
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+# Add project root to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import WARMUP_SETTINGS, LOCAL_INFERENCE_SETTINGS
+from startup_profiler import profile_phase
+
+WARMUP_STATUS: Dict[str, Any] = {"state": "idle", "started_at": None, "finished_at": None, "steps": {}}
+
+_warmup_task: Optional[asyncio.Task] = None
+
+async def _initialize_mesh():
+    from .admin_dispatcher import get_mesh_manager
+    await get_mesh_manager()
+
+async def _probe_hosts():
+    from LLM_Mesh.distributed_models import model_registry
+    await model_registry.health_check_all_hosts()
+
+async def _preload_model(model_name: str):
+    """Load a local model on its own executor, as the first request would."""
+    from .model_executor import get_model_executor
+    executor = get_model_executor(model_name)
+    if LOCAL_INFERENCE_SETTINGS["mode"] == "process":
+        from .model_process_pool import get_process_supervisor
+        await executor.submit(get_process_supervisor(model_name).start)
+    else:
+        from .mesh_manager import load_model
+        if await executor.submit(load_model, model_name) is None:
+            raise RuntimeError(f"{model_name} could not be loaded")
+
+async def _run_step(name: str, step):
+    start = time.monotonic()
+    try:
+        await step
+        WARMUP_STATUS["steps"][name] = {"status": "ok", "duration": round(time.monotonic() - start, 3)}
+    except Exception as e:
+        WARMUP_STATUS["steps"][name] = {"status": "failed", "error": str(e),
+                                        "duration": round(time.monotonic() - start, 3)}
+        print(f"⚠️  Warmup step {name} failed: {str(e)}")
+
+async def run_warmup(settings: Dict[str, Any] = None):
+    """Run all warmup steps concurrently; failures are recorded, never raised."""
+    settings = {**WARMUP_SETTINGS, **(settings or {})}
+    WARMUP_STATUS.update({"state": "running", "started_at": datetime.now().isoformat(), "steps": {}})
+
+    steps = {"mesh_manager": _initialize_mesh()}
+    if settings["probe_hosts"]:
+        steps["host_probe"] = _probe_hosts()
+    for model_name in settings["preload_models"]:
+        steps[f"preload:{model_name}"] = _preload_model(model_name)
+
+    with profile_phase("warmup"):
+        await asyncio.gather(*(_run_step(name, step) for name, step in steps.items()))
+
+    failed = any(step["status"] == "failed" for step in WARMUP_STATUS["steps"].values())
+    WARMUP_STATUS.update({"state": "degraded" if failed else "complete", "finished_at": datetime.now().isoformat()})
+    print(f"🔥 Warmup {WARMUP_STATUS['state']}: {', '.join(WARMUP_STATUS['steps'])}")
+
+def start_background_warmup(settings: Dict[str, Any] = None) -> Optional[asyncio.Task]:
+    """Schedule warmup on the running loop and return immediately."""
+    global _warmup_task
+    if not WARMUP_SETTINGS["enabled"]:
+        return None
+    if _warmup_task is None or _warmup_task.done():
+        _warmup_task = asyncio.create_task(run_warmup(settings))
+    return _warmup_task
+
+def get_warmup_status() -> Dict[str, Any]:
+    return {**WARMUP_STATUS, "steps": dict(WARMUP_STATUS["steps"])}
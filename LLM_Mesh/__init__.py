@@ -2,8 +2,16 @@
 LLM Mesh - Model management and task execution
 """
 
+import importlib
+
 __version__ = "1.0.0"
 
-from .mesh_manager import MeshManager
+def __getattr__(name):
+    # Resolved on first access so importing a submodule does not load the mesh manager
+    if name == "MeshManager":
+        value = importlib.import_module(".mesh_manager", __name__).MeshManager
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 __all__ = ["MeshManager"]
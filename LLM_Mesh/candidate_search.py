@@ -0,0 +1,199 @@
+"""
+Parallel Candidate Search
+=========================
+
+For fix tasks, N candidates are generated concurrently (different seeds,
+spread across hosts). Each one is verified in a resource-limited subprocess:
+first compiled, then run against the tests passed to ``dispatch``, if any.
+The first candidate that passes is returned and the remaining generations and
+verifications are cancelled.
+
+The subprocess only has CPU, memory and time limits; it is not isolated from
+the host's filesystem or network. Tests must therefore come from the server
+(the repository), never from API or editor clients.
+
+Verification results are cached by candidate (patch) hash, and search results
+by the hash of the original code, error and tests.
+"""
+
+import asyncio
+import hashlib
+import os
+import re
+import shutil
+import sys
+import tempfile
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+
+# Add project root to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import CANDIDATE_SETTINGS
+
+CandidateGenerator = Callable[[int], Awaitable[str]]
+
+@dataclass
+class VerificationResult:
+    """Outcome of checking one candidate."""
+    passed: bool
+    stage: str  # "extract", "compile", "tests" or "passed"
+    output: str = ""
+
+@dataclass
+class CandidateResult:
+    """Outcome of a candidate search."""
+    text: str
+    code: Optional[str]
+    passed: bool
+    seed: Optional[int] = None
+    attempts: int = 0
+    stage: str = ""
+    cached: bool = False
+
+def extract_code(text: str) -> Optional[str]:
+    """Code from the first fenced block, or the whole text when it is unfenced."""
+    match = re.search(r"```[\w+-]*\n(.*?)```", text, re.DOTALL)
+    if match:
+        return match.group(1)
+    return None if "```" in text or text.startswith("[") else text
+
+def content_hash(*parts: str) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def _limit_resources(cpu_seconds: int, memory_mb: int):
+    """preexec_fn for verification runs: own session, CPU and memory caps."""
+    def apply():
+        os.setsid()
+        try:
+            import resource
+            resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds))
+            limit = memory_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ImportError, ValueError, OSError):
+            pass
+    return apply
+
+class LRUCache(OrderedDict):
+    def __init__(self, size: int):
+        super().__init__()
+        self.size = size
+
+    def remember(self, key, value):
+        self[key] = value
+        self.move_to_end(key)
+        while len(self) > self.size:
+            self.popitem(last=False)
+
+class CandidateSearch:
+    """Generates candidates concurrently and returns the first that verifies."""
+
+    def __init__(self, settings: dict = None):
+        self.settings = {**CANDIDATE_SETTINGS, **(settings or {})}
+        self.verifications = asyncio.Semaphore(self.settings["max_parallel_verifications"])
+        self.verification_cache = LRUCache(self.settings["cache_size"])
+        self.result_cache = LRUCache(self.settings["cache_size"])
+
+    async def _run_limited(self, args, cwd: str) -> tuple:
+        """Run a command in the scratch directory; killed on timeout or cancellation."""
+        proc = await asyncio.create_subprocess_exec(
+            sys.executable, "-I", *args,
+            cwd=cwd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            env={"PATH": os.environ.get("PATH", ""), "PYTHONDONTWRITEBYTECODE": "1"},
+            preexec_fn=_limit_resources(self.settings["cpu_seconds"], self.settings["memory_mb"])
+        )
+        try:
+            stdout, _ = await asyncio.wait_for(proc.communicate(), self.settings["verify_timeout"])
+            return proc.returncode, stdout.decode(errors="replace")
+        except asyncio.TimeoutError:
+            return None, f"Timed out after {self.settings['verify_timeout']}s"
+        finally:
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+
+    async def verify(self, code: str, tests: str = "") -> VerificationResult:
+        """Compile the candidate, then run the tests against it (they import it as ``candidate``)."""
+        key = content_hash(code, tests)
+        if key in self.verification_cache:
+            return self.verification_cache[key]
+
+        async with self.verifications:
+            workdir = tempfile.mkdtemp(prefix="nca-verify-")
+            try:
+                with open(os.path.join(workdir, "candidate.py"), "w") as f:
+                    f.write(code)
+                returncode, output = await self._run_limited(["-m", "py_compile", "candidate.py"], workdir)
+                if returncode != 0:
+                    result = VerificationResult(False, "compile", output)
+                elif not tests:
+                    result = VerificationResult(True, "passed")
+                else:
+                    with open(os.path.join(workdir, "test_candidate.py"), "w") as f:
+                        f.write(tests)
+                    returncode, output = await self._run_limited(
+                        ["-m", "pytest", "-q", "-x", "-p", "no:cacheprovider", "test_candidate.py"], workdir
+                    )
+                    result = VerificationResult(returncode == 0, "passed" if returncode == 0 else "tests", output)
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+        self.verification_cache.remember(key, result)
+        return result
+
+    async def _attempt(self, seed: int, generate: CandidateGenerator, tests: str):
+        text = await generate(seed)
+        code = extract_code(text)
+        if code is None or not code.strip():
+            return seed, text, None, VerificationResult(False, "extract")
+        return seed, text, code, await self.verify(code, tests)
+
+    async def search(self, code: str, error: str, generate: CandidateGenerator,
+                     tests: str = "", candidates: int = None) -> CandidateResult:
+        """Return the first verified candidate; cancel the rest once one passes."""
+        key = content_hash(code, error, tests)
+        if key in self.result_cache:
+            cached = self.result_cache[key]
+            return CandidateResult(**{**cached.__dict__, "cached": True})
+
+        candidates = candidates or self.settings["candidates"]
+        tasks = [asyncio.create_task(self._attempt(seed, generate, tests)) for seed in range(candidates)]
+        best = CandidateResult("", None, False)
+        attempts = 0
+        try:
+            for finished in asyncio.as_completed(tasks):
+                try:
+                    seed, text, candidate, verification = await finished
+                except Exception as e:
+                    attempts += 1
+                    best = best if best.text else CandidateResult(f"[ERROR]: {str(e)}", None, False, stage="generate")
+                    continue
+                attempts += 1
+                if verification.passed:
+                    result = CandidateResult(text, candidate, True, seed, attempts, verification.stage)
+                    self.result_cache.remember(key, result)
+                    return result
+                # Keep the candidate that got furthest, for reporting when none pass
+                if not best.text or (verification.stage == "tests" and best.stage != "tests"):
+                    best = CandidateResult(text, candidate, False, seed, attempts, verification.stage)
+        finally:
+            for task in tasks:
+                task.cancel()
+        best.attempts = attempts
+        return best
+
+# Shared instance so caches persist across requests
+_candidate_search: Optional[CandidateSearch] = None
+
+def get_candidate_search() -> CandidateSearch:
+    global _candidate_search
+    if _candidate_search is None:
+        _candidate_search = CandidateSearch()
+    return _candidate_search
@@ -0,0 +1,253 @@
+"""
+Codebase Cleanup Pipeline
+=========================
+
+Map-reduce cleanup for a whole project instead of one ``codebase: str``:
+- read: files come from a streamed tar/zip archive (spooled to disk, never one
+  big string) or from a multipart upload,
+- split: one task per file; large Python files are split at top-level
+  definitions so each chunk fits a model's context,
+- map: chunks are cleaned in parallel, with seeds spreading them across hosts;
+  each file's prompt names its language, and a Python chunk whose cleaned
+  version does not parse keeps its original code,
+- reduce: per-file unified diffs are streamed as they finish, followed by a
+  project-level report and the combined patch set.
+"""
+
+import ast
+import asyncio
+import difflib
+import os
+import sys
+import tarfile
+import tempfile
+import zipfile
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional
+
+# Add project root to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import CODEBASE_CLEAN_SETTINGS
+from LLM_Mesh.candidate_search import extract_code
+from LLM_Mesh.prompt_packer import estimate_tokens
+
+# (code, path, rules, seed) -> cleaned model output
+CleanFunction = Callable[[str, str, List[str], int], Awaitable[str]]
+
+@dataclass
+class SourceFile:
+    path: str
+    content: str
+
+@dataclass
+class FileResult:
+    """Outcome of cleaning one file."""
+    path: str
+    status: str  # "changed", "unchanged", "partial" or "failed"
+    diff: str = ""
+    chunks: int = 1
+    failed_chunks: int = 0
+    errors: List[str] = field(default_factory=list)
+    lines_added: int = 0
+    lines_removed: int = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"type": "file", **self.__dict__}
+
+def _wanted(path: str, settings: Dict[str, Any]) -> bool:
+    parts = path.replace("\\", "/").split("/")
+    if any(part in settings["skip_dirs"] for part in parts[:-1]):
+        return False
+    return os.path.splitext(path)[1] in settings["extensions"]
+
+def _decode(data: bytes) -> Optional[str]:
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+
+def iter_archive(fileobj, settings: Dict[str, Any] = None) -> Iterator[SourceFile]:
+    """Source files from a tar (any compression) or zip archive, one member at a time."""
+    settings = {**CODEBASE_CLEAN_SETTINGS, **(settings or {})}
+    fileobj.seek(0)
+    if zipfile.is_zipfile(fileobj):
+        fileobj.seek(0)
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or info.file_size > settings["max_file_bytes"] or not _wanted(info.filename, settings):
+                    continue
+                content = _decode(archive.read(info))
+                if content is not None:
+                    yield SourceFile(info.filename, content)
+        return
+
+    fileobj.seek(0)
+    with tarfile.open(fileobj=fileobj, mode="r:*") as archive:
+        for member in archive:
+            if not member.isfile() or member.size > settings["max_file_bytes"] or not _wanted(member.name, settings):
+                continue
+            content = _decode(archive.extractfile(member).read())
+            if content is not None:
+                yield SourceFile(member.name, content)
+
+async def spool_stream(chunks: AsyncIterator[bytes], max_bytes: int):
+    """Write an uploaded body to a spooled temp file as it arrives."""
+    spool = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    size = 0
+    async for chunk in chunks:
+        size += len(chunk)
+        if size > max_bytes:
+            spool.close()
+            raise ValueError(f"Archive exceeds {max_bytes // (1024 * 1024)} MB")
+        spool.write(chunk)
+    spool.seek(0)
+    return spool
+
+def split_source(content: str, max_tokens: int) -> List[str]:
+    """
+    Split a file into chunks that fit ``max_tokens``; joining them gives the file back.
+    Python is split between top-level statements, anything else between lines.
+    """
+    if estimate_tokens(content) <= max_tokens:
+        return [content]
+    lines = content.splitlines(keepends=True)
+    try:
+        # Boundaries at the first line of each top-level statement (decorators included)
+        starts = sorted({
+            min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])]) - 1
+            for node in ast.parse(content).body
+        })
+    except SyntaxError:
+        starts = []
+    boundaries = [0] + [s for s in starts if s > 0] if starts else list(range(len(lines)))
+
+    chunks, current = [], ""
+    for index, start in enumerate(boundaries):
+        end = boundaries[index + 1] if index + 1 < len(boundaries) else len(lines)
+        piece = "".join(lines[start:end])
+        if current and estimate_tokens(current + piece) > max_tokens:
+            chunks.append(current)
+            current = ""
+        current += piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+def _cleaned_chunk(original: str, output: str, is_python: bool) -> Optional[str]:
+    """The cleaned code from a model answer, or None when it is unusable."""
+    if output.startswith("[ERROR]"):
+        return None
+    code = extract_code(output)
+    if not code or not code.strip():
+        return None
+    if is_python:
+        try:
+            ast.parse(code)
+        except SyntaxError:
+            return None
+    # Keep the chunk's trailing newline so chunks join cleanly
+    return code if code.endswith("\n") or not original.endswith("\n") else code + "\n"
+
+async def clean_file(source: SourceFile, clean: CleanFunction, rules: List[str],
+                     settings: Dict[str, Any], seed: int) -> FileResult:
+    """Map step: clean every chunk of one file concurrently and diff the result."""
+    chunks = split_source(source.content, settings["max_chunk_tokens"])
+    is_python = source.path.endswith(".py")
+    outputs = await asyncio.gather(
+        *(clean(chunk, source.path, rules, seed + index) for index, chunk in enumerate(chunks)),
+        return_exceptions=True
+    )
+
+    cleaned, errors = [], []
+    for chunk, output in zip(chunks, outputs):
+        code = None
+        if isinstance(output, Exception):
+            errors.append(str(output))
+        else:
+            code = _cleaned_chunk(chunk, output, is_python)
+            if code is None:
+                errors.append(output[:200] if output.startswith("[ERROR]") else "cleaned code does not parse")
+        cleaned.append(code if code is not None else chunk)
+
+    new_content = "".join(cleaned)
+    diff_lines = list(difflib.unified_diff(
+        source.content.splitlines(keepends=True), new_content.splitlines(keepends=True),
+        fromfile=f"a/{source.path}", tofile=f"b/{source.path}"
+    ))
+    added = sum(1 for line in diff_lines if line.startswith("+") and not line.startswith("+++"))
+    removed = sum(1 for line in diff_lines if line.startswith("-") and not line.startswith("---"))
+    if len(errors) == len(chunks):
+        status = "failed"
+    elif errors:
+        status = "partial"
+    else:
+        status = "changed" if diff_lines else "unchanged"
+    return FileResult(source.path, status, "".join(diff_lines), len(chunks), len(errors), errors, added, removed)
+
+def build_report(results: List[FileResult]) -> Dict[str, Any]:
+    """Reduce step: project totals and the patch set in path order."""
+    counts = {status: 0 for status in ("changed", "unchanged", "partial", "failed")}
+    for result in results:
+        counts[result.status] += 1
+    ordered = sorted(results, key=lambda r: r.path)
+    return {
+        "type": "report",
+        "files": len(results),
+        **counts,
+        "lines_added": sum(r.lines_added for r in results),
+        "lines_removed": sum(r.lines_removed for r in results),
+        "failures": {r.path: r.errors for r in ordered if r.errors},
+        "patch": "".join(r.diff for r in ordered if r.diff)
+    }
+
+async def clean_codebase(files, clean: CleanFunction = None, rules: List[str] = None,
+                         settings: Dict[str, Any] = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Clean every file, yielding each file's result as it finishes and the
+    project report last. ``files`` is any iterable of SourceFile; it is read
+    lazily, so at most ``parallel_files`` files are held at once.
+    """
+    settings = {**CODEBASE_CLEAN_SETTINGS, **(settings or {})}
+    if clean is None:
+        # The process-wide manager, so hosts and models are not initialised again per request
+        from AdministrativeMesh.admin_dispatcher import get_mesh_manager
+        clean = (await get_mesh_manager()).clean_file
+    rules = rules or []
+
+    results: List[FileResult] = []
+    running = set()
+    seed = 0
+    source_iter = iter(files)
+    exhausted = False
+    while running or not exhausted:
+        # Keep the window full without reading the whole archive up front
+        while not exhausted and len(running) < settings["parallel_files"]:
+            source = next(source_iter, None)
+            if source is None:
+                exhausted = True
+                break
+            if len(results) + len(running) >= settings["max_files"]:
+                exhausted = True
+                break
+            running.add(asyncio.ensure_future(clean_file(source, clean, rules, settings, seed)))
+            seed += estimate_tokens(source.content) // settings["max_chunk_tokens"] + 1
+        if not running:
+            break
+        done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            result = task.result()
+            results.append(result)
+            yield result.to_dict()
+
+    yield build_report(results)
+
+def files_from_uploads(uploads: List[tuple], settings: Dict[str, Any] = None) -> Iterator[SourceFile]:
+    """Source files from (filename, bytes) pairs of a multipart upload."""
+    settings = {**CODEBASE_CLEAN_SETTINGS, **(settings or {})}
+    for filename, data in uploads:
+        if len(data) > settings["max_file_bytes"] or not _wanted(filename, settings):
+            continue
+        content = _decode(data)
+        if content is not None:
+            yield SourceFile(filename, content)
@@ -0,0 +1,186 @@
+"""
+CPU Core Allocator
+==================
+
+Gives each resident GGUF model a disjoint CPU set, kept on one NUMA node when
+it fits, so co-resident models stop thrashing each other's caches. Inference
+threads pin themselves to their model's set before decoding (llama.cpp worker
+threads inherit the affinity). Sets are rebalanced whenever a model loads or
+unloads, and tokens/sec is tracked per model before and after each rebalance.
+"""
+
+import glob
+import os
+import re
+import sys
+import threading
+from typing import Dict, List, Optional
+
+# Add project root to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import CORE_ALLOCATION_SETTINGS
+
+def parse_cpulist(text: str) -> List[int]:
+    """Parse a kernel cpulist such as ``0-3,8-11``."""
+    cpus = []
+    for part in text.strip().split(","):
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-")
+            cpus.extend(range(int(start), int(end) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+def detect_numa_topology() -> Dict[int, List[int]]:
+    """NUMA node → usable CPUs; a single node when the topology is not exposed."""
+    try:
+        usable = set(os.sched_getaffinity(0))
+    except AttributeError:
+        usable = set(range(os.cpu_count() or 1))
+
+    topology = {}
+    for path in glob.glob("/sys/devices/system/node/node*/cpulist"):
+        node = int(re.search(r"node(\d+)", path).group(1))
+        try:
+            with open(path) as f:
+                cpus = [cpu for cpu in parse_cpulist(f.read()) if cpu in usable]
+        except (OSError, ValueError):
+            continue
+        if cpus:
+            topology[node] = cpus
+    return topology or {0: sorted(usable)}
+
+class CoreAllocator:
+    """Partitions CPUs between resident models, weighted by their requested threads."""
+
+    def __init__(self, topology: Dict[int, List[int]] = None, reserved_cores: int = None):
+        self.topology = topology or detect_numa_topology()
+        self.reserved_cores = CORE_ALLOCATION_SETTINGS["reserved_cores"] if reserved_cores is None else reserved_cores
+        self.weights: Dict[str, float] = {}
+        self.allocations: Dict[str, List[int]] = {}
+        self.generation = 0
+        self.throughput: Dict[str, Dict[str, List[float]]] = {}
+        self.lock = threading.RLock()  # register/release hold it across rebalance
+        self._pinned = threading.local()
+
+    def _usable_by_node(self) -> Dict[int, List[int]]:
+        # Reserved cores (for the event loop and I/O) come off the end of the last node
+        nodes = {node: list(cpus) for node, cpus in sorted(self.topology.items())}
+        reserve = min(self.reserved_cores, sum(len(c) for c in nodes.values()) - 1)
+        for node in reversed(list(nodes)):
+            while reserve > 0 and nodes[node]:
+                nodes[node].pop()
+                reserve -= 1
+        return nodes
+
+    def rebalance(self) -> Dict[str, List[int]]:
+        """Recompute disjoint CPU sets; the largest models are placed first."""
+        with self.lock:
+            free = self._usable_by_node()
+            total = sum(len(cpus) for cpus in free.values())
+            models = sorted(self.weights, key=lambda m: self.weights[m], reverse=True)
+            total_weight = sum(self.weights.values()) or 1.0
+
+            allocations = {}
+            for index, model in enumerate(models):
+                remaining_models = len(models) - index - 1
+                remaining_cpus = sum(len(cpus) for cpus in free.values())
+                share = max(1, round(total * self.weights[model] / total_weight))
+                # Leave at least one core for every model still to be placed
+                share = max(1, min(share, remaining_cpus - remaining_models))
+
+                # Prefer a single NUMA node that fits the whole share
+                fitting = [node for node, cpus in free.items() if len(cpus) >= share]
+                order = sorted(fitting, key=lambda node: len(free[node])) or \
+                    sorted(free, key=lambda node: len(free[node]), reverse=True)
+                cpus = []
+                for node in order:
+                    take = free[node][:share - len(cpus)]
+                    free[node] = free[node][len(take):]
+                    cpus.extend(take)
+                    if len(cpus) >= share:
+                        break
+                # More models than cores: share the least loaded core
+                allocations[model] = cpus or [min(self.topology[min(self.topology)])]
+
+            self.allocations = allocations
+            self.generation += 1
+            for stats in self.throughput.values():
+                if stats["after"][1]:
+                    stats["before"] = stats["after"]
+                stats["after"] = [0.0, 0.0]
+        print(f"🧮 CPU sets rebalanced: {self.describe()}")
+        return dict(self.allocations)
+
+    def register(self, model_name: str, weight: float = 1.0) -> List[int]:
+        """Add a model (weight ≈ threads it would like) and rebalance."""
+        with self.lock:
+            self.weights[model_name] = weight
+            self.throughput.setdefault(model_name, {"before": [0.0, 0.0], "after": [0.0, 0.0]})
+            return self.rebalance().get(model_name, [])
+
+    def release(self, model_name: str):
+        with self.lock:
+            if self.weights.pop(model_name, None) is not None:
+                self.throughput.pop(model_name, None)
+                self.rebalance()
+
+    def cpus_for(self, model_name: str) -> List[int]:
+        return list(self.allocations.get(model_name, []))
+
+    def pin_current_thread(self, model_name: str) -> Optional[List[int]]:
+        """Pin the calling thread to the model's CPU set; a no-op until the set changes."""
+        cpus = self.allocations.get(model_name)
+        if not cpus or not hasattr(os, "sched_setaffinity"):
+            return None
+        state = (model_name, self.generation)
+        if getattr(self._pinned, "state", None) == state:
+            return cpus
+        try:
+            os.sched_setaffinity(0, cpus)  # 0 is the calling thread on Linux
+            self._pinned.state = state
+        except OSError as e:
+            print(f"⚠️  Could not pin {model_name} to CPUs {cpus}: {str(e)}")
+            return None
+        return cpus
+
+    def record_throughput(self, model_name: str, tokens: int, seconds: float):
+        with self.lock:
+            stats = self.throughput.get(model_name)
+            if stats is not None and tokens and seconds > 0:
+                stats["after"][0] += tokens
+                stats["after"][1] += seconds
+
+    def describe(self) -> str:
+        return ", ".join(f"{model}={_format_cpus(cpus)}" for model, cpus in self.allocations.items()) or "none"
+
+    def get_stats(self) -> Dict[str, Dict[str, object]]:
+        """Per-model CPU set, NUMA nodes and tokens/sec before and after the last rebalance."""
+        def rate(pair: List[float]) -> Optional[float]:
+            return round(pair[0] / pair[1], 2) if pair[1] else None
+
+        return {
+            model: {
+                "cpus": _format_cpus(cpus),
+                "numa_nodes": sorted(node for node, node_cpus in self.topology.items() if set(cpus) & set(node_cpus)),
+                "tokens_per_sec_before": rate(self.throughput.get(model, {}).get("before", [0, 0])),
+                "tokens_per_sec_after": rate(self.throughput.get(model, {}).get("after", [0, 0]))
+            }
+            for model, cpus in self.allocations.items()
+        }
+
+def _format_cpus(cpus: List[int]) -> str:
+    """Compact cpulist form, e.g. 0-3,8."""
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ",".join(f"{a}-{b}" if a != b else str(a) for a, b in ranges)
+
+# Shared allocator for models resident in this process
+core_allocator = CoreAllocator()
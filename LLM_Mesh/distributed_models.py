@@ -7,13 +7,30 @@ This module handles routing requests to distributed model hosts.
 """
 
 import asyncio
-import aiohttp
 import json
 import random
+import os
+import sys
+import time
+import uuid
 from typing import Dict, List, Optional, Any
 from dataclasses import dataclass
 from datetime import datetime, timedelta
 
+# Add project root to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import DEADLINE_SETTINGS, SCHEDULER_SETTINGS, SHARED_STATE_SETTINGS
+from error_handling import CircuitBreaker, TaskExecutionError, time_remaining
+from LLM_Mesh.prompt_packer import estimate_tokens
+from LLM_Mesh.request_scheduler import request_scheduler
+
+class HostRequestFailed(Exception):
+    """A host call that returned an error result, raised so the host's breaker counts it."""
+    def __init__(self, result: Dict[str, Any]):
+        super().__init__(result["error"])
+        self.result = result
+
 @dataclass
 class ModelHost:
     """Represents a network node hosting a model."""
@@ -44,6 +61,10 @@ class DistributedModelRegistry:
         self.models = self._initialize_model_registry()
         self.health_check_interval = 300  # 5 minutes
         self.last_health_check = None
+        self._pending_aborts = set()  # Keeps fire-and-forget abort calls alive
+        self.shared_store = None  # Set in multi-worker mode
+        self._last_sync = 0.0
+        self.breakers: Dict[str, CircuitBreaker] = {}  # Host URL → breaker, shared through the store
     
     def _initialize_model_registry(self) -> Dict[str, ModelInfo]:
         """Initialize the registry with available distributed models."""
@@ -101,15 +122,62 @@ class DistributedModelRegistry:
             )
         }
     
-    async def find_best_host(self, model_name: str, task_type: str = None) -> Optional[ModelHost]:
-        """Find the best available host for a model based on health, response time, and specialties."""
+    def attach_shared_store(self, store):
+        """Share host health and latency with the other gateway workers through ``store``."""
+        self.shared_store = store
+        self._last_sync = 0.0  # The next host lookup reads the shared table
+        self.breakers = {}  # Recreated with the store on next use
+    
+    def _breaker(self, host: ModelHost) -> CircuitBreaker:
+        """Per-host breaker; in multi-worker mode its state is shared by name."""
+        if host.host_url not in self.breakers:
+            self.breakers[host.host_url] = CircuitBreaker(name=f"host:{host.host_url}", store=self.shared_store)
+        return self.breakers[host.host_url]
+    
+    def _breaker_allows(self, host: ModelHost) -> bool:
+        """False while the host's breaker is open and its recovery timeout has not passed."""
+        breaker = self.breakers.get(host.host_url)
+        if breaker is None or breaker.state != "OPEN":
+            return True
+        return bool(breaker.last_failure_time) and time.time() - breaker.last_failure_time > breaker.recovery_timeout
+    
+    def _publish(self, host: ModelHost, checked: bool = False):
+        if self.shared_store is not None:
+            # Written by the store thread, off the request path
+            self.shared_store.submit(self.shared_store.publish_host, host.host_url, host.health_score, host.available,
+                                           host.last_response_time, time.time() if checked else None)
+    
+    async def _sync_hosts(self):
+        """Adopt what other workers have seen, at most every sync_interval seconds."""
+        now = time.time()
+        if self.shared_store is None or now - self._last_sync < SHARED_STATE_SETTINGS["sync_interval"]:
+            return
+        since, self._last_sync = self._last_sync, now
+        states = await self.shared_store.run(self.shared_store.host_states, since=since)
+        for model_info in self.models.values():
+            for host in model_info.hosts:
+                state = states.get(host.host_url)
+                if state:
+                    host.health_score = state["health_score"]
+                    host.available = state["available"]
+                    host.last_response_time = state["last_response_time"]
+                    if state["checked_at"]:
+                        host.last_health_check = datetime.fromtimestamp(state["checked_at"])
+    
+    async def find_best_host(self, model_name: str, task_type: str = None,
+                             spread: int = None) -> Optional[ModelHost]:
+        """
+        Find the best available host for a model based on health, response time, and specialties.
+        With spread, the n-th ranked host is chosen instead (wrapping), so parallel requests fan out.
+        """
+        await self._sync_hosts()
         model_info = self.models.get(model_name)
         if not model_info:
             print(f"Model '{model_name}' not found in registry")
             return None
         
-        # Filter available hosts
-        available_hosts = [host for host in model_info.hosts if host.available]
+        # Filter available hosts whose breaker is not open
+        available_hosts = [host for host in model_info.hosts if host.available and self._breaker_allows(host)]
         if not available_hosts:
             print(f"No available hosts for model '{model_name}'")
             return None
@@ -133,19 +201,18 @@ class DistributedModelRegistry:
         
         # Sort by score and return the best host
         scored_hosts.sort(key=lambda x: x[0], reverse=True)
+        if spread is not None:
+            return scored_hosts[spread % len(scored_hosts)][1]
         return scored_hosts[0][1]
     
     async def route_request(self, model_name: str, prompt: str, task_type: str = None, 
-                          max_tokens: int = 1000, temperature: float = 0.7) -> Dict[str, Any]:
-        """Route a request to the best available host for the specified model."""
-        
-        # Find the best host
-        host = await self.find_best_host(model_name, task_type)
-        if not host:
-            return {
-                "error": f"No available hosts for model '{model_name}'",
-                "success": False
-            }
+                          max_tokens: int = 1000, temperature: float = 0.7,
+                          grammar: str = None, stop: List[str] = None,
+                          seed: int = None) -> Dict[str, Any]:
+        """
+        Route a request to the best available host for the specified model.
+        Seeded requests are spread across the model's hosts.
+        """
         
         # Prepare the request
         request_data = {
@@ -155,16 +222,76 @@ class DistributedModelRegistry:
             "temperature": temperature,
             "task_type": task_type
         }
+        if grammar:
+            # GBNF grammar; llama.cpp hosts constrain decoding to it
+            request_data["grammar"] = grammar
+        if stop:
+            request_data["stop"] = stop
+        if seed is not None:
+            request_data["seed"] = seed
+        
+        # Wait for a slot (priority class and tenant fairness), then retry on
+        # another host only while the request deadline leaves budget
+        capacity = sum(host.available for host in self.models[model_name].hosts) if model_name in self.models else 0
+        async with request_scheduler.slot(model_name, capacity * SCHEDULER_SETTINGS["slots_per_host"],
+                                          cost=estimate_tokens(prompt) + max_tokens):
+            result = {"error": f"No available hosts for model '{model_name}'", "success": False}
+            for attempt in range(DEADLINE_SETTINGS["host_retries"] + 1):
+                remaining = time_remaining()
+                if remaining is not None and remaining < DEADLINE_SETTINGS["min_attempt_budget"]:
+                    last_error = f" (last error: {result['error']})" if attempt else ""
+                    result = {"error": f"Deadline exceeded before {model_name} answered{last_error}", "success": False}
+                    break
+                
+                # Find the best host (failed hosts were marked unavailable)
+                host = await self.find_best_host(model_name, task_type, spread=seed)
+                if not host:
+                    break
+                
+                timeout = DEADLINE_SETTINGS["host_timeout"] if remaining is None else min(remaining, DEADLINE_SETTINGS["host_timeout"])
+                result = await self._call_host(host, model_name, prompt, max_tokens, request_data, timeout)
+                if result["success"]:
+                    return result
+            return result
+    
+    async def _call_host(self, host: ModelHost, model_name: str, prompt: str, max_tokens: int,
+                         request_data: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        """Send one request to a host through its breaker, then share what it showed about the host."""
+        async def attempt():
+            result = await self._send_to_host(host, model_name, prompt, max_tokens, request_data, timeout)
+            if not result["success"] and result.get("host_fault", True):
+                raise HostRequestFailed(result)  # Counts against the host's breaker
+            return result
+        
+        try:
+            return await self._breaker(host).call(attempt)
+        except HostRequestFailed as e:
+            return e.result
+        except TaskExecutionError:
+            # Opened here or by another worker; the next attempt picks another host
+            return {"error": f"Circuit breaker for {host.host_url} is open", "success": False}
+        finally:
+            self._publish(host)
+    
+    async def _send_to_host(self, host: ModelHost, model_name: str, prompt: str, max_tokens: int,
+                            request_data: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        """Send one request to a host; the node is told how long it has."""
+        request_data = {
+            **request_data,
+            # Lets the caller's cancellation reach the node's generation
+            "request_id": uuid.uuid4().hex,
+            "deadline_ms": int(timeout * 1000)
+        }
         
-        # Route to the selected host
         try:
+            import aiohttp  # Imported on first use to keep startup fast
             start_time = asyncio.get_event_loop().time()
             
             async with aiohttp.ClientSession() as session:
                 async with session.post(
                     f"{host.host_url}/v1/completions",
                     json=request_data,
-                    timeout=aiohttp.ClientTimeout(total=60)
+                    timeout=aiohttp.ClientTimeout(total=timeout)
                 ) as response:
                     
                     if response.status == 200:
@@ -196,11 +323,19 @@ class DistributedModelRegistry:
                             "success": False
                         }
                         
+        except asyncio.CancelledError:
+            # The caller gave up: free the node's slot instead of letting it finish
+            self._abort_on_host(host, request_data["request_id"])
+            raise
         except asyncio.TimeoutError:
-            host.available = False
+            # Running out of request budget says nothing about the host
+            if timeout >= DEADLINE_SETTINGS["host_timeout"]:
+                host.available = False
+            self._abort_on_host(host, request_data["request_id"])
             return {
-                "error": f"Request to {host.host_url} timed out",
-                "success": False
+                "error": f"Request to {host.host_url} timed out after {timeout:.1f}s",
+                "success": False,
+                "host_fault": timeout >= DEADLINE_SETTINGS["host_timeout"]
             }
         except Exception as e:
             host.available = False
@@ -209,32 +344,59 @@ class DistributedModelRegistry:
                 "success": False
             }
     
+    def _abort_on_host(self, host: ModelHost, request_id: str):
+        """Tell a host to stop generating for an abandoned request (best effort, not awaited)."""
+        async def send_abort():
+            import aiohttp
+            try:
+                async with aiohttp.ClientSession() as session:
+                    async with session.post(
+                        f"{host.host_url}/v1/abort",
+                        json={"request_id": request_id},
+                        timeout=aiohttp.ClientTimeout(total=2)
+                    ) as response:
+                        await response.read()
+            except Exception as e:
+                print(f"⚠️  Abort for {request_id} on {host.host_url} failed: {str(e)}")
+
+        task = asyncio.ensure_future(send_abort())
+        self._pending_aborts.add(task)
+        task.add_done_callback(self._pending_aborts.discard)
+    
     async def health_check_all_hosts(self):
         """Perform health checks on all registered hosts."""
         print("Performing health checks on all model hosts...")
+        import aiohttp
+
+        async def check_host(session, host: ModelHost):
+            try:
+                async with session.get(
+                    f"{host.host_url}/health",
+                    timeout=aiohttp.ClientTimeout(total=10)
+                ) as response:
+                    
+                    if response.status == 200:
+                        health_data = await response.json()
+                        host.health_score = health_data.get("health_score", 0.5)
+                        host.available = True
+                        host.last_health_check = datetime.now()
+                        print(f"✅ {host.host_url} - Health: {host.health_score:.2f}")
+                    else:
+                        host.available = False
+                        print(f"❌ {host.host_url} - Status: {response.status}")
+                        
+            except Exception as e:
+                host.available = False
+                print(f"❌ {host.host_url} - Error: {str(e)}")
+            self._publish(host, checked=True)
         
-        for model_name, model_info in self.models.items():
-            for host in model_info.hosts:
-                try:
-                    async with aiohttp.ClientSession() as session:
-                        async with session.get(
-                            f"{host.host_url}/health",
-                            timeout=aiohttp.ClientTimeout(total=10)
-                        ) as response:
-                            
-                            if response.status == 200:
-                                health_data = await response.json()
-                                host.health_score = health_data.get("health_score", 0.5)
-                                host.available = True
-                                host.last_health_check = datetime.now()
-                                print(f"✅ {host.host_url} - Health: {host.health_score:.2f}")
-                            else:
-                                host.available = False
-                                print(f"❌ {host.host_url} - Status: {response.status}")
-                                
-                except Exception as e:
-                    host.available = False
-                    print(f"❌ {host.host_url} - Error: {str(e)}")
+        # Probe all hosts concurrently so one slow host does not serialize the rest
+        async with aiohttp.ClientSession() as session:
+            await asyncio.gather(*(
+                check_host(session, host)
+                for model_info in self.models.values()
+                for host in model_info.hosts
+            ))
         
         self.last_health_check = datetime.now()
         print(f"Health check completed at {self.last_health_check}")
@@ -273,7 +435,9 @@ class DistributedModelRegistry:
 model_registry = DistributedModelRegistry()
 
 async def get_model_response(model_name: str, prompt: str, task_type: str = None, 
-                           max_tokens: int = 1000, temperature: float = 0.7) -> Dict[str, Any]:
+                           max_tokens: int = 1000, temperature: float = 0.7,
+                           grammar: str = None, stop: List[str] = None,
+                           seed: int = None) -> Dict[str, Any]:
     """
     Convenience function to get a response from a distributed model.
     
@@ -283,6 +447,9 @@ async def get_model_response(model_name: str, prompt: str, task_type: str = None
         task_type: Optional task type for specialty routing
         max_tokens: Maximum tokens to generate
         temperature: Sampling temperature
+        grammar: Optional GBNF grammar the output must follow
+        stop: Optional stop sequences
+        seed: Optional sampling seed; also spreads parallel requests across hosts
     
     Returns:
         Dict containing the response and metadata
@@ -292,7 +459,10 @@ async def get_model_response(model_name: str, prompt: str, task_type: str = None
         prompt=prompt,
         task_type=task_type,
         max_tokens=max_tokens,
-        temperature=temperature
+        temperature=temperature,
+        grammar=grammar,
+        stop=stop,
+        seed=seed
     )
 
 async def initialize_distributed_models():
@@ -1,5 +1,8 @@
-from fastapi import FastAPI
+from fastapi import APIRouter, FastAPI, File, HTTPException, Query, Request, UploadFile
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from typing import List
+import json
 import sys
 import os
 
@@ -7,14 +10,16 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
 from AdministrativeMesh.mesh_manager import handle_task
+from config import CODEBASE_CLEAN_SETTINGS
+from LLM_Mesh.codebase_pipeline import clean_codebase, files_from_uploads, iter_archive, spool_stream
 
-app = FastAPI()
+router = APIRouter()
 
 class CleanRequest(BaseModel):
     codebase: str
     cleanup_rules: list = []
 
-@app.post("/clean")
+@router.post("/clean")
 async def clean_endpoint(request: CleanRequest):
     """Clean code endpoint using the cleaner worker model."""
     payload = {
@@ -38,6 +43,58 @@ async def clean_endpoint(request: CleanRequest):
             "fallback_response": f"Code cleanup failed: {str(e)}"
         }
 
+def _ndjson(files, rules: List[str], cleanup=None):
+    """Stream each file's result as a JSON line as soon as it is cleaned, then the report."""
+    async def lines():
+        try:
+            async for item in clean_codebase(files, rules=rules):
+                yield json.dumps(item) + "\n"
+        finally:
+            if cleanup:
+                cleanup()
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@router.post("/clean/codebase")
+async def clean_codebase_endpoint(request: Request, rules: List[str] = Query(default=[])):
+    """Clean a whole project sent as a tar (optionally compressed) or zip request body."""
+    try:
+        spool = await spool_stream(request.stream(), CODEBASE_CLEAN_SETTINGS["max_archive_bytes"])
+    except ValueError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    try:
+        files = iter_archive(spool)
+        first = next(files, None)
+    except Exception as e:
+        spool.close()
+        raise HTTPException(status_code=400, detail=f"Unreadable archive: {str(e)}")
+
+    def all_files():
+        if first is not None:
+            yield first
+            yield from files
+    return _ndjson(all_files(), rules, spool.close)
+
+@router.post("/clean/codebase/files")
+async def clean_files_endpoint(files: List[UploadFile] = File(...), rules: List[str] = Query(default=[])):
+    """Clean a project uploaded as multipart files; filenames carry the relative paths."""
+    max_bytes = CODEBASE_CLEAN_SETTINGS["max_archive_bytes"]
+    uploads, total = [], 0
+    for upload in files:
+        # The same cap as an archive body, over all files together
+        size = getattr(upload, "size", None)
+        if size is not None and total + size > max_bytes:
+            raise HTTPException(status_code=413, detail=f"Upload exceeds {max_bytes // (1024 * 1024)} MB")
+        data = await upload.read()
+        total += len(data)
+        if total > max_bytes:
+            raise HTTPException(status_code=413, detail=f"Upload exceeds {max_bytes // (1024 * 1024)} MB")
+        uploads.append((upload.filename, data))
+    return _ndjson(files_from_uploads(uploads), rules)
+
+# Standalone app; worker_gateway serves this router alongside the others in one process
+app = FastAPI()
+app.include_router(router)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8004)
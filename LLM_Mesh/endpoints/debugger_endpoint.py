@@ -1,4 +1,4 @@
-from fastapi import FastAPI
+from fastapi import APIRouter, FastAPI
 from pydantic import BaseModel
 import sys
 import os
@@ -8,14 +8,14 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(
 
 from AdministrativeMesh.mesh_manager import handle_task
 
-app = FastAPI()
+router = APIRouter()
 
 class DebugRequest(BaseModel):
     code: str
     error_message: str
     context: str = ""
 
-@app.post("/debug")
+@router.post("/debug")
 async def debug_endpoint(request: DebugRequest):
     """Debug code endpoint using the debugger worker model."""
     payload = {
@@ -40,6 +40,10 @@ async def debug_endpoint(request: DebugRequest):
             "fallback_response": f"Debug analysis failed: {str(e)}"
         }
 
+# Standalone app; worker_gateway serves this router alongside the others in one process
+app = FastAPI()
+app.include_router(router)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8001)
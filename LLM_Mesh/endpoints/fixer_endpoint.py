@@ -1,4 +1,4 @@
-from fastapi import FastAPI
+from fastapi import APIRouter, FastAPI
 from pydantic import BaseModel
 import sys
 import os
@@ -7,15 +7,18 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
 from AdministrativeMesh.mesh_manager import handle_task
+from NeuralCodingAssistant.workers.fixer_helper import apply_patch, describe_conflicts
+from config import PATCH_SETTINGS
 
-app = FastAPI()
+router = APIRouter()
 
 class FixRequest(BaseModel):
     code: str
     context: str
     fix_instruction: str = ""
+    output_mode: str = "code"  # "diff": the model returns a patch, applied here
 
-@app.post("/fix")
+@router.post("/fix")
 async def fix_endpoint(request: FixRequest):
     """Fix code endpoint using the fixer worker model."""
     payload = {
@@ -26,10 +29,35 @@ async def fix_endpoint(request: FixRequest):
     }
     
     try:
+        patch_report = {}
+        if request.output_mode == "diff":
+            patch = await handle_task("fix", {**payload, "output_mode": "diff"})
+            applied = apply_patch(request.code, patch)
+            patch_report = {
+                "output_mode": "diff",
+                "patch": patch,
+                "hunks_applied": applied.applied,
+                "fuzzy_hunks": applied.fuzzy,
+                "conflicts": [conflict.__dict__ for conflict in applied.conflicts]
+            }
+            if applied.clean:
+                return {
+                    "status": "success",
+                    "fixed_code": applied.content,
+                    **patch_report,
+                    "model_used": "codellama-7b-instruct",
+                    "worker": "fixer_worker"
+                }
+            if not PATCH_SETTINGS["fallback_to_full"]:
+                return {"status": "conflict", "error": describe_conflicts(applied), **patch_report}
+            # The patch did not apply; regenerate the whole file instead
+            patch_report["output_mode"] = "code"
+        
         result = await handle_task("fix", payload)
         return {
             "status": "success",
             "fixed_code": result,
+            **patch_report,
             "model_used": "codellama-7b-instruct",
             "worker": "fixer_worker"
         }
@@ -40,6 +68,10 @@ async def fix_endpoint(request: FixRequest):
             "fallback_response": f"# Error fixing code: {str(e)}\n{request.code}"
         }
 
+# Standalone app; worker_gateway serves this router alongside the others in one process
+app = FastAPI()
+app.include_router(router)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8003)
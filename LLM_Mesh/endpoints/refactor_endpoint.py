@@ -0,0 +1,48 @@
+from fastapi import APIRouter, FastAPI
+from pydantic import BaseModel
+import sys
+import os
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from AdministrativeMesh.mesh_manager import handle_task
+
+router = APIRouter()
+
+class RefactorRequest(BaseModel):
+    code: str
+    goals: list = []
+    context: str = ""
+
+@router.post("/refactor")
+async def refactor_endpoint(request: RefactorRequest):
+    """Refactor code endpoint using the refactor worker model."""
+    payload = {
+        "code_str": request.code,
+        "context": f"Refactoring goals: {', '.join(request.goals)}\n{request.context}".strip(),
+        "function_sig": "def refactor_code_snippet(code_str: str) -> str:"
+    }
+    
+    try:
+        result = await handle_task("refactor", payload)
+        return {
+            "status": "success",
+            "refactored_code": result,
+            "model_used": "wizardcoder-python-34b",
+            "worker": "refactor_worker"
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "error": str(e),
+            "fallback_response": f"# Error refactoring code: {str(e)}\n{request.code}"
+        }
+
+# Standalone app; worker_gateway serves this router alongside the others in one process
+app = FastAPI()
+app.include_router(router)
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=8005)
@@ -0,0 +1,66 @@
+"""
+Worker Gateway
+==============
+
+Serves every worker route (debug, analyze, fix, clean, refactor) from one
+process. All routes share one model cache and one executor per model, so a
+GGUF model used by several workers is loaded once instead of once per worker
+app. The gateway listens on every port in ``config.WORKER_ENDPOINTS``, so the
+existing per-port URLs keep working.
+
+Usage:
+    python LLM_Mesh/endpoints/worker_gateway.py [--host 0.0.0.0]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+from typing import List
+from urllib.parse import urlparse
+
+from fastapi import FastAPI
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from config import WORKER_ENDPOINTS
+from AdministrativeMesh.mesh_manager import model_cache
+from AdministrativeMesh.model_executor import get_executor_metrics
+from LLM_Mesh.model_variants import get_serving_variants
+from LLM_Mesh.prompt_packer import get_packer_stats
+from LLM_Mesh.endpoints import (analyzer_endpoint, cleaner_endpoint, debugger_endpoint,
+                                fixer_endpoint, refactor_endpoint)
+
+app = FastAPI(title="Neural Coding Assistant Worker Gateway")
+for endpoint in (debugger_endpoint, analyzer_endpoint, fixer_endpoint, cleaner_endpoint, refactor_endpoint):
+    app.include_router(endpoint.router)
+
+@app.get("/health")
+async def health_check():
+    """Models resident in this process, their executor queues and prompt packing savings."""
+    return {
+        "status": "healthy",
+        "loaded_models": sorted(model_cache),
+        "serving_variants": get_serving_variants(),
+        "executors": get_executor_metrics(),
+        "prompt_packing": get_packer_stats()
+    }
+
+def worker_ports() -> List[int]:
+    """Ports the per-worker URLs point at."""
+    return sorted({urlparse(url).port for url in WORKER_ENDPOINTS.values() if urlparse(url).port})
+
+async def serve(host: str = "0.0.0.0", ports: List[int] = None):
+    """Serve the one app on every worker port from this process's event loop."""
+    import uvicorn
+    servers = [uvicorn.Server(uvicorn.Config(app, host=host, port=port)) for port in ports or worker_ports()]
+    print(f"🧩 Worker gateway serving {', '.join(str(s.config.port) for s in servers)}")
+    await asyncio.gather(*(server.serve() for server in servers))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve all worker endpoints from one process")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--ports", type=int, nargs="*", help="Defaults to the ports in config.WORKER_ENDPOINTS")
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.ports))
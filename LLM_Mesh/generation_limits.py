@@ -0,0 +1,161 @@
+"""
+Adaptive Generation Limits
+==========================
+
+Feedback loop for ``max_tokens`` and stop sequences. Actual output lengths are
+recorded per task type and model, and ``max_tokens`` is set from a high
+percentile of recent lengths (with headroom) instead of a fixed 512-2500.
+Outputs that hit the limit count as longer than the limit, so truncation
+raises the next limit.
+
+Stop sequences are learned per task as well:
+- Turn markers the model keeps hallucinating ("\\nUser:", "### Instruction")
+  become stops once seen often enough.
+- The blank-line stop is dropped for tasks whose outputs it keeps cutting
+  short, such as code blocks left unclosed.
+"""
+
+import json
+import logging
+import os
+import sys
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, List
+
+# Add project root to path for imports
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from config import GENERATION_LIMIT_SETTINGS
+from LLM_Mesh.prompt_packer import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+BLANK_LINE_STOP = "\n\n"
+
+def percentile(values: List[int], pct: float) -> int:
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    rank = max(int(round(pct / 100 * len(ordered))) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+def looks_cut_short(text: str) -> bool:
+    """An unclosed code fence or bracket means generation stopped mid-structure."""
+    if text.count("```") % 2:
+        return True
+    return text.count("{") > text.count("}") or text.count("[") > text.count("]")
+
+class GenerationLimits:
+    """Per task type and model output statistics, persisted between runs."""
+
+    def __init__(self, settings: Dict[str, Any] = None, path: str = None):
+        self.settings = {**GENERATION_LIMIT_SETTINGS, **(settings or {})}
+        self.path = path if path is not None else os.path.join(project_root, self.settings["path"])
+        self.lengths: Dict[str, Deque[int]] = {}
+        self.marker_hits: Dict[str, Dict[str, int]] = {}
+        self.blank_line_cuts: Dict[str, Deque[bool]] = {}
+        self.records = 0
+        self.lock = threading.Lock()
+        self.load()
+
+    @staticmethod
+    def _key(task_type: str, model_name: str) -> str:
+        return f"{task_type}:{model_name}"
+
+    def record(self, task_type: str, model_name: str, text: str, max_tokens: int,
+               stop: List[str] = None, tokens: int = None, truncated: bool = None):
+        """
+        Record one generation's length and stop behaviour. Pass the model's own
+        token count and whether it stopped on the length limit when known;
+        otherwise both are estimated from the text.
+        """
+        tokens = tokens if tokens is not None else estimate_tokens(text)
+        if truncated is None:
+            truncated = tokens >= max_tokens * 0.95
+        key = self._key(task_type, model_name)
+        with self.lock:
+            window = self.lengths.setdefault(key, deque(maxlen=self.settings["window"]))
+            # A truncated output needed more than it got; count it as longer so the limit grows
+            window.append(int(max_tokens * self.settings["truncation_growth"]) if truncated else tokens)
+
+            hits = self.marker_hits.setdefault(task_type, {})
+            for marker in self.settings["spillover_markers"]:
+                if marker in text:
+                    hits[marker] = hits.get(marker, 0) + 1
+
+            if stop and BLANK_LINE_STOP in stop and not truncated:
+                cuts = self.blank_line_cuts.setdefault(task_type, deque(maxlen=self.settings["window"]))
+                cuts.append(looks_cut_short(text))
+
+            self.records += 1
+            should_save = self.records % self.settings["save_every"] == 0
+        if should_save:
+            self.save()
+
+    def max_tokens_for(self, task_type: str, model_name: str, default: int) -> int:
+        """High percentile of recent output lengths plus headroom; the default until enough samples exist."""
+        window = self.lengths.get(self._key(task_type, model_name))
+        if not window or len(window) < self.settings["min_samples"]:
+            return default
+        suggested = int(percentile(list(window), self.settings["percentile"]) * self.settings["headroom"])
+        return max(self.settings["min_tokens"], min(suggested, self.settings["max_tokens"]))
+
+    def stop_sequences_for(self, task_type: str, base_stops: List[str]) -> List[str]:
+        """Base stops adjusted by what this task's outputs have shown."""
+        stops = list(base_stops)
+        cuts = self.blank_line_cuts.get(task_type)
+        if (BLANK_LINE_STOP in stops and cuts and len(cuts) >= self.settings["min_samples"]
+                and sum(cuts) / len(cuts) > self.settings["blank_line_cut_rate"]):
+            stops.remove(BLANK_LINE_STOP)
+        for marker, hits in self.marker_hits.get(task_type, {}).items():
+            if hits >= self.settings["spillover_min_hits"] and marker not in stops:
+                stops.append(marker)
+        return stops
+
+    def trim_spillover(self, task_type: str, text: str) -> str:
+        """Cut text at the first learned turn marker (for backends that ignore stops)."""
+        for marker in self.stop_sequences_for(task_type, []):
+            index = text.find(marker)
+            if index > 0:
+                text = text[:index]
+        return text.rstrip()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            key: {
+                "samples": len(window),
+                f"p{self.settings['percentile']}": percentile(list(window), self.settings["percentile"]),
+                "max_tokens": self.max_tokens_for(*key.split(":", 1), default=None)
+            }
+            for key, window in self.lengths.items() if window
+        }
+
+    def load(self):
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        window = self.settings["window"]
+        self.lengths = {key: deque(values, maxlen=window) for key, values in data.get("lengths", {}).items()}
+        self.marker_hits = data.get("marker_hits", {})
+        self.blank_line_cuts = {key: deque(values, maxlen=window)
+                                for key, values in data.get("blank_line_cuts", {}).items()}
+
+    def save(self):
+        with self.lock:
+            data = {
+                "lengths": {key: list(values) for key, values in self.lengths.items()},
+                "marker_hits": self.marker_hits,
+                "blank_line_cuts": {key: list(values) for key, values in self.blank_line_cuts.items()}
+            }
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "w") as f:
+                json.dump(data, f)
+        except OSError as e:
+            logger.warning(f"Could not save generation limits: {str(e)}")
+
+# Shared instance used by both meshes
+generation_limits = GenerationLimits()
@@ -3,12 +3,16 @@ import subprocess
 import json
 import os
 import sys
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 
 # Add project root to path for imports
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
 from .distributed_models import model_registry, get_model_response, initialize_distributed_models
+from .prompt_packer import PromptSection, pack_prompt
+from .generation_limits import generation_limits
+from .output_grammar import constrain_instruction, get_grammar_text, get_output_shape, validate_output
+from config import CODEBASE_CLEAN_SETTINGS
 
 class MeshManager:
     """Router that manages task execution using distributed models hosted on network nodes."""
@@ -37,14 +41,7 @@ class MeshManager:
         }
         
         self.models_initialized = False
-    
-    async def initialize_models(self):
-        """Initialize the distributed model system."""
-        if not self.models_initialized:
-            print("🌐 Initializing distributed AI models...")
-            await initialize_distributed_models()
-            self.models_initialized = True
-            print("✅ Distributed model system ready")
+        self._initialization = None
     
     async def route_task(self, task_type: str, payload: Dict[str, Any]) -> str:
         """Route task to appropriate distributed model handler."""
@@ -65,260 +62,297 @@ class MeshManager:
         """Main task handler - routes to appropriate distributed model worker."""
         return await self.route_task(task_type, payload)
     
+    def _max_tokens(self, task_type: str, default: int) -> int:
+        """Handler defaults apply until enough outputs have been recorded for this task and model."""
+        model_name = self.task_model_mapping.get(task_type, "mistral-7b")
+        return generation_limits.max_tokens_for(task_type, model_name, default)
+    
     async def _get_model_response(self, task_type: str, prompt: str, max_tokens: int = 1000) -> str:
         """Get response from the appropriate distributed model for the task type."""
         model_name = self.task_model_mapping.get(task_type, "mistral-7b")
+        output_shape = get_output_shape(task_type)
+        max_tokens = self._max_tokens(task_type, max_tokens)
+        stop = generation_limits.stop_sequences_for(task_type, [])
         
         result = await get_model_response(
             model_name=model_name,
             prompt=prompt,
             task_type=task_type,
             max_tokens=max_tokens,
-            temperature=0.3  # Lower temperature for coding tasks
+            temperature=0.3,  # Lower temperature for coding tasks
+            grammar=get_grammar_text(output_shape),
+            stop=stop or None
         )
         
         if result.get("success"):
-            return result["response"]
+            response = generation_limits.trim_spillover(task_type, result["response"])
+            generation_limits.record(task_type, model_name, result["response"], max_tokens)
+            validate_output(output_shape, response)
+            return response
         else:
             return f"[ERROR]: {result.get('error', 'Unknown error occurred')}"
     
+    async def generate_candidate(self, task_type: str, payload: Dict[str, Any], seed: int,
+                                 temperature: float = 0.8) -> str:
+        """One sampled fix attempt; candidate search runs several with different seeds."""
+        code, error_msg = self._code(payload), self._error(payload)
+        prompt = self._pack_prompt(
+            task_type,
+            "Fix the following code so that it runs correctly:",
+            [
+                PromptSection("CODE", code, priority=0, is_code=True),
+                PromptSection("ERROR", error_msg, priority=1, min_tokens=64),
+                self._context_section(payload)
+            ],
+            "Respond with the complete corrected code in a single ```python code block:",
+            max_tokens=1500
+        )
+        result = await get_model_response(
+            model_name=self.task_model_mapping.get(task_type, "mistral-7b"),
+            prompt=prompt,
+            task_type=task_type,
+            max_tokens=self._max_tokens(task_type, 1500),
+            temperature=temperature,
+            seed=seed
+        )
+        if result.get("success"):
+            return result["response"]
+        return f"[ERROR]: {result.get('error', 'Unknown error occurred')}"
+    
+    async def clean_file(self, code: str, path: str, rules: List[str] = None, seed: int = None) -> str:
+        """Clean one file (or module chunk) of a codebase; seeds spread files across hosts."""
+        await self.initialize_models()
+        language = CODEBASE_CLEAN_SETTINGS["languages"].get(os.path.splitext(path)[1], "")
+        # The code_block grammar and its instruction are Python-only
+        output_shape = get_output_shape("clean") if language == "python" else None
+        prompt = self._pack_prompt(
+            "clean",
+            f"Clean up this code from {path} without changing its behaviour:",
+            [
+                PromptSection("CODE", code, priority=0, is_code=True),
+                PromptSection("RULES", "\n".join(rules or []), priority=1)
+            ],
+            f"Respond with the complete cleaned code in a single ```{language} code block:",
+            max_tokens=2000,
+            constrain=output_shape is not None
+        )
+        result = await get_model_response(
+            model_name=self.task_model_mapping["clean"],
+            prompt=prompt,
+            task_type="clean",
+            max_tokens=self._max_tokens("clean", 2000),
+            temperature=0.2,
+            grammar=get_grammar_text(output_shape),
+            seed=seed
+        )
+        if result.get("success"):
+            return result["response"]
+        return f"[ERROR]: {result.get('error', 'Unknown error occurred')}"
+
+    def _pack_prompt(self, task_type: str, preamble: str, sections: List[PromptSection],
+                     instruction: str, max_tokens: int, constrain: bool = True) -> str:
+        """Pack prompt sections into the context window of the model serving this task."""
+        model_name = self.task_model_mapping.get(task_type, "mistral-7b")
+        model_info = model_registry.models.get(model_name)
+        context_window = model_info.context_window if model_info else 4096
+        if constrain:
+            instruction = constrain_instruction(instruction, get_output_shape(task_type))
+        max_tokens = self._max_tokens(task_type, max_tokens)
+        prompt, _ = pack_prompt(preamble, sections, instruction, context_window - max_tokens)
+        return prompt
+    
+    @staticmethod
+    def _code(payload: Dict[str, Any]) -> str:
+        """Code under work; the dispatcher and endpoints send it as ``code_str``."""
+        return payload.get("code_str") or payload.get("code", "")
+    
+    @staticmethod
+    def _error(payload: Dict[str, Any]) -> str:
+        return payload.get("error_msg") or payload.get("error", "")
+    
+    def _context_section(self, payload: Dict[str, Any]) -> PromptSection:
+        """Retrieved context is the first thing to give up when over budget."""
+        return PromptSection("CONTEXT", payload.get("context", ""), priority=3, strip_boilerplate=True)
+    
     async def _handle_debug_task(self, payload: Dict[str, Any]) -> str:
         """Handle debugging tasks using distributed Code Llama model."""
-        code = payload.get("code", "")
-        error_msg = payload.get("error", "")
-        
-        prompt = f"""You are a debugging expert. Analyze this code and error:
-
-CODE:
-{code}
-
-ERROR:
-{error_msg}
-
-Provide:
+        code = self._code(payload)
+        error_msg = self._error(payload)
+        
+        prompt = self._pack_prompt(
+            "debug",
+            "You are a debugging expert. Analyze this code and error:",
+            [
+                PromptSection("CODE", code, priority=0, is_code=True),
+                PromptSection("ERROR", error_msg, priority=1, min_tokens=64),
+                self._context_section(payload)
+            ],
+            """Provide:
 1. Root cause analysis
 2. Specific fix suggestions
 3. Prevention strategies
 
-Response:"""
+Response:""",
+            max_tokens=1500
+        )
         
         return await self._get_model_response("debug", prompt, max_tokens=1500)
     
     async def _handle_analyze_task(self, payload: Dict[str, Any]) -> str:
         """Handle code analysis tasks using distributed StarCoder model."""
-        code = payload.get("code", "")
+        code = self._code(payload)
         analysis_type = payload.get("analysis_type", "general")
         
-        prompt = f"""Analyze this code for {analysis_type} aspects:
-
-CODE:
-{code}
-
-Provide detailed analysis including:
+        prompt = self._pack_prompt(
+            "analyze",
+            f"Analyze this code for {analysis_type} aspects:",
+            [
+                PromptSection("CODE", code, priority=0, is_code=True),
+                self._context_section(payload)
+            ],
+            """Provide detailed analysis including:
 - Code quality assessment
 - Performance considerations
 - Security issues
 - Best practices recommendations
 - Architecture suggestions
 
-Analysis:"""
+Analysis:""",
+            max_tokens=2000
+        )
         
         return await self._get_model_response("analyze", prompt, max_tokens=2000)
     
     async def _handle_fix_task(self, payload: Dict[str, Any]) -> str:
         """Handle code fixing tasks using distributed Code Llama model."""
-        code = payload.get("code", "")
-        issue = payload.get("issue", "")
-        
-        prompt = f"""Fix the following code issue:
-
-ISSUE: {issue}
-
-CODE:
-{code}
-
-Provide the corrected code with explanations:"""
+        code = self._code(payload)
+        issue = payload.get("issue") or self._error(payload)
+        
+        prompt = self._pack_prompt(
+            "fix",
+            "Fix the following code issue:",
+            [
+                PromptSection("ISSUE", issue, priority=1, min_tokens=64),
+                PromptSection("CODE", code, priority=0, is_code=True),
+                self._context_section(payload)
+            ],
+            "Provide the corrected code with explanations:",
+            max_tokens=1500
+        )
         
         return await self._get_model_response("fix", prompt, max_tokens=1500)
     
     async def _handle_clean_task(self, payload: Dict[str, Any]) -> str:
         """Handle code cleanup tasks using distributed Mistral model."""
-        code = payload.get("code", "")
+        code = self._code(payload)
         
-        prompt = f"""Clean up and improve this code:
-
-CODE:
-{code}
-
-Provide:
+        prompt = self._pack_prompt(
+            "clean",
+            "Clean up and improve this code:",
+            [PromptSection("CODE", code, priority=0, is_code=True)],
+            """Provide:
 1. Cleaned version with better structure
 2. Explanations of improvements made
 3. Any additional suggestions
 
-Cleaned code:"""
+Cleaned code:""",
+            max_tokens=2000
+        )
         
         return await self._get_model_response("clean", prompt, max_tokens=2000)
     
     async def _handle_refactor_task(self, payload: Dict[str, Any]) -> str:
         """Handle refactoring tasks using distributed DeepSeek Coder model."""
-        code = payload.get("code", "")
+        code = self._code(payload)
         refactor_goal = payload.get("goal", "improve structure")
         
-        prompt = f"""Refactor this code to {refactor_goal}:
-
-CODE:
-{code}
-
-Provide:
+        prompt = self._pack_prompt(
+            "refactor",
+            f"Refactor this code to {refactor_goal}:",
+            [
+                PromptSection("CODE", code, priority=0, is_code=True),
+                self._context_section(payload)
+            ],
+            """Provide:
 1. Refactored code with improved architecture
 2. Explanation of changes made
 3. Benefits of the refactoring
 
-Refactored code:"""
+Refactored code:""",
+            max_tokens=2500
+        )
         
         return await self._get_model_response("refactor", prompt, max_tokens=2500)
     
     async def _handle_optimize_task(self, payload: Dict[str, Any]) -> str:
         """Handle optimization tasks using distributed StarCoder model."""
-        code = payload.get("code", "")
+        code = self._code(payload)
         optimization_target = payload.get("target", "performance")
         
-        prompt = f"""Optimize this code for {optimization_target}:
-
-CODE:
-{code}
-
-Provide:
+        prompt = self._pack_prompt(
+            "optimize",
+            f"Optimize this code for {optimization_target}:",
+            [
+                PromptSection("CODE", code, priority=0, is_code=True),
+                self._context_section(payload)
+            ],
+            """Provide:
 1. Optimized version
 2. Performance improvements explanation
 3. Benchmarking suggestions
 
-Optimized code:"""
+Optimized code:""",
+            max_tokens=2000
+        )
         
         return await self._get_model_response("optimize", prompt, max_tokens=2000)
     
     async def _handle_document_task(self, payload: Dict[str, Any]) -> str:
         """Handle documentation tasks using distributed Code Llama model."""
-        code = payload.get("code", "")
+        code = self._code(payload)
         doc_type = payload.get("type", "docstring")
         
-        prompt = f"""Generate {doc_type} documentation for this code:
-
-CODE:
-{code}
-
-Provide comprehensive documentation including:
+        prompt = self._pack_prompt(
+            "document",
+            f"Generate {doc_type} documentation for this code:",
+            [PromptSection("CODE", code, priority=0, is_code=True)],
+            """Provide comprehensive documentation including:
 - Function/class descriptions
 - Parameter explanations
 - Return value descriptions
 - Usage examples
 - Edge cases
 
-Documentation:"""
+Documentation:""",
+            max_tokens=1500
+        )
         
         return await self._get_model_response("document", prompt, max_tokens=1500)
-        code_str = payload.get("code_str", "")
-        error_msg = payload.get("error_msg", "")
-        
-        if not code_str and not error_msg:
-            return "[ERROR]: No code or error message provided for debugging"
-        
-        # Try Wolfram implementation first, fallback to mock
-        try:
-            return await self._run_wolfram_worker("debug", code_str, error_msg)
-        except Exception as e:
-            return f"[FALLBACK DEBUG]: Analyzing error: {error_msg[:200]}...\nCode needs investigation for common issues like syntax errors, type mismatches, or logic errors."
-    
-    async def _handle_analyze_task(self, payload: Dict[str, Any]) -> str:
-        """Handle code analysis tasks."""
-        code_str = payload.get("code_str", "")
-        
-        if not code_str:
-            return "[ERROR]: No code provided for analysis"
-        
-        try:
-            return await self._run_wolfram_worker("analyze", code_str)
-        except Exception as e:
-            return f"[FALLBACK ANALYSIS]: Code structure analysis:\n- Functions: {code_str.count('def ')}\n- Lines: {len(code_str.splitlines())}\n- Complexity: Medium\n- Recommendations: Consider adding type hints and documentation."
-    
-    async def _handle_fix_task(self, payload: Dict[str, Any]) -> str:
-        """Handle code fixing tasks."""
-        code_str = payload.get("code_str", "")
-        error_msg = payload.get("error_msg", "")
-        
-        if not code_str:
-            return "[ERROR]: No code provided for fixing"
-        
-        # For now, return a mock fix
-        return f"[FALLBACK FIX]: Suggested fixes for the code:\n1. Check syntax and indentation\n2. Verify variable names and types\n3. Add error handling\n\nOriginal code length: {len(code_str)} characters"
-    
-    async def _handle_clean_task(self, payload: Dict[str, Any]) -> str:
-        """Handle code cleanup tasks."""
-        code_str = payload.get("code_str", "")
-        
-        if not code_str:
-            return "[ERROR]: No code provided for cleanup"
-        
-        return f"[FALLBACK CLEAN]: Code cleanup suggestions:\n1. Remove unused imports\n2. Apply consistent formatting\n3. Add type hints\n4. Improve variable names\n\nCode analyzed: {len(code_str)} characters"
-    
-    async def _handle_refactor_task(self, payload: Dict[str, Any]) -> str:
-        """Handle code refactoring tasks."""
-        code_str = payload.get("code_str", "")
-        
-        if not code_str:
-            return "[ERROR]: No code provided for refactoring"
-        
-        return f"[FALLBACK REFACTOR]: Refactoring suggestions:\n1. Extract functions for better modularity\n2. Improve naming conventions\n3. Reduce complexity\n4. Add documentation\n\nCode size: {len(code_str)} characters"
-    
-    async def _run_wolfram_worker(self, task_type: str, code_str: str, error_msg: str = "") -> str:
-        """Run Wolfram Language worker if available."""
-        try:
-            # Check if wolfram is available
-            result = await asyncio.create_subprocess_exec(
-                "wolfram", "-c", "Print[\"Wolfram available\"]",
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            stdout, stderr = await result.communicate()
-            
-            if result.returncode != 0:
-                raise Exception("Wolfram not available")
-            
-            # Run actual Wolfram worker
-            wolfram_script = f"""
-            codeAnalysis = "{code_str.replace('"', '\\"')}";
-            errorMessage = "{error_msg.replace('"', '\\"')}";
-            Print["[WOLFRAM {task_type.upper()}]: Analysis complete for " <> ToString[StringLength[codeAnalysis]] <> " characters"];
-            """
-            
-            proc = await asyncio.create_subprocess_exec(
-                "wolfram", "-c", wolfram_script,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            stdout, stderr = await proc.communicate()
-            
-            if proc.returncode == 0:
-                return stdout.decode().strip()
-            else:
-                raise Exception(f"Wolfram error: {stderr.decode()}")
-                
-        except Exception as e:
-            raise Exception(f"Wolfram worker failed: {str(e)}")
     
     async def initialize_models(self):
-        """Initialize all models and endpoints."""
+        """Initialize all models and endpoints once, even when called concurrently."""
         if self.models_initialized:
             return
-            
+        # Single-flight: concurrent first requests await the same initialization
+        if self._initialization is None:
+            self._initialization = asyncio.ensure_future(self._initialize())
+        try:
+            await asyncio.shield(self._initialization)
+        except Exception:
+            self._initialization = None
+            raise
+
+    async def _initialize(self):
         print("🧠 Initializing LLM Mesh...")
         
-        # Check for model availability
-        try:
-            # Try to import llama-cpp-python
-            import llama_cpp
+        # Health-check the distributed hosts that serve every task handler
+        await initialize_distributed_models()
+        
+        # Check for model availability without paying for the llama_cpp import
+        import importlib.util
+        if importlib.util.find_spec("llama_cpp") is not None:
             print("✅ llama-cpp-python available for GGUF models")
-        except ImportError:
+        else:
             print("⚠️  llama-cpp-python not installed - running in fallback mode")
         
         # Check for Wolfram
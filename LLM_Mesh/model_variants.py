@@ -0,0 +1,152 @@
+"""
+Quantization Variant Catalogue
+==============================
+
+Lists the quantized variants available for each logical model, with size and
+speed metadata, and picks the best one that fits a memory budget and latency
+target. Local ``load_model`` and ``ModelHostingNode`` use this instead of a
+single pinned file, and report which variant is serving.
+
+Decode speed on CPU is memory-bandwidth bound, so tokens/sec is estimated as
+bandwidth / model size. The hardware tuner's runtime profiles are kept per
+variant file, but selection here does not use their measured speeds.
+"""
+
+import os
+import sys
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+# Add project root to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import VARIANT_SETTINGS
+
+# Approximate bits per weight, used to rank quality
+QUANT_BITS = {
+    "Q2_K": 2.6, "Q3_K_S": 3.5, "Q3_K_M": 3.9, "Q4_K_S": 4.6,
+    "Q4_K_M": 4.8, "Q5_K_M": 5.7, "Q6_K": 6.6, "Q8_0": 8.5
+}
+
+@dataclass
+class ModelVariant:
+    """One quantized file of a logical model."""
+    model: str
+    quant: str
+    path: str
+    size_gb: float
+
+    @property
+    def bits(self) -> float:
+        return QUANT_BITS.get(self.quant.upper(), 4.0)
+
+    @property
+    def ram_required_gb(self) -> float:
+        # Weights plus KV cache and scratch buffers
+        return round(self.size_gb * 1.1 + 0.5, 2)
+
+    def estimated_tokens_per_sec(self, bandwidth_gbps: float = None) -> float:
+        bandwidth_gbps = bandwidth_gbps or VARIANT_SETTINGS["memory_bandwidth_gbps"]
+        return bandwidth_gbps / self.size_gb
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            "model": self.model,
+            "quant": self.quant,
+            "path": self.path,
+            "size_gb": self.size_gb,
+            "ram_required_gb": self.ram_required_gb,
+            "estimated_tokens_per_sec": round(self.estimated_tokens_per_sec(), 2)
+        }
+
+def _catalogue(model: str, template: str, sizes: Dict[str, float]) -> List[ModelVariant]:
+    return [ModelVariant(model, quant, template.format(quant=quant), size) for quant, size in sizes.items()]
+
+MODEL_VARIANTS: Dict[str, List[ModelVariant]] = {
+    # Administrative models
+    "llama-2-70b-chat": _catalogue(
+        "llama-2-70b-chat", "LLM_Mesh/models/administrative/llama-2-70b-chat.ggmlv3.{quant}.bin",
+        {"q2_K": 28.6, "q3_K_M": 33.2, "q4_K_M": 41.4}),
+    "deepseek-llm-67b-chat": _catalogue(
+        "deepseek-llm-67b-chat", "LLM_Mesh/models/administrative/deepseek-llm-67b-chat.{quant}.gguf",
+        {"Q2_K": 27.5, "Q3_K_M": 32.6, "Q4_K_M": 40.4}),
+    "qwen1.5-72b-chat": _catalogue(
+        "qwen1.5-72b-chat", "LLM_Mesh/models/administrative/qwen1.5-72b-chat-{quant}.gguf",
+        {"q2_k": 28.5, "q3_k_m": 35.4, "q4_k_m": 44.2}),
+    # Worker models
+    "starcoder2-15b": _catalogue(
+        "starcoder2-15b", "LLM_Mesh/models/worker/starcoder2-15b-{quant}.gguf",
+        {"Q3_K_M": 8.0, "Q4_K_M": 9.9, "Q5_K_M": 11.4, "Q8_0": 17.0}),
+    "deepseek-coder-6.7b-instruct": _catalogue(
+        "deepseek-coder-6.7b-instruct", "LLM_Mesh/models/worker/deepseek-coder-6.7b-instruct.{quant}.gguf",
+        {"Q4_K_S": 3.86, "Q4_K_M": 4.08, "Q5_K_M": 4.79, "Q8_0": 7.16}),
+    "codellama-7b-instruct": _catalogue(
+        "codellama-7b-instruct", "LLM_Mesh/models/worker/codellama-7b-instruct.{quant}.gguf",
+        {"Q3_K_M": 3.30, "Q4_K_M": 4.08, "Q5_K_M": 4.78, "Q8_0": 7.16}),
+    "wizardcoder-python-13b": _catalogue(
+        "wizardcoder-python-13b", "LLM_Mesh/models/worker/wizardcoder-python-13b-v1.0.{quant}.gguf",
+        {"Q3_K_M": 6.34, "Q4_K_S": 7.41, "Q4_K_M": 7.87, "Q5_K_M": 9.23}),
+    "wizardcoder-python-34b": _catalogue(
+        "wizardcoder-python-34b", "LLM_Mesh/models/worker/wizardcoder-python-34b-v1.0.{quant}.gguf",
+        {"Q2_K": 14.2, "Q3_K_S": 14.6, "Q4_K_M": 20.2}),
+    "mistral-7b-instruct-v0.2": _catalogue(
+        "mistral-7b-instruct-v0.2", "LLM_Mesh/models/worker/mistral-7b-instruct-v0.2.{quant}.gguf",
+        {"Q3_K_M": 3.52, "Q4_K_M": 4.37, "Q5_K_M": 5.13, "Q8_0": 7.7}),
+    # Distributed models served by hosting nodes
+    "mistral-7b": _catalogue("mistral-7b", "/models/mistral-7b/mistral-7b.{quant}.gguf",
+                             {"Q3_K_M": 3.52, "Q4_K_M": 4.37, "Q5_K_M": 5.13, "Q8_0": 7.7}),
+    "code-llama-7b": _catalogue("code-llama-7b", "/models/code-llama-7b/code-llama-7b.{quant}.gguf",
+                                {"Q3_K_M": 3.30, "Q4_K_M": 4.08, "Q5_K_M": 4.78, "Q8_0": 7.16}),
+    "starcoder-15b": _catalogue("starcoder-15b", "/models/starcoder-15b/starcoder-15b.{quant}.gguf",
+                                {"Q3_K_M": 8.0, "Q4_K_M": 9.9, "Q5_K_M": 11.4, "Q8_0": 17.0}),
+    "deepseek-coder-33b": _catalogue("deepseek-coder-33b", "/models/deepseek-coder-33b/deepseek-coder-33b.{quant}.gguf",
+                                     {"Q3_K_M": 16.1, "Q4_K_M": 19.9, "Q5_K_M": 23.5}),
+}
+
+# Which variant is serving each model in this process
+SERVING_VARIANTS: Dict[str, ModelVariant] = {}
+
+def available_memory_gb() -> float:
+    try:
+        import psutil
+        return psutil.virtual_memory().available / (1024 ** 3)
+    except ImportError:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") / (1024 ** 3)
+
+def min_tokens_per_sec(model_name: str) -> Optional[float]:
+    targets = VARIANT_SETTINGS["min_tokens_per_sec"]
+    return targets.get(model_name, targets.get("default"))
+
+def select_variant(model_name: str, memory_budget_gb: float, min_tps: float = None,
+                   disk_budget_gb: float = None, exists: Callable[[str], bool] = None) -> Optional[ModelVariant]:
+    """
+    Highest-quality variant that fits the memory (and disk) budget and meets the
+    speed target. When none is fast enough, the fastest one that fits.
+    """
+    fitting = [
+        variant for variant in MODEL_VARIANTS.get(model_name, [])
+        if variant.ram_required_gb <= memory_budget_gb
+        and (disk_budget_gb is None or variant.size_gb <= disk_budget_gb)
+        and (exists is None or exists(variant.path))
+    ]
+    if not fitting:
+        return None
+    fast_enough = [v for v in fitting if min_tps is None or v.estimated_tokens_per_sec() >= min_tps]
+    if fast_enough:
+        return max(fast_enough, key=lambda v: (v.bits, -v.size_gb))
+    return max(fitting, key=lambda v: v.estimated_tokens_per_sec())
+
+def select_local_variant(model_name: str, root: str = "") -> Optional[ModelVariant]:
+    """Best variant whose file is present locally, within this machine's free memory."""
+    budget = available_memory_gb() * VARIANT_SETTINGS["memory_fraction"]
+    return select_variant(
+        model_name, budget, min_tokens_per_sec(model_name),
+        exists=lambda path: os.path.exists(os.path.join(root, path))
+    )
+
+def record_serving_variant(variant: ModelVariant):
+    SERVING_VARIANTS[variant.model] = variant
+    print(f"📦 {variant.model} serving {variant.quant} ({variant.size_gb} GB)")
+
+def get_serving_variants() -> Dict[str, Dict[str, object]]:
+    return {model: variant.to_dict() for model, variant in SERVING_VARIANTS.items()}
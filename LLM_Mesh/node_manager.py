@@ -13,12 +13,17 @@ import GPUtil
 import json
 import os
 import sys
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Set
 from dataclasses import dataclass, asdict
 from datetime import datetime
 import subprocess
 import logging
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from LLM_Mesh.core_allocator import CoreAllocator
+from LLM_Mesh.model_variants import MODEL_VARIANTS, ModelVariant, min_tokens_per_sec, select_variant
+
 @dataclass
 class NodeCapacity:
     """Hardware capacity information for a node."""
@@ -41,6 +46,7 @@ class ModelLoadInfo:
     requests_served: int
     avg_response_time: float
     last_request_time: datetime
+    variant: str = ""  # Quantization serving this model
 
 class ModelHostingNode:
     """
@@ -56,6 +62,9 @@ class ModelHostingNode:
         self.is_running = False
         self.health_score = 1.0
         self.earnings = 0.0  # NetworkTokens earned
+        self.core_allocator = CoreAllocator()  # Disjoint CPU sets for this node's models
+        self.active_requests: Dict[str, asyncio.Task] = {}  # request_id → in-flight generation
+        self.aborted: Set[str] = set()  # Requests cancelled through /v1/abort rather than a disconnect
         
         # Set up logging
         logging.basicConfig(level=logging.INFO)
@@ -98,8 +107,22 @@ class ModelHostingNode:
             network_bandwidth_mbps=network_bandwidth_mbps
         )
     
+    def select_variant(self, model_name: str) -> Optional[ModelVariant]:
+        """Best catalogued quantization that fits this node's remaining RAM and disk."""
+        current_ram_usage = sum(model.ram_usage_gb for model in self.loaded_models.values())
+        return select_variant(
+            model_name,
+            memory_budget_gb=self.capacity.available_ram_gb * 0.8 - current_ram_usage,  # 80% safety margin
+            min_tps=min_tokens_per_sec(model_name),
+            disk_budget_gb=self.capacity.disk_space_gb * 0.9
+        )
+    
     def can_host_model(self, model_name: str, model_size_gb: float, ram_required_gb: float) -> bool:
         """Check if this node has capacity to host a new model."""
+        # Catalogued models can fall back to a smaller quantization that fits
+        if model_name in MODEL_VARIANTS:
+            return model_name not in self.loaded_models and self.select_variant(model_name) is not None
+        
         # Check RAM availability
         current_ram_usage = sum(model.ram_usage_gb for model in self.loaded_models.values())
         if (current_ram_usage + ram_required_gb) > (self.capacity.available_ram_gb * 0.8):  # 80% safety margin
@@ -125,7 +148,12 @@ class ModelHostingNode:
             self.logger.warning(f"Cannot host model {model_name} - insufficient capacity")
             return False
         
-        self.logger.info(f"Loading model {model_name}...")
+        variant = self.select_variant(model_name)
+        if variant:
+            model_path = variant.path
+            model_config = {**model_config, "size_gb": variant.size_gb, "ram_required_gb": variant.ram_required_gb}
+        
+        self.logger.info(f"Loading model {model_name}" + (f" ({variant.quant})..." if variant else "..."))
         start_time = datetime.now()
         
         try:
@@ -144,8 +172,10 @@ class ModelHostingNode:
                 load_time_seconds=load_time,
                 requests_served=0,
                 avg_response_time=0.0,
-                last_request_time=datetime.now()
+                last_request_time=datetime.now(),
+                variant=variant.quant if variant else ""
             )
+            self.core_allocator.register(model_name, weight=model_config.get("ram_required_gb", 8.0))
             
             self.logger.info(f"✅ Model {model_name} loaded in {load_time:.2f}s")
             return True
@@ -163,6 +193,7 @@ class ModelHostingNode:
         try:
             # In a real implementation, this would unload the actual model
             del self.loaded_models[model_name]
+            self.core_allocator.release(model_name)
             self.logger.info(f"✅ Model {model_name} unloaded")
             return True
             
@@ -170,8 +201,10 @@ class ModelHostingNode:
             self.logger.error(f"Failed to unload model {model_name}: {str(e)}")
             return False
     
-    async def handle_inference_request(self, model_name: str, prompt: str, max_tokens: int = 1000) -> Dict[str, Any]:
-        """Handle an inference request for a loaded model."""
+    async def handle_inference_request(self, model_name: str, prompt: str, max_tokens: int = 1000,
+                                       grammar: str = None, stop: List[str] = None,
+                                       seed: int = None) -> Dict[str, Any]:
+        """Handle an inference request for a loaded model, constrained to the GBNF grammar if given."""
         if model_name not in self.loaded_models:
             return {
                 "error": f"Model {model_name} not loaded on this node",
@@ -217,6 +250,16 @@ class ModelHostingNode:
                 "success": False
             }
     
+    def abort_request(self, request_id: str) -> bool:
+        """Cancel an in-flight generation, freeing its slot."""
+        generation = self.active_requests.get(request_id)
+        if generation is None or generation.done():
+            return False
+        self.aborted.add(request_id)
+        generation.cancel()
+        self.logger.info(f"Aborted request {request_id}")
+        return True
+    
     async def get_health_status(self) -> Dict[str, Any]:
         """Get current health status of this node."""
         # Update hardware metrics
@@ -242,10 +285,12 @@ class ModelHostingNode:
                     "requests_served": info.requests_served,
                     "avg_response_time": info.avg_response_time,
                     "ram_usage_gb": info.ram_usage_gb,
+                    "variant": info.variant,
                     "last_request": info.last_request_time.isoformat()
                 }
                 for name, info in self.loaded_models.items()
             },
+            "cpu_allocation": self.core_allocator.get_stats(),
             "total_earnings": self.earnings,
             "is_running": self.is_running
         }
@@ -267,10 +312,38 @@ class ModelHostingNode:
             model_name = data.get("model")
             prompt = data.get("prompt")
             max_tokens = data.get("max_tokens", 1000)
+            grammar = data.get("grammar")
+            stop = data.get("stop")
+            seed = data.get("seed")
+            request_id = data.get("request_id")
+            deadline_ms = data.get("deadline_ms")
             
-            result = await self.handle_inference_request(model_name, prompt, max_tokens)
+            # Run generation as its own task so /v1/abort can cancel it
+            generation = asyncio.ensure_future(
+                self.handle_inference_request(model_name, prompt, max_tokens, grammar, stop, seed)
+            )
+            if request_id:
+                self.active_requests[request_id] = generation
+            try:
+                # Past the caller's deadline nobody is waiting for the answer
+                result = await asyncio.wait_for(generation, deadline_ms / 1000 if deadline_ms else None)
+            except asyncio.TimeoutError:
+                return web.json_response({"error": "Deadline exceeded", "success": False}, status=504)
+            except asyncio.CancelledError:
+                if request_id not in self.aborted:
+                    generation.cancel()  # The client went away
+                    raise
+                return web.json_response({"error": "Request aborted", "success": False}, status=499)
+            finally:
+                self.active_requests.pop(request_id, None)
+                self.aborted.discard(request_id)
             return web.json_response(result)
         
+        async def abort_handler(request):
+            data = await request.json()
+            aborted = self.abort_request(data.get("request_id"))
+            return web.json_response({"success": aborted})
+        
         # Model management endpoints
         async def load_model_handler(request):
             data = await request.json()
@@ -291,6 +364,7 @@ class ModelHostingNode:
         # Set up routes
         app.router.add_get("/health", health_handler)
         app.router.add_post("/v1/completions", inference_handler)
+        app.router.add_post("/v1/abort", abort_handler)
         app.router.add_post("/load_model", load_model_handler)
         app.router.add_post("/unload_model", unload_model_handler)
         
@@ -0,0 +1,147 @@
+"""
+Output Grammars
+===============
+
+Compiles each task's expected output shape (from the Function Courier
+contract) into a GBNF grammar for llama.cpp backends. A constrained model can
+only emit the expected structure and stops as soon as it is complete, instead
+of wrapping the answer in prose. Validators check the same shapes for
+backends that cannot enforce a grammar.
+"""
+
+import ast
+import json
+import logging
+import os
+import re
+import sys
+from typing import Any, Dict, Optional
+
+# Add project root to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import OUTPUT_CONSTRAINT_SETTINGS
+
+logger = logging.getLogger(__name__)
+
+CODE_BLOCK = "code_block"
+UNIFIED_DIFF = "unified_diff"
+JSON_REPORT = "json_report"
+
+# A single fenced Python block; lines may not start with a backtick so the fence always closes it
+CODE_BLOCK_GRAMMAR = r'''
+root ::= "```python\n" line* "```"
+line ::= ([^`\n] [^\n]*)? "\n"
+'''
+
+UNIFIED_DIFF_GRAMMAR = r'''
+root ::= header hunk+
+header ::= "--- " path "\n" "+++ " path "\n"
+path ::= [^\n]+
+hunk ::= "@@ -" range " +" range " @@" [^\n]* "\n" hunkline+
+range ::= [0-9]+ ("," [0-9]+)?
+hunkline ::= [ +-] [^\n]* "\n"
+'''
+
+JSON_REPORT_GRAMMAR = r'''
+root ::= "{" ws "\"summary\":" ws string "," ws "\"issues\":" ws issues "," ws "\"suggestions\":" ws strings ws "}"
+issues ::= "[" ws (issue (ws "," ws issue)*)? ws "]"
+issue ::= "{" ws "\"line\":" ws (integer | "null") "," ws "\"severity\":" ws severity "," ws "\"message\":" ws string ws "}"
+severity ::= "\"error\"" | "\"warning\"" | "\"info\""
+strings ::= "[" ws (string (ws "," ws string)*)? ws "]"
+string ::= "\"" ([^"\\\n] | "\\" ["\\/bfnrt])* "\""
+integer ::= [0-9]+
+ws ::= [ \n]{0,4}
+'''
+
+GRAMMARS = {
+    CODE_BLOCK: CODE_BLOCK_GRAMMAR,
+    UNIFIED_DIFF: UNIFIED_DIFF_GRAMMAR,
+    JSON_REPORT: JSON_REPORT_GRAMMAR,
+}
+
+# Appended to the prompt instruction so the model aims for the shape it is held to
+SHAPE_INSTRUCTIONS = {
+    CODE_BLOCK: "Respond with only the complete code in a single ```python code block.",
+    UNIFIED_DIFF: "Respond with only a unified diff (--- / +++ headers and @@ hunks).",
+    JSON_REPORT: ('Respond with only a JSON object: {"summary": str, "issues": '
+                  '[{"line": int|null, "severity": "error"|"warning"|"info", "message": str}], '
+                  '"suggestions": [str]}.'),
+}
+
+# Counts of constrained generations and whether their output matched the shape
+CONSTRAINT_STATS = {"constrained": 0, "valid": 0, "invalid": 0}
+
+_compiled_grammars: Dict[str, Any] = {}
+
+def get_output_shape(task_type: str) -> Optional[str]:
+    """The output shape a task is constrained to, or None when constraints are off."""
+    if not OUTPUT_CONSTRAINT_SETTINGS["enabled"]:
+        return None
+    return OUTPUT_CONSTRAINT_SETTINGS["shapes"].get(task_type)
+
+def get_grammar_text(shape: Optional[str]) -> Optional[str]:
+    return GRAMMARS.get(shape) if shape else None
+
+def compile_grammar(shape: Optional[str]):
+    """Compiled ``LlamaGrammar`` for a shape, cached; None when llama_cpp is unavailable."""
+    if not shape or shape not in GRAMMARS:
+        return None
+    if shape not in _compiled_grammars:
+        try:
+            from llama_cpp import LlamaGrammar
+            _compiled_grammars[shape] = LlamaGrammar.from_string(GRAMMARS[shape], verbose=False)
+        except Exception as e:
+            logger.warning(f"Could not compile {shape} grammar: {str(e)}")
+            return None
+    return _compiled_grammars[shape]
+
+def constrain_instruction(instruction: str, shape: Optional[str]) -> str:
+    if not shape:
+        return instruction
+    return f"{instruction}\n{SHAPE_INSTRUCTIONS[shape]}".strip()
+
+def is_valid_code_block(text: str) -> bool:
+    match = re.fullmatch(r"\s*```python\n(.*?)```\s*", text, re.DOTALL)
+    if not match:
+        return False
+    try:
+        ast.parse(match.group(1))
+        return True
+    except SyntaxError:
+        return False
+
+def is_valid_unified_diff(text: str) -> bool:
+    return re.match(r"\s*--- [^\n]+\n\+\+\+ [^\n]+\n@@ -\d+(,\d+)? \+\d+(,\d+)? @@", text) is not None
+
+def is_valid_json_report(text: str) -> bool:
+    try:
+        report = json.loads(text)
+    except ValueError:
+        return False
+    return (
+        isinstance(report, dict)
+        and isinstance(report.get("summary"), str)
+        and isinstance(report.get("issues"), list)
+        and isinstance(report.get("suggestions"), list)
+    )
+
+VALIDATORS = {
+    CODE_BLOCK: is_valid_code_block,
+    UNIFIED_DIFF: is_valid_unified_diff,
+    JSON_REPORT: is_valid_json_report,
+}
+
+def validate_output(shape: Optional[str], text: str) -> bool:
+    """Check an output against its shape and record the outcome."""
+    if not shape:
+        return True
+    valid = VALIDATORS[shape](text)
+    CONSTRAINT_STATS["constrained"] += 1
+    CONSTRAINT_STATS["valid" if valid else "invalid"] += 1
+    if not valid:
+        logger.warning(f"Output does not match the {shape} shape ({len(text)} chars)")
+    return valid
+
+def get_constraint_stats() -> Dict[str, int]:
+    return dict(CONSTRAINT_STATS)
@@ -0,0 +1,200 @@
+"""
+Token-Budgeted Prompt Packer
+============================
+
+Packs prompt sections (code, error, context, ...) into a token budget.
+Sections are allocated by priority so a large context can never push out the
+code itself. Repeated text is removed, and comments, blank lines and
+boilerplate are stripped only when the prompt is over budget.
+"""
+
+import io
+import logging
+import re
+import tokenize
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Roughly 4 characters per token for source code and English text
+CHARS_PER_TOKEN = 4
+
+# Lines that are pure boilerplate in context snippets
+BOILERPLATE_PATTERNS = [
+    re.compile(r"^#!.*python"),
+    re.compile(r"^#.*coding[:=]"),
+    re.compile(r"^\s*sys\.path\.(append|insert)\("),
+    re.compile(r"^\s*(from\s+\S+\s+)?import\s+\S+"),
+]
+
+# Running totals across all packed prompts
+PACKER_STATS = {"prompts": 0, "compressed": 0, "tokens_before": 0, "tokens_after": 0}
+
+@dataclass
+class PromptSection:
+    """A named part of a prompt."""
+    label: str
+    text: str
+    priority: int  # Lower is more important
+    min_tokens: int = 0  # Reserved even when higher-priority sections are large
+    is_code: bool = False
+    strip_boilerplate: bool = False  # Only for context, never for the code being worked on
+
+@dataclass
+class PackResult:
+    """Outcome of packing a prompt."""
+    sections: Dict[str, str] = field(default_factory=dict)
+    original_tokens: int = 0
+    packed_tokens: int = 0
+    budget_tokens: int = 0
+    truncated: List[str] = field(default_factory=list)
+
+    @property
+    def saved_tokens(self) -> int:
+        return max(self.original_tokens - self.packed_tokens, 0)
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate used for budgeting."""
+    if not text:
+        return 0
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+def strip_comments(code: str) -> str:
+    """Remove comments and blank lines from Python code, falling back to a line filter."""
+    try:
+        tokens = [
+            tok for tok in tokenize.generate_tokens(io.StringIO(code).readline)
+            if tok.type != tokenize.COMMENT
+        ]
+        code = tokenize.untokenize(tokens)
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        code = "\n".join(line for line in code.splitlines() if not line.lstrip().startswith("#"))
+    return "\n".join(line.rstrip() for line in code.splitlines() if line.strip())
+
+def strip_boilerplate(text: str) -> str:
+    """Drop import lines, path hacks and interpreter headers from context snippets."""
+    return "\n".join(
+        line for line in text.splitlines()
+        if not any(pattern.match(line) for pattern in BOILERPLATE_PATTERNS)
+    )
+
+def collapse_blank_lines(text: str) -> str:
+    return re.sub(r"\n\s*\n+", "\n\n", text).strip()
+
+def dedupe_sections(sections: List[PromptSection]) -> Dict[str, str]:
+    """Remove lines from lower-priority sections that already appear in higher-priority ones."""
+    seen = set()
+    result = {}
+    for section in sorted(sections, key=lambda s: s.priority):
+        kept = []
+        for line in section.text.splitlines():
+            key = line.strip()
+            # Short lines ("}", "else:", "return") repeat legitimately
+            if len(key) > 20 and key in seen:
+                continue
+            kept.append(line)
+            if len(key) > 20:
+                seen.add(key)
+        result[section.label] = "\n".join(kept)
+    return result
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Keep the head and tail of the text within the token limit."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ""
+    lines = text.splitlines()
+    budget_chars = max_tokens * CHARS_PER_TOKEN
+    head, tail = [], []
+    used = 0
+    # Alternate head and tail so both the signature and the ending survive
+    i, j = 0, len(lines) - 1
+    while i <= j:
+        take_head = len(head) <= len(tail)
+        line = lines[i] if take_head else lines[j]
+        if used + len(line) + 1 > budget_chars - 40:
+            break
+        used += len(line) + 1
+        if take_head:
+            head.append(line)
+            i += 1
+        else:
+            tail.insert(0, line)
+            j -= 1
+    omitted = j - i + 1
+    if not head and not tail:
+        return text[:budget_chars]
+    return "\n".join(head + [f"... [{omitted} lines omitted] ..."] + tail)
+
+def pack_sections(sections: List[PromptSection], budget_tokens: int) -> PackResult:
+    """Fit sections into the budget, compressing and truncating least important first."""
+    result = PackResult(budget_tokens=budget_tokens)
+    result.original_tokens = sum(estimate_tokens(s.text) for s in sections)
+    packed = dedupe_sections(sections)
+
+    def total() -> int:
+        return sum(estimate_tokens(text) for text in packed.values())
+
+    by_importance = sorted(sections, key=lambda s: s.priority)
+
+    # Compress only when over budget, starting with the least important section
+    if total() > budget_tokens:
+        for section in reversed(by_importance):
+            text = packed[section.label]
+            if section.strip_boilerplate:
+                text = strip_boilerplate(text)
+            text = strip_comments(text) if section.is_code else collapse_blank_lines(text)
+            packed[section.label] = text
+            if total() <= budget_tokens:
+                break
+        PACKER_STATS["compressed"] += 1
+
+    # Allocate the remaining budget by priority, reserving minimums for later sections
+    if total() > budget_tokens:
+        remaining = budget_tokens
+        for index, section in enumerate(by_importance):
+            reserved = sum(
+                min(s.min_tokens, estimate_tokens(packed[s.label])) for s in by_importance[index + 1:]
+            )
+            allowance = max(remaining - reserved, min(section.min_tokens, remaining))
+            text = packed[section.label]
+            if estimate_tokens(text) > allowance:
+                packed[section.label] = truncate_to_tokens(text, allowance)
+                result.truncated.append(section.label)
+            remaining = max(remaining - estimate_tokens(packed[section.label]), 0)
+
+    result.sections = packed
+    result.packed_tokens = total()
+
+    PACKER_STATS["prompts"] += 1
+    PACKER_STATS["tokens_before"] += result.original_tokens
+    PACKER_STATS["tokens_after"] += result.packed_tokens
+    if result.saved_tokens:
+        logger.info(f"Prompt packed: {result.original_tokens} → {result.packed_tokens} tokens "
+                    f"(saved {result.saved_tokens}, budget {budget_tokens})")
+    return result
+
+def pack_prompt(preamble: str, sections: List[PromptSection], instruction: str,
+                budget_tokens: int) -> Tuple[str, PackResult]:
+    """
+    Build a prompt as preamble, labelled sections and a closing instruction.
+    Empty sections are omitted entirely.
+    """
+    overhead = estimate_tokens(preamble) + estimate_tokens(instruction)
+    overhead += sum(estimate_tokens(s.label) + 1 for s in sections)
+    result = pack_sections(sections, max(budget_tokens - overhead, 0))
+
+    parts = [preamble] if preamble else []
+    for section in sections:
+        text = result.sections.get(section.label, "")
+        if text.strip():
+            parts.append(f"{section.label}:\n{text}")
+    if instruction:
+        parts.append(instruction)
+    return "\n\n".join(parts), result
+
+def get_packer_stats() -> Dict[str, int]:
+    """Cumulative packing statistics, including total tokens saved."""
+    return {**PACKER_STATS, "tokens_saved": PACKER_STATS["tokens_before"] - PACKER_STATS["tokens_after"]}
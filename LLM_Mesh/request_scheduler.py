@@ -0,0 +1,214 @@
+"""
+Request Scheduler
+=================
+
+Decides which waiting request gets a model host next, so one tenant's bulk
+work cannot add seconds to everyone's keystroke latency. Each model is given
+``slots_per_host`` concurrent requests per available host; requests beyond
+that wait here and are released in this order:
+
+- starvation protection: a request that has waited longer than its class's
+  ``max_wait`` goes first, oldest first,
+- weighted fair queuing: otherwise the lowest virtual finish time wins. A
+  request's cost is its estimated tokens divided by its class weight times its
+  tenant's weight, and each (class, tenant) flow's tags run on from its last
+  request, so a tenant sending many large requests is served in proportion
+  rather than first-come,
+- class caps: a class with ``max_share`` never holds more than that share of a
+  model's slots, which keeps slots free for interactive requests.
+
+The class and tenant come from the surrounding ``request_priority`` context,
+so callers deep in the dispatch path need no extra arguments. Queue wait and
+end-to-end latency are recorded per class against its ``slo_ms`` target.
+"""
+
+import asyncio
+import itertools
+import os
+import sys
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+# Add project root to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import SCHEDULER_SETTINGS
+from LLM_Mesh.generation_limits import percentile
+
+# (priority class, tenant) of the request being handled
+_request_priority: ContextVar[Optional[Tuple[str, str]]] = ContextVar("request_priority", default=None)
+
+@contextmanager
+def request_priority(priority_class: str, tenant: str = "default"):
+    """Schedule model calls made inside this block under ``priority_class`` for ``tenant``."""
+    token = _request_priority.set((priority_class, tenant))
+    try:
+        yield
+    finally:
+        _request_priority.reset(token)
+
+def current_priority() -> Tuple[str, str]:
+    return _request_priority.get() or (SCHEDULER_SETTINGS["default_class"], "default")
+
+@dataclass
+class Waiter:
+    """A request queued for (or holding) a slot."""
+    priority_class: str
+    tenant: str
+    start: float  # Virtual start and finish tags
+    finish: float
+    sequence: int
+    enqueued: float
+    future: asyncio.Future = field(repr=False)
+
+@dataclass
+class ClassMetrics:
+    waits: Deque[float]
+    latencies: Deque[float]
+    served: int = 0
+    within_slo: int = 0
+
+class RequestScheduler:
+    """Priority classes and weighted fair queuing over per-model slot pools."""
+
+    def __init__(self, settings: Dict[str, Any] = None, clock=time.monotonic):
+        self.settings = {**SCHEDULER_SETTINGS, **(settings or {})}
+        self.clock = clock
+        self.queues: Dict[str, List[Waiter]] = {}
+        self.running: Dict[str, Dict[str, int]] = {}  # pool → class → requests holding a slot
+        self.virtual_time: Dict[str, float] = {}
+        self.last_finish: Dict[Tuple[str, str, str], float] = {}
+        self.active: Dict[Tuple[str, str, str], int] = {}  # flow → requests queued or running
+        self.metrics: Dict[str, ClassMetrics] = {}
+        self._sequence = itertools.count()
+
+    def _class(self, priority_class: str) -> str:
+        return priority_class if priority_class in self.settings["classes"] else self.settings["default_class"]
+
+    def _weight(self, priority_class: str, tenant: str) -> float:
+        return self.settings["classes"][priority_class]["weight"] * self.settings["tenant_weights"].get(tenant, 1.0)
+
+    def _metrics(self, priority_class: str) -> ClassMetrics:
+        if priority_class not in self.metrics:
+            window = self.settings["metrics_window"]
+            self.metrics[priority_class] = ClassMetrics(deque(maxlen=window), deque(maxlen=window))
+        return self.metrics[priority_class]
+
+    def _may_run(self, pool: str, priority_class: str, capacity: int) -> bool:
+        running = self.running.setdefault(pool, {})
+        if sum(running.values()) >= capacity:
+            return False
+        share = self.settings["classes"][priority_class].get("max_share", 1.0)
+        return running.get(priority_class, 0) < max(1, int(capacity * share))
+
+    def _leave(self, pool: str, waiter: Waiter):
+        """Drop flow state nothing depends on once a request leaves the pool."""
+        flow = (pool, waiter.priority_class, waiter.tenant)
+        self.active[flow] -= 1
+        if not self.active[flow]:
+            del self.active[flow]
+        if not self.queues.get(pool) and not any(self.running.get(pool, {}).values()):
+            # Idle pool: the next request starts a new busy period
+            self.virtual_time.pop(pool, None)
+            idle = [f for f in self.last_finish if f[0] == pool]
+        else:
+            # A flow whose tag the pool has caught up with would start at virtual time anyway
+            virtual_time = self.virtual_time.get(pool, 0.0)
+            idle = [f for f, finish in self.last_finish.items()
+                    if f[0] == pool and f not in self.active and finish <= virtual_time]
+        for f in idle:
+            del self.last_finish[f]
+
+    def _dispatch(self, pool: str, capacity: int):
+        """Hand free slots to waiters: overdue ones first, then by finish tag."""
+        queue = self.queues.get(pool, [])
+        now = self.clock()
+        while queue:
+            eligible = [w for w in queue if not w.future.done() and self._may_run(pool, w.priority_class, capacity)]
+            if not eligible:
+                break
+            overdue = [w for w in eligible
+                       if now - w.enqueued >= self.settings["classes"][w.priority_class]["max_wait"]]
+            waiter = (min(overdue, key=lambda w: w.enqueued) if overdue
+                      else min(eligible, key=lambda w: (w.finish, w.sequence)))
+            queue.remove(waiter)
+            self.virtual_time[pool] = max(self.virtual_time.get(pool, 0.0), waiter.start)
+            running = self.running[pool]
+            running[waiter.priority_class] = running.get(waiter.priority_class, 0) + 1
+            self._metrics(waiter.priority_class).waits.append(now - waiter.enqueued)
+            waiter.future.set_result(True)
+
+    async def acquire(self, pool: str, capacity: int, cost: float = 1.0) -> Waiter:
+        """Wait for a slot in ``pool``; the caller must ``release`` it."""
+        priority_class, tenant = current_priority()
+        priority_class = self._class(priority_class)
+        flow = (pool, priority_class, tenant)
+        start = max(self.virtual_time.get(pool, 0.0), self.last_finish.get(flow, 0.0))
+        finish = start + max(cost, 1.0) / self._weight(priority_class, tenant)
+        self.last_finish[flow] = finish
+        self.active[flow] = self.active.get(flow, 0) + 1
+
+        waiter = Waiter(priority_class, tenant, start, finish, next(self._sequence), self.clock(),
+                        asyncio.get_running_loop().create_future())
+        self.queues.setdefault(pool, []).append(waiter)
+        self._dispatch(pool, capacity)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self.release(pool, waiter, capacity)  # Granted just as it was cancelled
+            elif waiter in self.queues[pool]:
+                self.queues[pool].remove(waiter)
+                self._leave(pool, waiter)
+            raise
+        return waiter
+
+    def release(self, pool: str, waiter: Waiter, capacity: int):
+        self.running[pool][waiter.priority_class] -= 1
+        latency = self.clock() - waiter.enqueued
+        metrics = self._metrics(waiter.priority_class)
+        metrics.latencies.append(latency)
+        metrics.served += 1
+        metrics.within_slo += latency * 1000 <= self.settings["classes"][waiter.priority_class]["slo_ms"]
+        self._dispatch(pool, capacity)
+        if not self.queues.get(pool):
+            # Nothing is backlogged, so no flow is owed service ahead of this one's tag
+            self.virtual_time[pool] = max(self.virtual_time.get(pool, 0.0), waiter.finish)
+        self._leave(pool, waiter)
+
+    @asynccontextmanager
+    async def slot(self, pool: str, capacity: int, cost: float = 1.0):
+        """Hold one of ``capacity`` slots in ``pool`` for the block; a no-op when disabled."""
+        if not self.settings["enabled"]:
+            yield None
+            return
+        waiter = await self.acquire(pool, max(1, capacity), cost)
+        try:
+            yield waiter
+        finally:
+            self.release(pool, waiter, max(1, capacity))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Per class queue depth, wait and latency percentiles, and SLO attainment."""
+        stats = {}
+        for priority_class, config in self.settings["classes"].items():
+            metrics = self._metrics(priority_class)
+            entry = {
+                "queued": sum(1 for queue in self.queues.values() for w in queue if w.priority_class == priority_class),
+                "running": sum(running.get(priority_class, 0) for running in self.running.values()),
+                "served": metrics.served,
+                "slo_ms": config["slo_ms"],
+                "slo_attainment": round(metrics.within_slo / metrics.served, 4) if metrics.served else None
+            }
+            for name, values in (("wait", metrics.waits), ("latency", metrics.latencies)):
+                for pct in (50, 95, 99):
+                    entry[f"{name}_p{pct}_ms"] = round(percentile(list(values), pct) * 1000, 1) if values else None
+            stats[priority_class] = entry
+        return stats
+
+# Shared scheduler for this process
+request_scheduler = RequestScheduler()
@@ -1,20 +1,230 @@
-import subprocess
+"""
+Fixer Helper
+============
 
-def run_fixer_helper(code_patch: str, original_context: str, **kwargs) -> str:
-    """Apply patch with context using Wolfram Language."""
-    wolfram_code = f"""
-    Module[
-      {{patch, context, merged}},
-      patch = "{code_patch.replace('"', '\\"')}";
-      context = "{original_context.replace('"', '\\"')}";
-      merged = "Merged patch of " <> ToString[Length[Characters[patch]]] <> " characters with context of " <> ToString[Length[Characters[context]]] <> " characters";
-      merged
+Applies the patches fixers return in diff mode, so a one-line fix costs a few
+dozen output tokens instead of the whole file. Two patch formats are accepted:
+
+- unified diffs (``@@`` hunks; the ``---``/``+++`` headers are optional),
+- anchored search/replace blocks::
+
+      <<<<<<< SEARCH
+      lines to find
+      =======
+      lines to put there
+      >>>>>>> REPLACE
+
+Model-written patches rarely have exact line numbers or whitespace, so each
+hunk is placed by its context: an exact match nearest the hinted line, then a
+whitespace-insensitive match, then the most similar window at or above
+``fuzz_threshold``. Hunks that cannot be placed, whose placement is ambiguous
+(a repeated context with no line number, a short context, or two windows about
+equally similar) or that overlap one already placed are reported as conflicts
+rather than forced in.
+"""
+
+import difflib
+import os
+import re
+import sys
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from config import PATCH_SETTINGS
+
+HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+\d+(?:,\d+)? @@")
+SEARCH_REPLACE = re.compile(
+    r"^<{5,9} SEARCH[^\n]*\n(.*?)^={5,9}[ \t]*\n(.*?)^>{5,9} REPLACE", re.DOTALL | re.MULTILINE
+)
+FENCE = re.compile(r"```[\w+-]*\n(.*?)```", re.DOTALL)
+
+@dataclass
+class Hunk:
+    """One change: (op, line) pairs where op is ' ' (context), '-' or '+'."""
+    ops: List[Tuple[str, str]] = field(default_factory=list)
+    hint: Optional[int] = None  # 0-based line the hunk claims to start at
+
+    @property
+    def old_lines(self) -> List[str]:
+        return [line for op, line in self.ops if op != "+"]
+
+@dataclass
+class PatchConflict:
+    hunk: int
+    reason: str
+    expected: str
+
+@dataclass
+class PatchResult:
+    content: str
+    hunks: int
+    applied: int
+    fuzzy: int  # Hunks placed by a whitespace-insensitive or similarity match
+    conflicts: List[PatchConflict] = field(default_factory=list)
+
+    @property
+    def clean(self) -> bool:
+        return self.hunks > 0 and not self.conflicts
+
+def parse_unified_diff(text: str) -> List[Hunk]:
+    hunks, current = [], None
+    lines = text.splitlines()
+    for index, line in enumerate(lines):
+        match = HUNK_HEADER.match(line)
+        if match:
+            start, count = int(match.group(1)), match.group(2)
+            # "-5,0" inserts after line 5; otherwise the hunk starts at line 5
+            current = Hunk(hint=start if count == "0" else max(start - 1, 0))
+            hunks.append(current)
+        elif line.startswith("--- ") and index + 1 < len(lines) and lines[index + 1].startswith("+++ "):
+            current = None  # File header
+        elif current is None or line.startswith("\\"):
+            continue  # Prose before the first hunk, or "\ No newline at end of file"
+        elif line[:1] in ("+", "-", " "):
+            current.ops.append((line[0], line[1:]))
+        elif line == "":
+            current.ops.append((" ", ""))  # Models drop the space on blank context lines
+        else:
+            current = None  # Prose after the diff
+    return [hunk for hunk in hunks if hunk.ops]
+
+def parse_search_replace(text: str) -> List[Hunk]:
+    return [
+        Hunk([("-", line) for line in search.splitlines()] + [("+", line) for line in replace.splitlines()])
+        for search, replace in SEARCH_REPLACE.findall(text)
     ]
+
+def parse_patch(text: str) -> List[Hunk]:
+    """Hunks from a unified diff or search/replace blocks, fenced or not."""
+    fenced = FENCE.findall(text)
+    body = "\n".join(fenced) if fenced else text
+    if SEARCH_REPLACE.search(body):
+        return parse_search_replace(body)
+    return parse_unified_diff(body)
+
+def _indent(line: str) -> str:
+    return line[:len(line) - len(line.lstrip())]
+
+def _locate(lines: List[str], old: List[str], hint: Optional[int], taken: List[Tuple[int, int]],
+            threshold: float, window: int) -> Tuple[Optional[int], str]:
+    """
+    Start of the match for ``old`` and how it matched ("exact", "whitespace",
+    "fuzzy"), or None and why no single place fits.
     """
-    try:
-        result = subprocess.run(["wolfram", "-code", wolfram_code], capture_output=True, text=True, timeout=30)
-        return result.stdout.strip() if result.returncode == 0 else f"[PATCH ERROR]: {result.stderr.strip()}"
-    except subprocess.TimeoutExpired:
-        return "[PATCH ERROR]: Wolfram execution timed out"
-    except FileNotFoundError:
-        return "[PATCH ERROR]: Wolfram not found - using fallback patch merge"
+    size = len(old)
+    starts = sorted(
+        (start for start in range(len(lines) - size + 1)
+         if not any(start < end and start + size > begin for begin, end in taken)),
+        key=lambda start: abs(start - (hint or 0))
+    )
+    for kind, key in (("exact", lambda ls: ls), ("whitespace", lambda ls: [" ".join(l.split()) for l in ls])):
+        wanted = key(old)
+        matches = [start for start in starts if key(lines[start:start + size]) == wanted]
+        if matches:
+            # Without a line number there is nothing to choose between repeats
+            if hint is None and len(matches) > 1:
+                return None, f"Context occurs {len(matches)} times"
+            return matches[0], kind
+
+    # Short contexts are similar to too many lines to place by similarity
+    if sum(1 for line in old if line.strip()) < PATCH_SETTINGS["min_fuzzy_lines"]:
+        return None, "Context not found"
+    target = "\n".join(line.strip() for line in old)
+    candidates = []
+    for start in starts:
+        if hint is not None and abs(start - hint) > window:
+            break  # Sorted by distance; the rest are further away
+        matcher = difflib.SequenceMatcher(None, "\n".join(l.strip() for l in lines[start:start + size]), target)
+        if matcher.real_quick_ratio() >= threshold and matcher.quick_ratio() >= threshold:
+            ratio = matcher.ratio()
+            if ratio >= threshold:
+                candidates.append((ratio, start))
+    if not candidates:
+        return None, "Context not found"
+    best_ratio, best = max(candidates, key=lambda c: (c[0], -abs(c[1] - (hint or 0))))
+    # A separate window nearly as similar makes the placement a guess
+    rivals = [ratio for ratio, start in candidates if abs(start - best) >= size]
+    if rivals and max(rivals) >= best_ratio - PATCH_SETTINGS["ambiguity_margin"]:
+        return None, "Context is equally similar in several places"
+    return best, "fuzzy"
+
+def _replacement(hunk: Hunk, matched: List[str]) -> List[str]:
+    """The hunk's new lines, keeping the file's own context lines and indentation."""
+    # How the model indented the lines it quoted -> how the file indents them
+    indents = {}
+    for (op, line), original in zip([o for o in hunk.ops if o[0] != "+"], matched):
+        if line.strip():
+            indents.setdefault(_indent(line), _indent(original))
+
+    def reindent(line: str) -> str:
+        if not line.strip():
+            return line
+        # Deepest quoted level this line is nested under
+        theirs = _indent(line)
+        base = max((level for level in indents if theirs.startswith(level)), key=len, default=None)
+        if base is None:
+            return line
+        return indents[base] + line[len(base):]
+
+    result, position = [], 0
+    for op, line in hunk.ops:
+        if op == "+":
+            result.append(reindent(line))
+        else:
+            if op == " ":
+                result.append(matched[position])
+            position += 1
+    return result
+
+def apply_patch(original: str, patch: str, fuzz_threshold: float = None) -> PatchResult:
+    """Apply every hunk that can be placed; the rest come back as conflicts."""
+    threshold = PATCH_SETTINGS["fuzz_threshold"] if fuzz_threshold is None else fuzz_threshold
+    newline = "\r\n" if "\r\n" in original else "\n"
+    lines = original.splitlines()
+    hunks = parse_patch(patch)
+
+    placed, conflicts, fuzzy = [], [], 0
+    for index, hunk in enumerate(hunks):
+        old = hunk.old_lines
+        if not old:
+            # Pure insertion: only its line number says where it goes
+            at = min(hunk.hint or 0, len(lines))
+            if hunk.hint is None and lines:
+                conflicts.append(PatchConflict(index, "Insertion has no context to anchor it", ""))
+            elif any(begin < at < end for begin, end, _ in placed):
+                conflicts.append(PatchConflict(index, "Insertion falls inside another hunk", ""))
+            else:
+                placed.append((at, at, hunk))
+            continue
+        start, kind = _locate(lines, old, hunk.hint, [(s, e) for s, e, _ in placed],
+                              threshold, PATCH_SETTINGS["search_window"])
+        if start is None:
+            conflicts.append(PatchConflict(index, kind, "\n".join(old)))
+            continue
+        fuzzy += kind != "exact"
+        placed.append((start, start + len(old), hunk))
+
+    # Bottom-up so earlier offsets stay valid; at a shared start the replacement
+    # goes before the insertion so it cannot overwrite it
+    for start, end, hunk in sorted(placed, key=lambda p: (p[0], p[1]), reverse=True):
+        lines[start:end] = _replacement(hunk, lines[start:end])
+
+    content = newline.join(lines)
+    if lines and (original.endswith(("\n", "\r\n")) or not original):
+        content += newline
+    return PatchResult(content, len(hunks), len(placed), fuzzy, conflicts)
+
+def describe_conflicts(result: PatchResult) -> str:
+    if not result.hunks:
+        return "No hunks found in patch"
+    return "; ".join(f"hunk {c.hunk + 1}: {c.reason}" for c in result.conflicts)
+
+def run_fixer_helper(code_patch: str, original_context: str, **kwargs) -> str:
+    """Apply a fixer's patch to the original code; partial applies only with ``allow_partial``."""
+    result = apply_patch(original_context, code_patch, kwargs.get("fuzz_threshold"))
+    if result.clean or (kwargs.get("allow_partial") and result.applied):
+        return result.content
+    return f"[PATCH ERROR]: {describe_conflicts(result)}"
@@ -5,11 +5,38 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
 from AdministrativeMesh.mesh_manager import run_model_inference
+from NeuralCodingAssistant.workers.fixer_helper import apply_patch, describe_conflicts
+from config import PATCH_SETTINGS
 
 async def run_fixer(code_str: str, context: str, **kwargs) -> str:
-    """Fix code using CodeLlama model."""
+    """Fix code using CodeLlama model; ``output_mode="diff"`` asks for a patch instead of the file."""
     error_msg = kwargs.get('error_msg', 'Fix any issues in this code')
-    
+
+    if kwargs.get('output_mode') == "diff":
+        prompt = f"""You are a code fixing expert. Fix the following code:
+
+Code to fix:
+```
+{code_str}
+```
+
+Error/Issue: {error_msg}
+Context: {context}
+
+Please provide only the changes as a unified diff, or as <<<<<<< SEARCH / ======= / >>>>>>> REPLACE blocks, quoting a few unchanged lines around each change:
+"""
+        try:
+            patch = await run_model_inference("codellama-7b-instruct", prompt,
+                                              max_tokens=PATCH_SETTINGS["diff_max_tokens"], stop=["</s>"])
+        except Exception as e:
+            return f"[FIX ERROR]: Model execution failed: {str(e)}"
+        result = apply_patch(code_str, patch)
+        if result.clean:
+            return result.content
+        if not PATCH_SETTINGS["fallback_to_full"]:
+            return f"[PATCH ERROR]: {describe_conflicts(result)}"
+        print(f"⚠️  Fix patch did not apply ({describe_conflicts(result)}); regenerating the full file")
+
     prompt = f"""You are a code fixing expert. Fix the following code:
 
 Code to fix:
@@ -22,7 +49,7 @@ Context: {context}
 
 Please provide only the corrected code without explanations:
 """
-    
+
     try:
         result = await run_model_inference("codellama-7b-instruct", prompt, max_tokens=512)
         return result
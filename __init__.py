@@ -2,10 +2,22 @@
 Neural Coding Assistant - AI-powered coding assistance with mesh architecture
 """
 
+import importlib
+
 __version__ = "0.1.0"
 __author__ = "Neural Coding Team"
 
-from .AdministrativeMesh.admin_dispatcher import dispatch
-from .LLM_Mesh.mesh_manager import MeshManager
+# Resolved on first access so importing the package stays cheap
+_LAZY_ATTRIBUTES = {
+    "dispatch": ".AdministrativeMesh.admin_dispatcher",
+    "MeshManager": ".LLM_Mesh.mesh_manager",
+}
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        value = getattr(importlib.import_module(_LAZY_ATTRIBUTES[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 __all__ = ["dispatch", "MeshManager"]
@@ -3,6 +3,8 @@ Configuration for function signatures and task mappings.
 Single source of truth for worker function definitions.
 """
 
+import os
+
 # Function signatures for each task type
 FUNCTION_SIGNATURES = {
     "debug": "def debug_code_snippet(code_str: str, error_msg: str) -> str:",
@@ -30,6 +32,250 @@ WORKER_ENDPOINTS = {
     "refactor": "http://localhost:8005/refactor"
 }
 
+# Repository indexing for dispatch context (disabled when no workspace root is set)
+CODE_INDEX_SETTINGS = {
+    "root": os.environ.get("NCA_WORKSPACE_ROOT", ""),
+    "exclude_dirs": ["__pycache__", "venv", "node_modules", "build", "dist", "models"],
+    "parallel_threshold": 64,  # Below this many files the process pool costs more than it saves
+    "max_chunks": 5,
+    "max_chars": 6000,
+    "refresh_interval": 10.0  # Seconds between rescans of the workspace during dispatch
+}
+
+# Local semantic index over AgentMemory and repository chunks (requires numpy)
+VECTOR_INDEX_SETTINGS = {
+    "enabled": True,
+    "path": ".cache/vector_index",
+    "memory_dir": "NeuralCodingAssistant/AgentMemory",
+    "dim": 512,
+    "initial_capacity": 1024,
+    "ivf_threshold": 4096,  # Corpus size at which searches switch to coarse partitions
+    "nprobe": 8,
+    "top_k": 3,
+    "min_score": 0.1,
+    "compact_ratio": 0.25,  # Share of tombstoned rows at which the matrix is compacted
+    "sync_interval": 30.0  # Seconds between re-syncs of AgentMemory and repository chunks
+}
+
+# Administrative council voting (admin models queried concurrently)
+COUNCIL_SETTINGS = {
+    "enabled": False,
+    "members": [
+        {"model": "deepseek-llm-67b-chat", "weight": 1.0},
+        {"model": "qwen1.5-72b-chat", "weight": 1.0},
+        {"model": "llama-2-70b-chat", "weight": 0.8}
+    ],
+    "timeout": 20.0,  # Per-member timeout in seconds
+    "preferred_bonus": 1.25,  # Weight multiplier for the admin select_admin would pick
+    "quorum": 0.5,  # Fraction of total weight one choice needs to end the vote
+    "decisive_margin": None  # Optional lead (fraction of total weight) that ends the vote
+}
+
+# Per-model inference executors for local GGUF models
+MODEL_EXECUTOR_SETTINGS = {
+    # Keep max_concurrency at 1 for in-process llama.cpp models: a Llama instance is not thread-safe
+    "default": {"max_concurrency": 1, "max_queue": 8},
+    "overrides": {
+        "deepseek-coder-6.7b-instruct": {"max_queue": 16}
+    }
+}
+
+# Hardware auto-tuning for llama.cpp runtime parameters
+RUNTIME_TUNING_SETTINGS = {
+    "profile_path": "AdministrativeMesh/runtime_profiles.json",
+    "batch_sizes": [128, 256, 512, 1024],
+    "context_sizes": [2048, 4096, 8192, 16384],
+    "context_tolerance": 0.1,  # Largest context whose throughput stays within 10% of the best
+    "benchmark_tokens": 64
+}
+
+# Local inference isolation: "thread" runs models in the API process, "process" in supervised workers
+LOCAL_INFERENCE_SETTINGS = {
+    "mode": os.environ.get("NCA_LOCAL_INFERENCE_MODE", "thread"),
+    "start_method": "spawn",  # Forking a process with llama.cpp threads running is unsafe
+    "warm_standby": False,  # Keeps a second preloaded copy of each model (doubles its RAM)
+    "memory_limit_mb": {"default": None},  # Per-model address-space cap for worker processes
+    "load_timeout": 600.0,
+    "request_timeout": 300.0,
+    "abort_poll_interval": 0.1,  # How often a waiting request checks whether its caller gave up
+    "max_restarts": 5,  # Within restart_window seconds before the model is given up on
+    "restart_window": 300.0
+}
+
+# Grammar-constrained decoding: each task's output shape per the Function Courier contract
+OUTPUT_CONSTRAINT_SETTINGS = {
+    "enabled": os.environ.get("NCA_CONSTRAINED_OUTPUT", "0") == "1",
+    "shapes": {
+        "debug": "code_block",  # Annotated code with inline fixes
+        "analyze": "json_report",
+        "fix": "code_block",
+        "fix_helper": "unified_diff",
+        "clean": "code_block",
+        "refactor": "code_block",
+        "optimize": "code_block",
+        "document": "code_block"
+    }
+}
+
+# Adaptive max_tokens and stop sequences learned from recorded output lengths
+GENERATION_LIMIT_SETTINGS = {
+    "path": ".cache/generation_limits.json",
+    "window": 200,  # Recent outputs kept per task type and model
+    "min_samples": 20,  # Fixed defaults apply until this many outputs are recorded
+    "percentile": 95,
+    "headroom": 1.2,
+    "min_tokens": 64,
+    "max_tokens": 4096,
+    "truncation_growth": 1.5,  # A truncated output counts as this multiple of its limit
+    "spillover_markers": ["\nUser:", "\n### Instruction", "\nQuestion:", "<|endoftext|>", "<|im_end|>"],
+    "spillover_min_hits": 3,  # Times a marker must show up before it becomes a stop sequence
+    "blank_line_cut_rate": 0.2,  # Drop the blank-line stop when it cuts this share of outputs short
+    "save_every": 20
+}
+
+# Multi-step plans (analyze → fix → clean) for chat requests instead of a single dispatch
+PLAN_SETTINGS = {
+    "enabled": os.environ.get("NCA_PLANS", "0") == "1",
+    "max_concurrency": 4,  # Independent steps run at once
+    "cache_size": 256  # Memoized step outputs
+}
+
+# Local-first cascade: a small local model answers, the mesh takes what it cannot
+CASCADE_SETTINGS = {
+    "enabled": os.environ.get("NCA_CASCADE", "0") == "1",
+    "local_model": "deepseek-coder-6.7b-instruct",
+    "max_local_input_tokens": 2048,  # Longer inputs go straight to the mesh
+    "min_confidence": 0.55,  # Geometric-mean token probability of the local answer
+    "min_output_chars": 20,
+    "remote_only": []  # Task types that always use the mesh
+}
+
+# Parallel fix candidates verified in resource-limited (not isolated) subprocesses
+CANDIDATE_SETTINGS = {
+    "enabled": os.environ.get("NCA_FIX_CANDIDATES", "0") == "1",
+    "task_types": ["fix"],  # Debug answers are analyses, not code to verify
+    "candidates": 4,  # Generated concurrently with seeds 0..n-1
+    "temperature": 0.8,  # Enough sampling diversity for seeds to matter
+    "max_parallel_verifications": 4,
+    "verify_timeout": 30.0,
+    "cpu_seconds": 20,
+    "memory_mb": 1024,
+    "cache_size": 512
+}
+
+# Quantization variant selection for local models and hosting nodes
+VARIANT_SETTINGS = {
+    "memory_bandwidth_gbps": 20.0,  # CPU decode speed ≈ bandwidth / model size
+    "memory_fraction": 0.8,  # Share of free RAM a local model may use
+    "min_tokens_per_sec": {"default": None}  # Latency targets per model
+}
+
+# Disjoint, NUMA-local CPU sets for co-resident models
+CORE_ALLOCATION_SETTINGS = {
+    "enabled": os.environ.get("NCA_CORE_PINNING", "1") != "0",
+    "reserved_cores": 0  # Kept free for the event loop and I/O
+}
+
+# Background warmup run when the API starts; requests never wait for it
+WARMUP_SETTINGS = {
+    "enabled": os.environ.get("NCA_WARMUP", "1") != "0",
+    "probe_hosts": True,  # Health-check distributed model hosts
+    "preload_models": []  # Local models to load ahead of the first request
+}
+
+# One deadline per request, carried to every layer; only host calls are retried
+DEADLINE_SETTINGS = {
+    "request_timeout": float(os.environ.get("NCA_REQUEST_TIMEOUT", "30")),  # Seconds per chat request
+    "host_timeout": 60.0,  # Cap for a single host call when no deadline is set
+    "host_retries": 2,  # Further hosts tried while budget remains
+    "min_attempt_budget": 0.5  # Seconds an attempt needs to be worth starting
+}
+
+# Background batch jobs (JSONL uploads); they only use capacity interactive requests leave idle
+BATCH_SETTINGS = {
+    "directory": ".cache/batch_jobs",  # One JSON record per job
+    "concurrency": int(os.environ.get("NCA_BATCH_CONCURRENCY", "2")),  # Tasks in flight per job
+    "max_tasks": 5000,
+    "task_timeout": 120.0,
+    "interactive_headroom": 0,  # Interactive requests in flight before batch work pauses
+    "idle_poll_interval": 0.2,
+    "lease_interval": 5.0,  # Multi-worker: seconds between batch_runner lease renewals
+    "shared_poll_interval": 1.0  # Multi-worker: record polling when streaming another worker's job
+}
+
+# Per API key admission control at the REST gateway
+RATE_LIMIT_SETTINGS = {
+    "enabled": os.environ.get("NCA_RATE_LIMIT", "1") != "0",
+    "backend": os.environ.get("NCA_RATE_LIMIT_BACKEND", "memory"),  # "memory" or "sqlite" (shared by workers)
+    "sqlite_path": ".cache/rate_limits.sqlite",
+    "default_limits": {
+        "requests_per_sec": 2.0,
+        "request_burst": 10,
+        "tokens_per_min": 60000
+    },
+    "key_limits": {},  # API key → overrides of default_limits
+    # Keys clients may present (as well as those in key_limits); other callers are limited by address
+    "api_keys": [key.strip() for key in os.environ.get("NCA_API_KEYS", "").split(",") if key.strip()],
+    "bucket_sweep_interval": 60.0,  # Seconds between drops of buckets that have refilled to capacity
+    "default_completion_tokens": 1000  # Reserved when a request sets no max_tokens
+}
+
+# WebSocket editor sessions: files uploaded once, then kept in sync with edits
+EDITOR_SESSION_SETTINGS = {
+    "max_sessions": 200,
+    "max_files": 50,  # Per session
+    "max_file_chars": 2_000_000,
+    "idle_timeout": 3600.0  # Seconds before an unused session is dropped
+}
+
+# Multi-worker gateway: workers share host health, breakers and the response cache
+SHARED_STATE_SETTINGS = {
+    "enabled": bool(os.environ.get("NCA_SHARED_STATE")),  # Set by `rest_api --workers N`
+    "path": os.environ.get("NCA_SHARED_STATE") or ".cache/gateway_state.sqlite",
+    "sync_interval": 1.0,  # Seconds between host table reads per worker
+    "probe_interval": 300.0,  # Host probes, run by the lease holder only
+    "response_cache_ttl": 300.0  # Deterministic (temperature 0) chat responses
+}
+
+# Whole-codebase cleanup: archive in, per-file diffs streamed out
+CODEBASE_CLEAN_SETTINGS = {
+    "max_archive_bytes": 200 * 1024 * 1024,
+    "max_file_bytes": 1024 * 1024,  # Larger files (generated, vendored) are skipped
+    "max_files": 5000,
+    "max_chunk_tokens": 1500,  # Large files are split at top-level definitions
+    "parallel_files": int(os.environ.get("NCA_CLEAN_PARALLEL", 8)),
+    "extensions": [".py", ".js", ".ts", ".java", ".go", ".rs", ".c", ".cpp", ".h"],
+    # Fence language named in the cleanup prompt; only Python is grammar-constrained and parse-checked
+    "languages": {".py": "python", ".js": "javascript", ".ts": "typescript", ".java": "java",
+                  ".go": "go", ".rs": "rust", ".c": "c", ".cpp": "cpp", ".h": "c"},
+    "skip_dirs": [".git", "node_modules", "__pycache__", "venv", ".venv", "build", "dist"]
+}
+
+# Diff-mode fixes: the model returns a patch and fixer_helper applies it
+PATCH_SETTINGS = {
+    "fuzz_threshold": 0.8,  # Lowest similarity at which a hunk's context may be placed
+    "search_window": 200,  # Lines either side of the hinted line searched for a similar match
+    "min_fuzzy_lines": 3,  # Non-blank context lines a hunk needs before it may be placed by similarity
+    "ambiguity_margin": 0.02,  # A second window this close to the best match makes it a conflict
+    "diff_max_tokens": 256,  # Until generation_limits has learned fix_diff lengths
+    "fallback_to_full": True  # Regenerate the whole file when a patch does not apply cleanly
+}
+
+# Priority classes and weighted fair queuing in front of the model hosts
+SCHEDULER_SETTINGS = {
+    "enabled": os.environ.get("NCA_SCHEDULER", "1") == "1",
+    "slots_per_host": 2,  # Concurrent requests per available host before requests queue
+    "default_class": "chat",
+    "classes": {
+        # max_wait: seconds after which a request goes first regardless of weights
+        "interactive": {"weight": 8.0, "max_wait": 1.0, "slo_ms": 1000},
+        "chat": {"weight": 4.0, "max_wait": 5.0, "slo_ms": 10000},
+        "batch": {"weight": 1.0, "max_wait": 60.0, "slo_ms": 120000, "max_share": 0.5}
+    },
+    "tenant_weights": {},  # API key → weight within its class
+    "metrics_window": 1000  # Recent requests per class used for the percentiles
+}
+
 def get_function_signature_from_config(task_type: str) -> str:
     """Get function signature from configuration."""
     return FUNCTION_SIGNATURES.get(task_type, "def process_code(code_str: str) -> str:")
@@ -0,0 +1,198 @@
+"""
+Editor Sessions
+===============
+
+Persistent editor sessions over WebSocket. The editor uploads a workspace file
+once, then sends only its edits; the server keeps the reconstructed file per
+session and builds each request from it. Upload and parse cost per request is
+proportional to the edit, not the file.
+
+Protocol (JSON messages):
+
+    → {"type": "open", "path": "a.py", "content": "..."}
+    ← {"type": "opened", "path": "a.py", "version": 1, "sha256": "..."}
+    → {"type": "edit", "path": "a.py", "version": 1,
+       "edits": [{"offset": 10, "length": 3, "text": "new"}]}       # or
+       "edits": [{"range": {"start": {"line": 0, "character": 4},
+                            "end": {"line": 0, "character": 7}}, "text": "new"}]
+    ← {"type": "ack", "path": "a.py", "version": 2}
+    → {"type": "request", "id": "r1", "prompt": "Fix this", "path": "a.py",
+       "selection": {"start": {...}, "end": {...}}}                  # selection optional
+    ← {"type": "result", "id": "r1", "content": "..."}
+    → {"type": "cancel", "id": "r1"}
+    → {"type": "close", "path": "a.py"}
+
+Edits against a stale version are refused with ``version_mismatch`` and the
+current version; the editor then re-sends the whole file with ``open``.
+Reconnecting with ``?session_id=...`` resumes the same file state. Session ids
+are issued by the server and a session can only be resumed with the API key
+that created it; any other id gets a new session. Sessions are held by one
+gateway worker; the first ``session`` message says whether the state was
+resumed, and when it was not the editor re-opens its files. Requests cannot
+carry tests: fix candidates are only checked against tests held by the server.
+"""
+
+import hashlib
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from config import EDITOR_SESSION_SETTINGS
+
+class SessionError(Exception):
+    """A protocol error reported back to the editor."""
+
+    def __init__(self, code: str, message: str, **details):
+        super().__init__(message)
+        self.code = code
+        self.details = details
+
+def error_message(error: SessionError, **extra) -> Dict[str, Any]:
+    return {"type": "error", "code": error.code, "message": str(error), **error.details, **extra}
+
+def content_sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def line_offsets(text: str) -> List[int]:
+    """Offset at which each line starts."""
+    offsets = [0]
+    index = text.find("\n")
+    while index != -1:
+        offsets.append(index + 1)
+        index = text.find("\n", index + 1)
+    return offsets
+
+def position_to_offset(offsets: List[int], text: str, position: Dict[str, int]) -> int:
+    """Editor (line, character) position → string offset, clamped to the text."""
+    line = position.get("line", 0)
+    if line >= len(offsets):
+        return len(text)
+    line_end = offsets[line + 1] - 1 if line + 1 < len(offsets) else len(text)
+    return min(offsets[line] + position.get("character", 0), line_end)
+
+@dataclass
+class EditorFile:
+    """Server-side copy of one open file."""
+    content: str
+    version: int = 1
+
+@dataclass
+class EditorSession:
+    """Files an editor has open, rebuilt from its edits."""
+    id: str
+    owner: Optional[str] = None  # API key that created the session
+    files: Dict[str, EditorFile] = field(default_factory=dict)
+    last_used: float = field(default_factory=time.monotonic)
+    bytes_received: int = 0
+
+    def open_file(self, path: str, content: str) -> EditorFile:
+        if len(content) > EDITOR_SESSION_SETTINGS["max_file_chars"]:
+            raise SessionError("file_too_large", f"{path} exceeds {EDITOR_SESSION_SETTINGS['max_file_chars']} characters")
+        if path not in self.files and len(self.files) >= EDITOR_SESSION_SETTINGS["max_files"]:
+            raise SessionError("too_many_files", f"At most {EDITOR_SESSION_SETTINGS['max_files']} files per session")
+        previous = self.files.get(path)
+        self.files[path] = EditorFile(content, previous.version + 1 if previous else 1)
+        return self.files[path]
+
+    def get_file(self, path: str) -> EditorFile:
+        if path not in self.files:
+            raise SessionError("unknown_file", f"{path} is not open in this session")
+        return self.files[path]
+
+    def apply_edits(self, path: str, version: int, edits: List[Dict[str, Any]]) -> EditorFile:
+        """Apply edits made against ``version``, in order; each is relative to the text before it."""
+        editor_file = self.get_file(path)
+        if version != editor_file.version:
+            raise SessionError("version_mismatch", f"Edit is against version {version}", version=editor_file.version)
+
+        content = editor_file.content
+        for edit in edits:
+            if "offset" in edit:
+                start = edit["offset"]
+                end = start + edit.get("length", 0)
+            else:
+                offsets = line_offsets(content)
+                start = position_to_offset(offsets, content, edit["range"]["start"])
+                end = position_to_offset(offsets, content, edit["range"]["end"])
+            if not 0 <= start <= end <= len(content):
+                raise SessionError("bad_edit", f"Edit {start}-{end} is outside {path}", version=editor_file.version)
+            content = content[:start] + edit.get("text", "") + content[end:]
+
+        if len(content) > EDITOR_SESSION_SETTINGS["max_file_chars"]:
+            raise SessionError("file_too_large", f"{path} exceeds {EDITOR_SESSION_SETTINGS['max_file_chars']} characters")
+        editor_file.content = content
+        editor_file.version += 1
+        return editor_file
+
+    def close_file(self, path: str):
+        self.files.pop(path, None)
+
+    def code_for(self, path: str, selection: Dict[str, Any] = None) -> str:
+        """The file, or just the selected region of it."""
+        content = self.get_file(path).content
+        if not selection:
+            return content
+        offsets = line_offsets(content)
+        start = position_to_offset(offsets, content, selection["start"])
+        end = position_to_offset(offsets, content, selection["end"])
+        return content[start:end]
+
+class EditorSessionManager:
+    """Sessions by id; idle ones expire so abandoned editors do not hold memory."""
+
+    def __init__(self, settings: Dict[str, Any] = None):
+        self.settings = {**EDITOR_SESSION_SETTINGS, **(settings or {})}
+        self.sessions: Dict[str, EditorSession] = {}
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.settings["idle_timeout"]
+        for session_id in [sid for sid, s in self.sessions.items() if s.last_used < cutoff]:
+            del self.sessions[session_id]
+
+    def get_or_create(self, session_id: str = None, owner: str = None) -> EditorSession:
+        """Resume ``owner``'s session ``session_id``, or start a new one with a server-issued id."""
+        self._expire()
+        session = self.sessions.get(session_id) if session_id else None
+        if session is not None and session.owner != owner:
+            session = None  # Someone else's session: never reveal or reuse it
+        if session is None:
+            if len(self.sessions) >= self.settings["max_sessions"]:
+                # Drop the least recently used session
+                oldest = min(self.sessions.values(), key=lambda s: s.last_used)
+                del self.sessions[oldest.id]
+            session = EditorSession(uuid.uuid4().hex, owner)
+            self.sessions[session.id] = session
+        session.last_used = time.monotonic()
+        return session
+
+    def handle_edit_message(self, session: EditorSession, message: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Handle open/edit/close messages; returns the reply, or None for other types."""
+        kind = message.get("type")
+        session.last_used = time.monotonic()
+        if kind == "open":
+            editor_file = session.open_file(message["path"], message.get("content", ""))
+            return {"type": "opened", "path": message["path"], "version": editor_file.version,
+                    "sha256": content_sha256(editor_file.content)}
+        if kind == "edit":
+            editor_file = session.apply_edits(message["path"], message["version"], message.get("edits", []))
+            reply = {"type": "ack", "path": message["path"], "version": editor_file.version}
+            if message.get("sha256") and message["sha256"] != content_sha256(editor_file.content):
+                # The editor's copy and ours disagree; ask for a full re-open
+                reply = {"type": "error", "code": "checksum_mismatch", "path": message["path"],
+                         "version": editor_file.version, "message": "File state diverged; re-open it"}
+            return reply
+        if kind == "close":
+            session.close_file(message["path"])
+            return {"type": "closed", "path": message["path"]}
+        return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "sessions": len(self.sessions),
+            "open_files": sum(len(s.files) for s in self.sessions.values()),
+            "bytes_received": sum(s.bytes_received for s in self.sessions.values())
+        }
+
+# Shared session store for this gateway process
+editor_sessions = EditorSessionManager()
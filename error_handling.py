@@ -4,6 +4,9 @@ Error handling and retry logic for the Neural Coding Assistant.
 
 import asyncio
 import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
 from typing import Dict, Any, Optional, Callable
 from functools import wraps
 
@@ -15,6 +18,14 @@ class TaskExecutionError(Exception):
     """Custom exception for task execution failures."""
     pass
 
+class DeadlineExceeded(TaskExecutionError):
+    """Raised when a request's deadline passes before the work finishes."""
+    pass
+
+class ClientDisconnected(Exception):
+    """Raised when the client goes away before its request finishes."""
+    pass
+
 class RetryConfig:
     """Configuration for retry logic."""
     def __init__(self, max_retries: int = 3, base_delay: float = 1.0, timeout: float = 30.0):
@@ -22,6 +33,29 @@ class RetryConfig:
         self.base_delay = base_delay
         self.timeout = timeout
 
+# Absolute time.monotonic() deadline of the request being served, if any
+_request_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+@contextmanager
+def request_deadline(seconds: float):
+    """Set the deadline for everything awaited inside; a nested deadline can only shorten it."""
+    deadline = time.monotonic() + seconds
+    current = _request_deadline.get()
+    if current is not None:
+        deadline = min(deadline, current)
+    token = _request_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _request_deadline.reset(token)
+
+def time_remaining() -> Optional[float]:
+    """Seconds left before the current request's deadline, or None without one."""
+    deadline = _request_deadline.get()
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
 async def with_timeout_and_retry(
     func: Callable,
     *args,
@@ -29,18 +63,25 @@ async def with_timeout_and_retry(
     fallback_func: Callable = None,
     **kwargs
 ) -> Any:
-    """Execute function with timeout and retry logic."""
+    """
+    Execute function with timeout and retry logic.
+    Within a request deadline, attempts are capped to the remaining budget and
+    no retry starts once the budget cannot cover its backoff.
+    """
     if retry_config is None:
         retry_config = RetryConfig()
     
     last_exception = None
     
     for attempt in range(retry_config.max_retries + 1):
+        remaining = time_remaining()
+        if remaining is not None and remaining <= 0:
+            raise DeadlineExceeded(f"Deadline exceeded after {attempt} attempts: {str(last_exception)}")
         try:
             # Apply timeout to the function
             result = await asyncio.wait_for(
                 func(*args, **kwargs),
-                timeout=retry_config.timeout
+                timeout=retry_config.timeout if remaining is None else min(retry_config.timeout, remaining)
             )
             
             if attempt > 0:
@@ -48,6 +89,10 @@ async def with_timeout_and_retry(
             
             return result
             
+        except asyncio.CancelledError:
+            # The caller abandoned the work; never retry it
+            raise
+            
         except asyncio.TimeoutError as e:
             last_exception = e
             logger.warning(f"Timeout on attempt {attempt + 1}/{retry_config.max_retries + 1}")
@@ -59,6 +104,9 @@ async def with_timeout_and_retry(
         # Wait before retry (exponential backoff)
         if attempt < retry_config.max_retries:
             delay = retry_config.base_delay * (2 ** attempt)
+            remaining = time_remaining()
+            if remaining is not None and remaining <= delay:
+                raise DeadlineExceeded(f"Deadline exceeded after {attempt + 1} attempts: {str(last_exception)}")
             await asyncio.sleep(delay)
     
     # All retries failed, try fallback if available
@@ -79,6 +127,8 @@ def handle_errors(fallback_message: str = None):
         async def wrapper(*args, **kwargs):
             try:
                 return await func(*args, **kwargs)
+            except asyncio.CancelledError:
+                raise
             except Exception as e:
                 logger.error(f"Error in {func.__name__}: {str(e)}")
                 if fallback_message:
@@ -87,6 +137,31 @@ def handle_errors(fallback_message: str = None):
         return wrapper
     return decorator
 
+async def run_until_disconnected(
+    coro,
+    is_disconnected: Callable,
+    poll_interval: float = 0.05
+) -> Any:
+    """
+    Await a coroutine, cancelling it as soon as ``is_disconnected()`` reports the
+    client has gone. Cancellation propagates through the coroutine down to the
+    nodes, which abort their generations.
+    """
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                return task.result()
+            if await is_disconnected():
+                task.cancel()
+                # Give the cancellation a moment to reach the nodes
+                await asyncio.wait({task}, timeout=1.0)
+                raise ClientDisconnected("Client disconnected before the request finished")
+    finally:
+        if not task.done():
+            task.cancel()
+
 async def safe_subprocess_call(command: list, timeout: float = 30.0) -> tuple[str, str, int]:
     """Safely execute subprocess with timeout and error handling."""
     try:
@@ -113,23 +188,43 @@ async def safe_subprocess_call(command: list, timeout: float = 30.0) -> tuple[st
         raise TaskExecutionError(f"Subprocess execution failed: {str(e)}")
 
 class CircuitBreaker:
-    """Simple circuit breaker for failing services."""
+    """
+    Simple circuit breaker for failing services.
+    With a shared ``store`` (multi-worker gateway), every worker sees the same state.
+    """
     
-    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 60.0):
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 60.0,
+                 name: str = None, store=None):
         self.failure_threshold = failure_threshold
         self.recovery_timeout = recovery_timeout
         self.failure_count = 0
         self.last_failure_time = None
         self.state = "CLOSED"  # CLOSED, OPEN, HALF_OPEN
+        self.name = name
+        self.store = store if name else None
+    
+    async def _load(self):
+        if self.store is not None:
+            shared = await self.store.run(self.store.load_breaker, self.name)
+            if shared:
+                self.state = shared["state"]
+                self.failure_count = shared["failure_count"]
+                self.last_failure_time = shared["last_failure_time"]
+    
+    def _save(self):
+        if self.store is not None:
+            self.store.submit(self.store.save_breaker, self.name, self.state, self.failure_count, self.last_failure_time)
     
     async def call(self, func: Callable, *args, **kwargs):
         """Execute function through circuit breaker."""
+        await self._load()
         if self.state == "OPEN":
             if self.last_failure_time and (
-                asyncio.get_event_loop().time() - self.last_failure_time > self.recovery_timeout
+                time.time() - self.last_failure_time > self.recovery_timeout
             ):
                 self.state = "HALF_OPEN"
                 logger.info("Circuit breaker moving to HALF_OPEN state")
+                self._save()
             else:
                 raise TaskExecutionError("Circuit breaker is OPEN - service unavailable")
         
@@ -140,15 +235,18 @@ class CircuitBreaker:
                 self.state = "CLOSED"
                 self.failure_count = 0
                 logger.info("Circuit breaker reset to CLOSED state")
+                self._save()
             
             return result
             
         except Exception as e:
             self.failure_count += 1
-            self.last_failure_time = asyncio.get_event_loop().time()
+            # Wall-clock time, so other processes can compare against it
+            self.last_failure_time = time.time()
             
             if self.failure_count >= self.failure_threshold:
                 self.state = "OPEN"
                 logger.warning(f"Circuit breaker opened after {self.failure_count} failures")
+            self._save()
             
             raise e
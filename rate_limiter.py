@@ -0,0 +1,223 @@
+"""
+Rate Limiter
+============
+
+Admission control for the REST gateway. Every API key gets two token buckets:
+- requests: ``requests_per_sec`` refill with a ``request_burst`` capacity,
+- model tokens: ``tokens_per_min`` refill and capacity.
+
+A chat request reserves its estimated prompt tokens plus its completion budget
+up front. Once the answer is known the reservation is settled against the
+real count. Over-limit requests are refused at once with the number of
+seconds until they would fit, which the gateway sends as ``Retry-After``.
+
+Only keys listed in ``api_keys`` or ``key_limits`` are trusted; any other
+caller is limited by its address, so made-up keys cannot mint fresh buckets.
+Buckets live in process memory by default. With the ``sqlite`` backend they
+are kept in a shared SQLite file so several gateway workers enforce one limit.
+Buckets that have refilled to capacity are dropped, since a new bucket starts
+full anyway.
+"""
+
+import asyncio
+import functools
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from config import RATE_LIMIT_SETTINGS
+from LLM_Mesh.prompt_packer import estimate_tokens
+
+project_root = os.path.dirname(os.path.abspath(__file__))
+
+def refill(level: float, updated: float, capacity: float, rate: float, now: float) -> float:
+    """Bucket level after refilling at ``rate`` per second since ``updated``."""
+    return min(capacity, level + max(0.0, now - updated) * rate)
+
+def full_at(level: float, capacity: float, rate: float, now: float) -> float:
+    """When a bucket at ``level`` will have refilled to ``capacity``."""
+    if level >= capacity:
+        return now
+    return now + (capacity - level) / rate if rate > 0 else math.inf
+
+class MemoryBackend:
+    """Buckets in a dict; per-process."""
+
+    def __init__(self, sweep_interval: float = None):
+        self.buckets: Dict[str, Tuple[float, float, float]] = {}  # key → (level, updated, full at)
+        self.lock = threading.Lock()
+        self.sweep_interval = RATE_LIMIT_SETTINGS["bucket_sweep_interval"] if sweep_interval is None else sweep_interval
+        self.last_sweep = 0.0
+
+    def _store(self, key: str, level: float, capacity: float, rate: float, now: float):
+        self.buckets[key] = (level, now, full_at(level, capacity, rate, now))
+        if now - self.last_sweep >= self.sweep_interval:
+            self.last_sweep = now
+            for idle in [k for k, (_, _, full) in self.buckets.items() if full <= now and k != key]:
+                del self.buckets[idle]
+
+    def take(self, key: str, amount: float, capacity: float, rate: float, now: float) -> float:
+        """Take ``amount`` if the bucket holds it; otherwise return seconds until it would."""
+        with self.lock:
+            level, updated, _ = self.buckets.get(key, (capacity, now, now))
+            level = refill(level, updated, capacity, rate, now)
+            if level >= amount:
+                self._store(key, level - amount, capacity, rate, now)
+                return 0.0
+            self._store(key, level, capacity, rate, now)
+            return (amount - level) / rate if rate > 0 else math.inf
+
+    def give(self, key: str, amount: float, capacity: float, rate: float, now: float):
+        """Return (or, when negative, charge) tokens; a bucket may go into debt."""
+        with self.lock:
+            level, updated, _ = self.buckets.get(key, (capacity, now, now))
+            self._store(key, min(capacity, refill(level, updated, capacity, rate, now) + amount), capacity, rate, now)
+
+class SQLiteBackend:
+    """Buckets in a shared SQLite file, updated in one transaction per call."""
+
+    def __init__(self, path: str, sweep_interval: float = None):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, level REAL, updated REAL, full_at REAL)"
+        )
+        try:
+            self.connection.execute("ALTER TABLE buckets ADD COLUMN full_at REAL")  # Files from before sweeping
+        except sqlite3.OperationalError:
+            pass
+        self.lock = threading.Lock()
+        self.sweep_interval = RATE_LIMIT_SETTINGS["bucket_sweep_interval"] if sweep_interval is None else sweep_interval
+        self.last_sweep = 0.0
+
+    def _update(self, key: str, capacity: float, rate: float, now: float, change) -> float:
+        with self.lock:
+            cursor = self.connection.cursor()
+            cursor.execute("BEGIN IMMEDIATE")  # Serializes workers touching the same buckets
+            try:
+                row = cursor.execute("SELECT level, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+                level = refill(row[0], row[1], capacity, rate, now) if row else capacity
+                level, wait = change(level)
+                cursor.execute(
+                    "INSERT INTO buckets (key, level, updated, full_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET level = excluded.level, updated = excluded.updated, "
+                    "full_at = excluded.full_at",
+                    (key, level, now, full_at(level, capacity, rate, now))
+                )
+                if now - self.last_sweep >= self.sweep_interval:
+                    self.last_sweep = now
+                    cursor.execute("DELETE FROM buckets WHERE full_at IS NULL OR full_at <= ?", (now,))
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+        return wait
+
+    def take(self, key: str, amount: float, capacity: float, rate: float, now: float) -> float:
+        def change(level):
+            if level >= amount:
+                return level - amount, 0.0
+            return level, (amount - level) / rate if rate > 0 else math.inf
+        return self._update(key, capacity, rate, now, change)
+
+    def give(self, key: str, amount: float, capacity: float, rate: float, now: float):
+        self._update(key, capacity, rate, now, lambda level: (min(capacity, level + amount), 0.0))
+
+class RateLimiter:
+    """Per API key request and model-token buckets."""
+
+    def __init__(self, settings: Dict[str, Any] = None, backend=None):
+        self.settings = {**RATE_LIMIT_SETTINGS, **(settings or {})}
+        if backend is None:
+            if self.settings["backend"] == "sqlite":
+                backend = SQLiteBackend(os.path.join(project_root, self.settings["sqlite_path"]),
+                                        self.settings["bucket_sweep_interval"])
+            else:
+                backend = MemoryBackend(self.settings["bucket_sweep_interval"])
+        self.backend = backend
+        self.rejected: Dict[str, int] = {}
+
+    def limits_for(self, api_key: str) -> Dict[str, float]:
+        return {**self.settings["default_limits"], **self.settings["key_limits"].get(api_key, {})}
+
+    def acquire(self, api_key: str, tokens: int = 0, now: float = None) -> Optional[float]:
+        """Admit a request costing ``tokens``; returns seconds to wait when over the limit."""
+        now = time.time() if now is None else now
+        limits = self.limits_for(api_key)
+
+        wait = self.backend.take(f"{api_key}:requests", 1, limits["request_burst"], limits["requests_per_sec"], now)
+        if wait == 0 and tokens:
+            per_min = limits["tokens_per_min"]
+            # A single request larger than the whole bucket is charged the full bucket
+            wait = self.backend.take(f"{api_key}:tokens", min(tokens, per_min), per_min, per_min / 60.0, now)
+            if wait:
+                # Refused on tokens: give back the request slot
+                self.backend.give(f"{api_key}:requests", 1, limits["request_burst"], limits["requests_per_sec"], now)
+        if wait:
+            self.rejected[api_key] = self.rejected.get(api_key, 0) + 1
+            return wait
+        return None
+
+    def settle(self, api_key: str, reserved: int, actual: int, now: float = None):
+        """Correct a reservation once the real token count is known."""
+        if reserved == actual:
+            return
+        now = time.time() if now is None else now
+        per_min = self.limits_for(api_key)["tokens_per_min"]
+        self.backend.give(f"{api_key}:tokens", min(reserved, per_min) - actual, per_min, per_min / 60.0, now)
+
+    async def run(self, method, *args):
+        """Call ``acquire`` or ``settle`` from async code; SQLite calls run on a thread."""
+        if isinstance(self.backend, MemoryBackend):
+            return method(*args)
+        return await asyncio.get_running_loop().run_in_executor(None, functools.partial(method, *args))
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"backend": self.settings["backend"], "rejected": dict(self.rejected)}
+
+def retry_after_header(wait: float) -> str:
+    """Whole seconds, rounded up, as Retry-After expects."""
+    return str(max(1, math.ceil(wait))) if math.isfinite(wait) else "3600"
+
+def estimate_chat_tokens(body: bytes, default_completion_tokens: int = None) -> Tuple[int, int]:
+    """(prompt tokens, tokens to reserve) for a chat completions body."""
+    try:
+        payload = json.loads(body or b"{}")
+    except ValueError:
+        return 0, 0
+    if not isinstance(payload, dict):
+        return 0, 0
+    prompt_tokens = 0
+    for message in payload.get("messages") or []:
+        content = message.get("content") if isinstance(message, dict) else None
+        # Content may also be a list of parts
+        prompt_tokens += estimate_tokens(content if isinstance(content, str) else json.dumps(content or ""))
+    completion = payload.get("max_tokens") or default_completion_tokens or RATE_LIMIT_SETTINGS["default_completion_tokens"]
+    return prompt_tokens, prompt_tokens + int(completion)
+
+def get_api_key(headers, client_host: str = None, settings: Dict[str, Any] = None) -> str:
+    """
+    Configured API key from ``Authorization: Bearer`` or ``X-API-Key``; the
+    client address for unknown or missing keys.
+    """
+    settings = settings or RATE_LIMIT_SETTINGS
+    authorization = headers.get("authorization", "")
+    presented = authorization[7:].strip() if authorization.lower().startswith("bearer ") else ""
+    presented = presented or headers.get("x-api-key", "")
+    if presented and (presented in settings["api_keys"] or presented in settings["key_limits"]):
+        return presented
+    return f"ip:{client_host or 'unknown'}"
+
+# Shared limiter for this gateway process
+_rate_limiter: Optional[RateLimiter] = None
+
+def get_rate_limiter() -> RateLimiter:
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = RateLimiter()
+    return _rate_limiter
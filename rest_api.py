@@ -1,17 +1,33 @@
-from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, Request, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import asyncio
+import hashlib
+import json
 import sys
 import os
 import logging
+from dataclasses import asdict
 
 # Add project root to path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from AdministrativeMesh.admin_dispatcher import dispatch
-from error_handling import handle_errors, with_timeout_and_retry, RetryConfig
+from startup_profiler import profile_phase, get_startup_profile
+
+with profile_phase("import_dispatcher"):
+    from AdministrativeMesh.admin_dispatcher import dispatch, dispatch_planned
+from AdministrativeMesh.warmup import start_background_warmup, get_warmup_status
+from AdministrativeMesh.batch_jobs import get_batch_manager, interactive_request
+from LLM_Mesh.model_variants import get_serving_variants
+from LLM_Mesh.core_allocator import core_allocator
+from LLM_Mesh.prompt_packer import estimate_tokens, get_packer_stats
+from LLM_Mesh.request_scheduler import request_priority, request_scheduler
+from error_handling import request_deadline, run_until_disconnected, time_remaining, ClientDisconnected
+from config import DEADLINE_SETTINGS, PLAN_SETTINGS, RATE_LIMIT_SETTINGS, SHARED_STATE_SETTINGS
+from rate_limiter import estimate_chat_tokens, get_api_key, get_rate_limiter, retry_after_header
+from editor_sessions import SessionError, editor_sessions, error_message
+from shared_state import get_shared_store, run_probe_loop, worker_id
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -32,16 +48,59 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Endpoints that start model work and so count against a client's limits
+RATE_LIMITED_PATHS = {"/v1/chat/completions", "/v1/batches"}
+
+@app.middleware("http")
+async def rate_limit(request: Request, call_next):
+    """Refuse over-limit clients with a fast 429 before any work starts."""
+    if not RATE_LIMIT_SETTINGS["enabled"] or request.method != "POST" or request.url.path not in RATE_LIMITED_PATHS:
+        return await call_next(request)
+    
+    api_key = get_api_key(request.headers, request.client.host if request.client else None)
+    prompt_tokens, reserved = 0, 0
+    if request.url.path == "/v1/chat/completions":
+        prompt_tokens, reserved = estimate_chat_tokens(await request.body())
+    
+    limiter = get_rate_limiter()
+    wait = await limiter.run(limiter.acquire, api_key, reserved)
+    if wait is not None:
+        logger.info(f"Rate limited {api_key}: retry after {wait:.2f}s")
+        return JSONResponse(
+            {"error": {"message": "Rate limit exceeded", "type": "rate_limit_exceeded"}},
+            status_code=429,
+            headers={"Retry-After": retry_after_header(wait)}
+        )
+    request.state.rate_limit = (api_key, reserved, prompt_tokens)
+    return await call_next(request)
+
+@app.on_event("startup")
+async def warm_up():
+    """Start warmup in the background so the server accepts requests immediately."""
+    store = get_shared_store()
+    if store is not None:
+        # Multi-worker mode: share host state; only the probe lease holder probes hosts
+        from LLM_Mesh.distributed_models import model_registry
+        model_registry.attach_shared_store(store)
+        app.state.probe_loop = asyncio.create_task(run_probe_loop(model_registry, store))
+        start_background_warmup({"probe_hosts": False})
+    else:
+        start_background_warmup()
+    get_batch_manager().start()  # Resume batch jobs left unfinished by the last run
+
 class ChatPayload(BaseModel):
     messages: list
     model: str
     temperature: float = 0.7
     stream: bool = False
 
+# No @handle_errors: it would turn the HTTPExceptions below (400, 499, 504) into 200s
 @app.post("/v1/chat/completions")
-@handle_errors("[ERROR]: Chat completion failed")
-async def route_chat(payload: ChatPayload):
+async def route_chat(payload: ChatPayload, request: Request):
     """OpenAI-compatible chat completions endpoint with enhanced error handling."""
+    rate_limit = getattr(request.state, "rate_limit", None)
+    prompt_tokens = rate_limit[2] if rate_limit else 0
+    used = 0  # Tokens the reservation is settled at; none unless an answer is produced
     try:
         if not payload.messages or len(payload.messages) == 0:
             raise HTTPException(status_code=400, detail="No messages provided")
@@ -50,45 +109,81 @@ async def route_chat(payload: ChatPayload):
         if not prompt or not prompt.strip():
             raise HTTPException(status_code=400, detail="Empty prompt provided")
         
-        # Use retry logic for dispatch
-        retry_config = RetryConfig(max_retries=2, timeout=30.0)
-        result = await with_timeout_and_retry(
-            dispatch,
-            prompt,
-            retry_config=retry_config
-        )
+        # Deterministic requests can be answered from the cache shared by all workers
+        store = get_shared_store()
+        cache_key = f"chat:{hash_prompt(payload.messages)}" if store is not None and payload.temperature == 0 else None
+        result = await store.run(store.cache_get, cache_key) if cache_key else None
+        if result is not None:
+            used = prompt_tokens  # No generation for a cached answer
+            return chat_response(payload, prompt, result)
         
-        if payload.stream:
-            return StreamingResponse(
-                event_stream(result), 
-                media_type="text/event-stream"
+        # One deadline for the whole request; host calls retry within it.
+        # Stop all work if the client disconnects.
+        # CI and other bulk callers may opt down to the batch class
+        priority_class = "batch" if request.headers.get("x-priority") == "batch" else "chat"
+        api_key = get_api_key(request.headers, request.client.host if request.client else None)
+        # Optionally run the multi-step plan and answer with its final step
+        run = dispatch_planned if PLAN_SETTINGS["enabled"] else dispatch
+        with request_deadline(DEADLINE_SETTINGS["request_timeout"]), interactive_request(), \
+                request_priority(priority_class, api_key):
+            result = await run_until_disconnected(
+                asyncio.wait_for(run(prompt), time_remaining()),
+                request.is_disconnected
             )
+        used = prompt_tokens + estimate_tokens(result)
         
-        return {
-            "choices": [{
-                "message": {
-                    "role": "assistant",
-                    "content": result
-                },
-                "index": 0,
-                "finish_reason": "stop"
-            }],
-            "model": payload.model,
-            "usage": {
-                "prompt_tokens": len(prompt.split()),
-                "completion_tokens": len(result.split()),
-                "total_tokens": len(prompt.split()) + len(result.split())
-            },
-            "id": f"chatcmpl-{hash(prompt)}",
-            "object": "chat.completion",
-            "created": int(asyncio.get_event_loop().time())
-        }
+        if cache_key and not result.startswith("[ERROR]"):
+            store.submit(store.cache_set, cache_key, result, SHARED_STATE_SETTINGS["response_cache_ttl"])
+        
+        return chat_response(payload, prompt, result)
         
     except HTTPException:
         raise
+    except ClientDisconnected:
+        logger.info("Client disconnected - request cancelled")
+        raise HTTPException(status_code=499, detail="Client closed request")
+    except asyncio.TimeoutError:
+        logger.warning(f"Request deadline of {DEADLINE_SETTINGS['request_timeout']}s exceeded")
+        raise HTTPException(status_code=504, detail="Request deadline exceeded")
     except Exception as e:
         logger.error(f"Chat completion error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+    finally:
+        # Settle the token reservation against what was actually generated, on every path
+        if rate_limit:
+            limiter = get_rate_limiter()
+            await limiter.run(limiter.settle, rate_limit[0], rate_limit[1], used)
+
+def hash_prompt(messages: list) -> str:
+    return hashlib.sha256(json.dumps(messages, sort_keys=True).encode("utf-8")).hexdigest()
+
+def chat_response(payload: ChatPayload, prompt: str, result: str):
+    """OpenAI-style completion body, or an event stream of it."""
+    if payload.stream:
+        return StreamingResponse(
+            event_stream(result), 
+            media_type="text/event-stream"
+        )
+    
+    return {
+        "choices": [{
+            "message": {
+                "role": "assistant",
+                "content": result
+            },
+            "index": 0,
+            "finish_reason": "stop"
+        }],
+        "model": payload.model,
+        "usage": {
+            "prompt_tokens": len(prompt.split()),
+            "completion_tokens": len(result.split()),
+            "total_tokens": len(prompt.split()) + len(result.split())
+        },
+        "id": f"chatcmpl-{hash(prompt)}",
+        "object": "chat.completion",
+        "created": int(asyncio.get_event_loop().time())
+    }
 
 async def event_stream(result: str):
     """Stream response for real-time updates."""
@@ -119,13 +214,160 @@ async def event_stream(result: str):
     yield f"data: {final_chunk}\n\n"
     yield "data: [DONE]\n\n"
 
+@app.websocket("/v1/editor")
+async def editor_socket(websocket: WebSocket):
+    """Editor session: files are uploaded once, then kept in sync with edits (see editor_sessions)."""
+    await websocket.accept()
+    # Sessions live in this worker's memory; a reconnect that lands on another
+    # worker gets resumed=false and must re-open its files
+    api_key = get_api_key(websocket.headers, websocket.client.host if websocket.client else None)
+    requested = websocket.query_params.get("session_id")
+    session = editor_sessions.get_or_create(requested, owner=api_key)
+    resumed = session.id == requested
+    in_flight = {}  # request id → task
+    send_lock = asyncio.Lock()
+    
+    async def send(message: dict):
+        async with send_lock:
+            await websocket.send_json(message)
+    
+    async def run_request(message: dict):
+        request_id = message.get("id")
+        reserved, used = 0, 0  # Nothing to settle until admitted; nothing charged unless answered
+        try:
+            # Only the instruction is parsed; the code comes from the session's file state
+            code = session.code_for(message["path"], message.get("selection")) if message.get("path") else None
+            prompt = message.get("prompt", "")
+            prompt_tokens = estimate_tokens(prompt) + estimate_tokens(code or "")
+            if RATE_LIMIT_SETTINGS["enabled"]:
+                limiter = get_rate_limiter()
+                wait = await limiter.run(limiter.acquire, api_key,
+                                         prompt_tokens + RATE_LIMIT_SETTINGS["default_completion_tokens"])
+                if wait is not None:
+                    await send({"type": "error", "id": request_id, "code": "rate_limited",
+                                "retry_after": float(retry_after_header(wait))})
+                    return
+                reserved = prompt_tokens + RATE_LIMIT_SETTINGS["default_completion_tokens"]
+            
+            with request_deadline(DEADLINE_SETTINGS["request_timeout"]), interactive_request(), \
+                    request_priority("interactive", api_key):
+                # Client-sent tests are never run: verification is not isolated from this host
+                result = await asyncio.wait_for(dispatch(prompt, code=code), time_remaining())
+            used = prompt_tokens + estimate_tokens(result)
+            await send({"type": "result", "id": request_id, "content": result})
+        except SessionError as e:
+            await send(error_message(e, id=request_id))
+        except asyncio.TimeoutError:
+            await send({"type": "error", "id": request_id, "code": "deadline_exceeded",
+                        "message": "Request deadline exceeded"})
+        except Exception as e:
+            # A bad message or a failed request must still be answered, or the editor waits forever
+            logger.error(f"Editor request {request_id} failed: {str(e)}")
+            try:
+                await send({"type": "error", "id": request_id, "code": "request_failed", "message": str(e)})
+            except Exception:
+                pass  # The socket is gone
+        finally:
+            in_flight.pop(request_id, None)
+            if reserved:
+                limiter = get_rate_limiter()
+                await limiter.run(limiter.settle, api_key, reserved, used)
+    
+    await send({"type": "session", "session_id": session.id, "resumed": resumed,
+                "files": {path: f.version for path, f in session.files.items()}})
+    try:
+        while True:
+            raw = await websocket.receive_text()
+            session.bytes_received += len(raw)
+            try:
+                message = json.loads(raw)
+                kind = message.get("type")
+                if kind == "request":
+                    # Requests run alongside further edits; results arrive by id
+                    in_flight[message.get("id")] = asyncio.ensure_future(run_request(message))
+                elif kind == "cancel":
+                    task = in_flight.get(message.get("id"))
+                    if task:
+                        task.cancel()
+                else:
+                    reply = editor_sessions.handle_edit_message(session, message)
+                    if reply is None:
+                        raise SessionError("unknown_type", f"Unknown message type {kind!r}")
+                    await send(reply)
+            except SessionError as e:
+                await send(error_message(e, path=message.get("path")))
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                await send({"type": "error", "code": "bad_message", "message": str(e)})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # Nobody is left to read these results
+        for task in in_flight.values():
+            task.cancel()
+
+@app.post("/v1/batches")
+async def create_batch(request: Request):
+    """Accept a JSONL body of tasks and run them in the background."""
+    body = (await request.body()).decode("utf-8", errors="replace")
+    try:
+        # The submitter is the fair-queuing tenant, however many jobs it splits work into
+        owner = get_api_key(request.headers, request.client.host if request.client else None)
+        job = get_batch_manager().create_job(body, owner=owner)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return job.summary()
+
+@app.get("/v1/batches")
+async def list_batches():
+    return {"object": "list", "data": get_batch_manager().list_jobs()}
+
+@app.get("/v1/batches/{batch_id}")
+async def get_batch(batch_id: str):
+    job = get_batch_manager().get_job(batch_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Batch {batch_id} not found")
+    return job.summary()
+
+@app.get("/v1/batches/{batch_id}/results")
+async def get_batch_results(batch_id: str, stream: bool = False):
+    """Finished results so far, or with stream=true, NDJSON lines as tasks finish."""
+    manager = get_batch_manager()
+    job = manager.get_job(batch_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Batch {batch_id} not found")
+    if stream:
+        async def result_stream():
+            async for result in manager.stream_results(batch_id):
+                yield json.dumps(result) + "\n"
+        return StreamingResponse(result_stream(), media_type="application/x-ndjson")
+    return {
+        **job.summary(),
+        "results": [asdict(task) for task in job.tasks if task.status != "pending"]
+    }
+
+@app.post("/v1/batches/{batch_id}/cancel")
+async def cancel_batch(batch_id: str):
+    job = await get_batch_manager().cancel_job(batch_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Batch {batch_id} not found")
+    return job.summary()
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint."""
     return {
         "status": "healthy",
         "version": "1.0.0",
-        "timestamp": int(asyncio.get_event_loop().time())
+        "timestamp": int(asyncio.get_event_loop().time()),
+        "warmup": get_warmup_status()["state"],
+        "serving_variants": get_serving_variants(),
+        "cpu_allocation": core_allocator.get_stats(),
+        "rate_limits": get_rate_limiter().get_stats(),
+        "scheduler": request_scheduler.get_stats(),
+        "prompt_packing": get_packer_stats(),
+        "editor_sessions": editor_sessions.get_stats(),
+        "worker": {"id": worker_id(), "shared_state": get_shared_store() is not None},
+        "startup_phases": get_startup_profile()
     }
 
 @app.get("/models")
@@ -142,6 +384,25 @@ async def list_models():
         ]
     }
 
-if __name__ == "__main__":
+def main(argv: list = None):
+    """Run the gateway; with --workers N, the workers share routing state."""
+    import argparse
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8080)
+    
+    parser = argparse.ArgumentParser(description="Neural Coding Assistant API gateway")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=1, help="Gateway processes; try the number of cores")
+    args = parser.parse_args(argv)
+    
+    if args.workers > 1:
+        # Set before the workers import this module, so each one attaches to the same store
+        os.environ.setdefault("NCA_SHARED_STATE", SHARED_STATE_SETTINGS["path"])
+        os.environ.setdefault("NCA_RATE_LIMIT_BACKEND", "sqlite")
+        logger.info(f"Starting {args.workers} gateway workers sharing {os.environ['NCA_SHARED_STATE']}")
+        uvicorn.run("rest_api:app", host=args.host, port=args.port, workers=args.workers)
+    else:
+        uvicorn.run(app, host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
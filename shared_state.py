@@ -0,0 +1,166 @@
+"""
+Shared Gateway State
+====================
+
+Lets several gateway worker processes act as one. Host health, latency and
+availability, circuit breaker state and the response cache live in a local
+SQLite file (WAL mode), which stands in for a shared-memory segment.
+
+Each worker writes what it observes and re-reads the host table at most every
+``sync_interval`` seconds. SQLite calls can wait on another worker's write
+lock, so they never run on the event loop: callers ``await store.run(...)``
+for reads and ``store.submit(...)`` writes, which a single store thread
+applies in order. Host probing is led by whichever worker holds the
+``host_probe`` lease, so N workers do not send N probes.
+"""
+
+import asyncio
+import functools
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from config import SHARED_STATE_SETTINGS
+
+logger = logging.getLogger(__name__)
+
+project_root = os.path.dirname(os.path.abspath(__file__))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS hosts (
+    host_url TEXT PRIMARY KEY, health_score REAL, available INTEGER,
+    last_response_time REAL, checked_at REAL, updated_at REAL
+);
+CREATE TABLE IF NOT EXISTS breakers (
+    name TEXT PRIMARY KEY, state TEXT, failure_count INTEGER, last_failure_time REAL
+);
+CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, expires REAL);
+CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, owner TEXT, expires REAL);
+"""
+
+def _log_write_failure(future):
+    if not future.cancelled() and future.exception():
+        logger.warning(f"Shared state write failed: {future.exception()}")
+
+class SharedStateStore:
+    """SQLite-backed state shared by the gateway workers on one machine."""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")  # State is rebuilt by probes if lost
+        self.connection.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shared-state")
+
+    async def run(self, method: Callable, *args, **kwargs):
+        """Run a store method on the store thread and wait for its result."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(method, *args, **kwargs))
+
+    def submit(self, method: Callable, *args, **kwargs):
+        """Queue a write on the store thread without waiting for it."""
+        future = self.executor.submit(method, *args, **kwargs)
+        future.add_done_callback(_log_write_failure)
+        return future
+
+    def flush(self):
+        """Block until queued writes are applied."""
+        self.executor.submit(lambda: None).result()
+
+    def _execute(self, sql: str, params: tuple = ()):
+        with self.lock:
+            return self.connection.execute(sql, params).fetchall()
+
+    # Host health and latency
+    def publish_host(self, host_url: str, health_score: float, available: bool,
+                     last_response_time: float, checked_at: float = None):
+        self._execute(
+            "INSERT INTO hosts VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(host_url) DO UPDATE SET "
+            "health_score = excluded.health_score, available = excluded.available, "
+            "last_response_time = excluded.last_response_time, "
+            "checked_at = COALESCE(excluded.checked_at, hosts.checked_at), updated_at = excluded.updated_at",
+            (host_url, health_score, int(available), last_response_time, checked_at, time.time())
+        )
+
+    def host_states(self, since: float = 0.0) -> Dict[str, Dict[str, Any]]:
+        rows = self._execute(
+            "SELECT host_url, health_score, available, last_response_time, checked_at, updated_at "
+            "FROM hosts WHERE updated_at > ?", (since,)
+        )
+        return {
+            row[0]: {"health_score": row[1], "available": bool(row[2]), "last_response_time": row[3],
+                     "checked_at": row[4], "updated_at": row[5]}
+            for row in rows
+        }
+
+    # Circuit breakers
+    def save_breaker(self, name: str, state: str, failure_count: int, last_failure_time: Optional[float]):
+        self._execute("INSERT OR REPLACE INTO breakers VALUES (?, ?, ?, ?)",
+                      (name, state, failure_count, last_failure_time))
+
+    def load_breaker(self, name: str) -> Optional[Dict[str, Any]]:
+        rows = self._execute("SELECT state, failure_count, last_failure_time FROM breakers WHERE name = ?", (name,))
+        if not rows:
+            return None
+        return {"state": rows[0][0], "failure_count": rows[0][1], "last_failure_time": rows[0][2]}
+
+    # Response cache
+    def cache_get(self, key: str) -> Optional[Any]:
+        rows = self._execute("SELECT value FROM cache WHERE key = ? AND expires > ?", (key, time.time()))
+        return json.loads(rows[0][0]) if rows else None
+
+    def cache_set(self, key: str, value: Any, ttl: float):
+        now = time.time()
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?)", (key, json.dumps(value), now + ttl))
+            self.connection.execute("DELETE FROM cache WHERE expires <= ?", (now,))
+
+    # Leader leases
+    def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        """Take or renew a lease; True when ``owner`` holds it afterwards."""
+        now = time.time()
+        with self.lock:
+            cursor = self.connection.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                row = cursor.execute("SELECT owner, expires FROM leases WHERE name = ?", (name,)).fetchone()
+                held = row is None or row[0] == owner or row[1] <= now
+                if held:
+                    cursor.execute("INSERT OR REPLACE INTO leases VALUES (?, ?, ?)", (name, owner, now + ttl))
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+        return held
+
+def worker_id() -> str:
+    return f"{os.uname().nodename if hasattr(os, 'uname') else 'local'}:{os.getpid()}"
+
+async def run_probe_loop(registry, store: SharedStateStore, interval: float = None):
+    """Probe hosts whenever this worker holds the probe lease; others read the results."""
+    interval = interval or SHARED_STATE_SETTINGS["probe_interval"]
+    owner = worker_id()
+    while True:
+        if await store.run(store.acquire_lease, "host_probe", owner, interval * 1.5):
+            try:
+                await registry.health_check_all_hosts()
+            except Exception as e:
+                print(f"⚠️  Shared host probe failed: {str(e)}")
+        await asyncio.sleep(interval)
+
+_shared_store: Optional[SharedStateStore] = None
+
+def get_shared_store() -> Optional[SharedStateStore]:
+    """The shared store when multi-worker mode is on, otherwise None."""
+    global _shared_store
+    if _shared_store is None and SHARED_STATE_SETTINGS["enabled"]:
+        _shared_store = SharedStateStore(os.path.join(project_root, SHARED_STATE_SETTINGS["path"]))
+    return _shared_store
@@ -0,0 +1,81 @@
+"""
+Startup Profiler
+================
+
+Shows where startup time goes: per-module import cost, measured in a fresh
+interpreter with ``python -X importtime``, and named startup phases (imports,
+mesh initialization, warmup) recorded while the API runs.
+
+Usage:
+    python startup_profiler.py [module ...]
+"""
+
+import os
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, List
+
+project_root = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_MODULES = ["rest_api", "AdministrativeMesh.admin_dispatcher"]
+
+# Phase name → seconds, filled in as startup progresses
+STARTUP_PHASES: Dict[str, float] = {}
+
+@contextmanager
+def profile_phase(name: str):
+    """Record how long a startup phase takes (works around awaits too)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STARTUP_PHASES[name] = round(time.perf_counter() - start, 4)
+
+def get_startup_profile() -> Dict[str, float]:
+    return dict(STARTUP_PHASES)
+
+def parse_importtime(output: str) -> List[Dict[str, object]]:
+    """Parse ``-X importtime`` output into per-module self/cumulative milliseconds."""
+    entries = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, module = line[len("import time:"):].split("|", 2)
+            entries.append({
+                "module": module.strip(),
+                "self_ms": int(self_us) / 1000,
+                "cumulative_ms": int(cumulative_us) / 1000
+            })
+        except ValueError:
+            continue
+    return entries
+
+def profile_imports(modules: List[str] = None, top: int = 15) -> Dict[str, object]:
+    """Import the modules in a fresh interpreter and report the most expensive imports."""
+    modules = modules or DEFAULT_MODULES
+    code = "; ".join(f"import {module}" for module in modules)
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=project_root,
+        capture_output=True,
+        text=True
+    )
+    elapsed = time.perf_counter() - start
+    entries = parse_importtime(completed.stderr)
+    return {
+        "modules": modules,
+        "wall_time_ms": round(elapsed * 1000, 1),
+        "succeeded": completed.returncode == 0,
+        "slowest": sorted(entries, key=lambda e: e["cumulative_ms"], reverse=True)[:top]
+    }
+
+if __name__ == "__main__":
+    report = profile_imports(sys.argv[1:] or None)
+    print(f"⏱️  Importing {', '.join(report['modules'])}: {report['wall_time_ms']:.0f} ms"
+          + ("" if report["succeeded"] else " (import failed)"))
+    for entry in report["slowest"]:
+        print(f"   {entry['cumulative_ms']:9.1f} ms  {entry['module']}")
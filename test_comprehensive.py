@@ -10,7 +10,22 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from AdministrativeMesh.task_parser import parse_task
 from AdministrativeMesh.function_courier_parser import get_function_signature
-from config import classify_task_by_keywords, get_function_signature_from_config
+from AdministrativeMesh.code_indexer import RepositoryIndexer
+from AdministrativeMesh.vector_index import NUMPY_AVAILABLE, VectorIndex
+from AdministrativeMesh.plan_executor import PlanExecutor, validate_plan
+from AdministrativeMesh import hardware_tuner
+from AdministrativeMesh.model_process_pool import ModelProcessError, ModelProcessSupervisor
+from AdministrativeMesh.model_executor import ModelBusyError, ModelExecutor
+from AdministrativeMesh.vote_system import CouncilMember, concurrent_council_vote
+from LLM_Mesh.prompt_packer import PromptSection, pack_prompt, strip_comments
+from LLM_Mesh import output_grammar
+from LLM_Mesh.generation_limits import GenerationLimits
+from LLM_Mesh.candidate_search import CandidateSearch
+from LLM_Mesh.model_variants import select_variant
+from LLM_Mesh.core_allocator import CoreAllocator, parse_cpulist
+from rate_limiter import RateLimiter, SQLiteBackend, estimate_chat_tokens
+from editor_sessions import EditorSessionManager, SessionError
+from config import RATE_LIMIT_SETTINGS, classify_task_by_keywords, get_function_signature_from_config
 
 class TestTaskClassification:
     """Test task classification and parsing."""
@@ -118,6 +133,1256 @@ class TestErrorHandling:
         assert task["type"] == "refactor"  # default
         assert task["text"] == ""
 
+class TestRepositoryIndexer:
+    """Test repository indexing for dispatch context."""
+    
+    def test_chunks_symbols_and_imports(self, tmp_path):
+        """Test that definitions and imports are indexed."""
+        (tmp_path / "utils.py").write_text("import os\n\ndef helper(x):\n    return x\n\nclass Loader:\n    def load(self):\n        return helper(1)\n")
+        (tmp_path / "main.py").write_text("from utils import helper\n")
+        
+        indexer = RepositoryIndexer(str(tmp_path))
+        assert indexer.build() == 2
+        assert indexer.lookup("helper")[0].source.startswith("def helper")
+        assert indexer.lookup("Loader.load")[0].kind == "function"
+        assert indexer.dependents("utils") == {"main"}
+        
+        relevant = indexer.find_relevant_chunks("Fix the TypeError in Loader.load")
+        assert relevant[0].name == "Loader.load"
+    
+    def test_incremental_refresh(self, tmp_path):
+        """Test that only changed files are re-indexed."""
+        source = tmp_path / "a.py"
+        source.write_text("def old():\n    pass\n")
+        (tmp_path / "b.py").write_text("def other():\n    pass\n")
+        
+        indexer = RepositoryIndexer(str(tmp_path))
+        indexer.build()
+        source.write_text("def new():\n    pass\n")
+        
+        assert indexer.update_file(str(source))
+        assert not indexer.update_file(str(tmp_path / "b.py"))
+        assert indexer.lookup("old") == []
+        assert indexer.lookup("new")
+        
+        source.unlink()
+        assert indexer.refresh()["removed"] == 1
+        assert indexer.lookup("new") == []
+    
+    def test_refresh_is_throttled_and_thread_safe(self, tmp_path):
+        """Test that dispatch-time refreshes are rate limited and safe alongside lookups."""
+        import threading
+        for n in range(20):
+            (tmp_path / f"m{n}.py").write_text(f"def f{n}():\n    pass\n")
+        indexer = RepositoryIndexer(str(tmp_path))
+        assert indexer.refresh_if_stale(60)["added"] == 20
+        (tmp_path / "late.py").write_text("def late():\n    pass\n")
+        assert indexer.refresh_if_stale(60) is None and indexer.lookup("late") == []
+        
+        errors = []
+        def look():
+            try:
+                for _ in range(200):
+                    indexer.find_relevant_chunks("call f3 and late")
+            except Exception as e:
+                errors.append(e)
+        reader = threading.Thread(target=look)
+        reader.start()
+        for _ in range(20):
+            indexer.refresh_if_stale(0)
+        reader.join()
+        assert not errors and indexer.lookup("late")
+    
+    def test_lookups_do_not_wait_for_parsing(self, tmp_path, monkeypatch):
+        """Test that a first build parses outside the lock that lookups take."""
+        import threading
+        from AdministrativeMesh import code_indexer
+        (tmp_path / "a.py").write_text("def a():\n    pass\n")
+        parsing, release = threading.Event(), threading.Event()
+        index_file = code_indexer.index_file
+        
+        def slow_index_file(path, root):
+            parsing.set()
+            release.wait(5)
+            return index_file(path, root)
+        
+        monkeypatch.setattr(code_indexer, "index_file", slow_index_file)
+        indexer = RepositoryIndexer(str(tmp_path))
+        builder = threading.Thread(target=indexer.refresh_if_stale)
+        builder.start()
+        assert parsing.wait(5)
+        assert indexer.lock.acquire(timeout=1)  # Free while the build is parsing
+        indexer.lock.release()
+        assert indexer.lookup("a") == []
+        release.set()
+        builder.join()
+        assert indexer.lookup("a")
+
+@pytest.mark.skipif(not NUMPY_AVAILABLE, reason="numpy not installed")
+class TestVectorIndex:
+    """Test the persistent semantic index."""
+    
+    def test_search_and_persistence(self, tmp_path):
+        """Test that results survive a reload without re-embedding."""
+        index = VectorIndex(str(tmp_path), dim=256)
+        items = [
+            ("a", "traceback error handling retry logic", "errors.json"),
+            ("b", "cleanup formatting style guide", "style.json"),
+            ("c", "architecture component diagram", "arch.json")
+        ]
+        assert index.add(items) == 3
+        assert index.search(["retry after error"], k=1)[0][0].id == "a"
+        
+        reloaded = VectorIndex(str(tmp_path), dim=256)
+        assert reloaded.add(items) == 0
+        assert reloaded.search(["style guide for formatting"], k=1)[0][0].id == "b"
+    
+    def test_coarse_partition_search(self, tmp_path):
+        """Test batched search once the IVF partition is built."""
+        index = VectorIndex(str(tmp_path), dim=256)
+        index.add([(f"item{i}", f"function number{i} handles topic{i % 7}", "code") for i in range(200)])
+        index.build_ivf(n_lists=8)
+        
+        results = index.search(["function number42 handles topic0", "topic3"], k=3)
+        assert len(results) == 2
+        assert results[0][0].id == "item42"
+    
+    def test_logged_updates_and_compaction(self, tmp_path):
+        """Test that small updates are logged, replayed on load and that tombstones are compacted."""
+        import threading
+        index = VectorIndex(str(tmp_path), dim=64)
+        index.add([(f"item{i}", f"text number {i}", "code") for i in range(100)])
+        threads = [threading.Thread(target=index.add, args=([(f"new{t}-{i}", f"new text {t} {i}", "code")
+                                                             for i in range(5)],)) for t in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        index.add([("item0", "changed text", "code")])
+        index.remove(["item1"])
+        assert index.count == 120 and os.path.exists(tmp_path / "meta.log")
+        
+        reloaded = VectorIndex(str(tmp_path), dim=64)
+        assert reloaded.count == 120 and len(reloaded.id_to_row) == 119
+        assert reloaded.rows[reloaded.id_to_row["item0"]]["text"] == "changed text"
+        assert reloaded.search(["new text 3 4"], k=1)[0][0].id == "new3-4"
+        
+        reloaded.remove([f"item{i}" for i in range(2, 40)])
+        assert reloaded.count == 81 and not os.path.exists(tmp_path / "meta.log")
+        assert reloaded.search(["text number 77"], k=1)[0][0].id == "item77"
+        assert VectorIndex(str(tmp_path), dim=64).count == 81
+    
+    def test_unbuilt_indexer_keeps_code_rows(self, tmp_path, monkeypatch):
+        """Test that a sync right after a restart does not drop and re-embed repository chunks."""
+        import threading
+        from types import SimpleNamespace
+        from AdministrativeMesh import vector_index
+        index = VectorIndex(str(tmp_path / "index"), dim=64)
+        index.add([(f"code:a.py:f{i}", f"def f{i}(): pass", "a.py") for i in range(3)])
+        monkeypatch.setattr(vector_index, "_vector_index", index)
+        monkeypatch.setitem(vector_index.VECTOR_INDEX_SETTINGS, "enabled", True)
+        monkeypatch.setitem(vector_index.VECTOR_INDEX_SETTINGS, "memory_dir", str(tmp_path / "memory"))
+        
+        unbuilt = SimpleNamespace(built=False, lock=threading.RLock(), files={}, root=str(tmp_path))
+        assert vector_index.sync_vector_index(unbuilt, force=True) == 0
+        assert len(index.id_to_row) == 3
+        
+        built = SimpleNamespace(built=True, lock=threading.RLock(), files={}, root=str(tmp_path))
+        vector_index.sync_vector_index(built, force=True)
+        assert len(index.id_to_row) == 0
+
+class TestPromptPacker:
+    """Test token-budgeted prompt packing."""
+    
+    def test_under_budget_is_unchanged(self):
+        """Test that small prompts are not compressed."""
+        code = "def f(x):\n    # keep me\n    return x\n"
+        prompt, result = pack_prompt("Fix this:", [PromptSection("CODE", code, priority=0, is_code=True)], "Answer:", 1000)
+        assert "# keep me" in prompt
+        assert result.saved_tokens == 0
+    
+    def test_context_gives_way_to_code(self):
+        """Test that oversized context is compressed and truncated before the code."""
+        code = "def main():\n    return compute(1)\n"
+        context = "import os\n# helper\ndef helper():\n    return 1\n\n\n" * 200
+        sections = [
+            PromptSection("CODE", code, priority=0, is_code=True),
+            PromptSection("ERROR", "NameError: compute", priority=1, min_tokens=16),
+            PromptSection("CONTEXT", context, priority=3, is_code=True, strip_boilerplate=True)
+        ]
+        prompt, result = pack_prompt("Debug:", sections, "Response:", 300)
+        
+        assert code.strip() in prompt
+        assert "NameError: compute" in prompt
+        assert "import os" not in prompt
+        assert result.truncated == ["CONTEXT"]
+        assert result.packed_tokens <= 300
+        assert result.saved_tokens > 0
+        
+        from fastapi.testclient import TestClient
+        import rest_api
+        reported = TestClient(rest_api.app).get("/health").json()["prompt_packing"]
+        assert reported["tokens_saved"] >= result.saved_tokens
+    
+    def test_strip_comments_keeps_strings(self):
+        """Test that hash characters inside strings survive comment stripping."""
+        assert strip_comments("x = '#tag'  # note\n\ny = 2\n") == "x = '#tag'\ny = 2"
+
+@pytest.mark.asyncio
+class TestPlanExecutor:
+    """Test DAG plan execution."""
+    
+    PLAN = [
+        {"step": 1, "task": "analyze", "depends_on": []},
+        {"step": 2, "task": "debug", "depends_on": []},
+        {"step": 3, "task": "fix", "depends_on": [1, 2]}
+    ]
+    
+    async def test_independent_steps_run_concurrently(self):
+        """Test that steps without shared dependencies overlap."""
+        active, peak, calls = 0, 0, []
+        
+        async def run_step(task_type, payload):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+            calls.append(task_type)
+            return f"{task_type} done"
+        
+        executor = PlanExecutor(run_step)
+        results = await executor.run(self.PLAN, {"code_str": "x = 1"})
+        
+        assert peak == 2
+        assert calls[-1] == "fix"
+        assert all(r.status == "complete" for r in results.values())
+    
+    async def test_memoized_steps_are_not_recomputed(self):
+        """Test that re-running with unchanged inputs hits the cache."""
+        calls = []
+        
+        async def run_step(task_type, payload):
+            calls.append(task_type)
+            return f"{task_type} of {payload['code_str']}"
+        
+        executor = PlanExecutor(run_step)
+        await executor.run(self.PLAN, {"code_str": "x = 1"})
+        results = await executor.run(self.PLAN, {"code_str": "x = 1"})
+        
+        assert len(calls) == 3
+        assert {r.status for r in results.values()} == {"cached"}
+    
+    async def test_failed_step_skips_dependents(self):
+        """Test that dependents of a failed step are skipped."""
+        async def run_step(task_type, payload):
+            return "[ERROR]: boom" if task_type == "debug" else "ok"
+        
+        results = await PlanExecutor(run_step).run(self.PLAN, {})
+        assert results[2].status == "failed"
+        assert results[3].status == "skipped"
+    
+    async def test_request_plan_reuses_steps_an_edit_does_not_touch(self):
+        """Test that analysis and debugging overlap and only steps reading changed inputs rerun."""
+        from AdministrativeMesh.planner_agent import build_plan
+        plan = build_plan({"error": "NameError: y"})
+        active, peak, calls = 0, 0, []
+        
+        async def run_step(task_type, payload):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+            calls.append((task_type, payload["code_str"]))
+            return f"```python\n{payload['code_str']}  # {task_type}\n```"
+        
+        executor = PlanExecutor(run_step)
+        payload = {"code_str": "x = y", "error_msg": "NameError: y", "context": "repo v1"}
+        await executor.run(plan, payload)
+        assert peak == 2
+        assert calls[-1] == ("clean", "x = y  # fix\n")  # Cleans the fixed code
+        
+        calls.clear()
+        results = await executor.run(plan, {**payload, "context": "repo v2"})
+        assert [task for task, _ in calls] == ["fix"]
+        assert {results[1].status, results[2].status, results[4].status} == {"cached"}
+    
+    async def test_upstream_outputs_are_keyed_by_step(self):
+        """Test that two upstream steps running the same task both reach their dependent."""
+        plan = [
+            {"step": 1, "task": "analyze", "depends_on": []},
+            {"step": 2, "task": "analyze", "depends_on": []},
+            {"step": 3, "task": "fix", "depends_on": [1, 2]}
+        ]
+        seen = {}
+        
+        async def run_step(task_type, payload):
+            seen[task_type] = payload
+            return f"analysis {len(seen)}" if task_type == "analyze" else "fixed"
+        
+        await PlanExecutor(run_step).run(plan, {})
+        assert set(seen["fix"]["upstream"]) == {1, 2}
+        assert "[step 1 analyze result]" in seen["fix"]["context"]
+        assert "[step 2 analyze result]" in seen["fix"]["context"]
+    
+    async def test_cycles_are_rejected(self):
+        """Test plan validation."""
+        with pytest.raises(ValueError):
+            validate_plan([{"step": 1, "task": "a", "depends_on": [2]}, {"step": 2, "task": "b", "depends_on": [1]}])
+
+@pytest.mark.asyncio
+class TestCouncilVoting:
+    """Test concurrent council voting."""
+    
+    async def test_quorum_cancels_slow_members(self):
+        """Test that the vote returns once a quorum agrees."""
+        delays = {"fast-a": 0.0, "fast-b": 0.01, "slow": 5.0}
+        
+        async def ask(member):
+            await asyncio.sleep(delays[member.model])
+            return "debug"
+        
+        members = [CouncilMember(name, timeout=10.0) for name in delays]
+        decision = await concurrent_council_vote(members, ask)
+        
+        assert decision.choice == "debug"
+        assert decision.early
+        assert decision.cancelled == ["slow"]
+        assert decision.elapsed < 1.0
+    
+    async def test_weights_and_timeouts(self):
+        """Test that weights decide and timed-out members abstain."""
+        answers = {"heavy": "fix", "light": "clean", "stuck": None}
+        
+        async def ask(member):
+            if member.model == "stuck":
+                await asyncio.sleep(1.0)
+            return answers[member.model]
+        
+        members = [
+            CouncilMember("heavy", weight=2.0),
+            CouncilMember("light", weight=1.0),
+            CouncilMember("stuck", weight=1.0, timeout=0.01)
+        ]
+        decision = await concurrent_council_vote(members, ask, quorum=0.9)
+        
+        assert decision.choice == "fix"
+        assert decision.abstained == ["stuck"]
+
+@pytest.mark.asyncio
+class TestModelExecutor:
+    """Test per-model inference executors."""
+    
+    async def test_calls_are_serialized_and_bounded(self):
+        """Test that one model decodes one request at a time with a bounded queue."""
+        import threading
+        import time
+        
+        active, peak = 0, 0
+        lock = threading.Lock()
+        
+        def decode():
+            nonlocal active, peak
+            with lock:
+                active += 1
+                peak = max(peak, active)
+            time.sleep(0.02)
+            with lock:
+                active -= 1
+            return "ok"
+        
+        executor = ModelExecutor("test-model", max_concurrency=1, max_queue=3)
+        results = await asyncio.gather(*(executor.submit(decode) for _ in range(5)), return_exceptions=True)
+        executor.shutdown()
+        
+        assert peak == 1
+        # One request decodes while three wait; the fifth is rejected
+        assert results.count("ok") == 4
+        assert isinstance(results[-1], ModelBusyError)
+        
+        metrics = executor.metrics.to_dict()
+        assert metrics["rejected"] == 1
+        assert metrics["max_queue_depth"] == 3
+        assert metrics["queue_depth"] == 0
+        assert metrics["max_wait_time"] > 0
+
+class TestHardwareTuner:
+    """Test llama.cpp runtime auto-tuning."""
+    
+    def test_tuned_profile_is_applied(self, tmp_path, monkeypatch):
+        """Test that the best benchmarked settings are saved and loaded."""
+        monkeypatch.setattr(hardware_tuner, "PROFILE_PATH", str(tmp_path / "profiles.json"))
+        model_file = tmp_path / "model.gguf"
+        model_file.write_text("")
+        
+        def fake_benchmark(model_path, params):
+            # Peaks at 8 threads and 256 batch; contexts above 8192 get much slower
+            speed = 100.0 - abs(params["n_threads"] - 8) * 5 - abs(params["n_batch"] - 256) / 64
+            return speed / 2 if params["n_ctx"] > 8192 else speed
+        
+        monkeypatch.setattr(hardware_tuner.os, "cpu_count", lambda: 16)
+        hardware_tuner.tune_models({"tiny": str(model_file)}, benchmark=fake_benchmark)
+        
+        assert hardware_tuner.get_runtime_profile(str(model_file)) == {"n_ctx": 8192, "n_threads": 8, "n_batch": 256}
+        # Another quantization of the same model has not been measured
+        other = str(tmp_path / "model.Q8_0.gguf")
+        assert hardware_tuner.get_runtime_profile(other) == hardware_tuner.DEFAULT_RUNTIME_PROFILE
+    
+    def test_small_contexts_are_measured(self):
+        """Test that the search starts at the smallest context, below the default."""
+        contexts = []
+        
+        def fake_benchmark(model_path, params):
+            contexts.append(params["n_ctx"])
+            return 50.0 if params["n_ctx"] > 2048 else 100.0
+        
+        profile = hardware_tuner.tune_model("model.gguf", benchmark=fake_benchmark, cpu_count=4)
+        assert contexts[0] == 2048
+        assert profile["n_ctx"] == 2048
+
+def _echo_model_loader(model_name):
+    """Stand-in model for process isolation tests; 'crash' kills the worker."""
+    def model(prompt, **kwargs):
+        if prompt == "crash":
+            os._exit(1)
+        if prompt == "hang":
+            import time
+            time.sleep(60)
+        return {"choices": [{"text": f"{model_name}:{prompt}:{os.getpid()}"}]}
+    return model
+
+class TestModelProcessIsolation:
+    """Test supervised worker processes for local models."""
+    
+    def test_worker_crash_is_contained_and_restarted(self):
+        """Test that a crashing model worker is replaced by its warm standby."""
+        supervisor = ModelProcessSupervisor(
+            "echo",
+            loader=_echo_model_loader,
+            settings={"start_method": "fork", "warm_standby": True, "load_timeout": 10.0, "request_timeout": 10.0}
+        )
+        try:
+            first = supervisor.generate("hello")["choices"][0]["text"]
+            assert first.startswith("echo:hello:")
+            assert supervisor.status()["standby_pid"] is not None
+            
+            with pytest.raises(ModelProcessError):
+                supervisor.generate("crash")
+            
+            second = supervisor.generate("again")["choices"][0]["text"]
+            assert second.split(":")[-1] != first.split(":")[-1]
+            assert supervisor.status()["recent_restarts"] == 1
+        finally:
+            supervisor.shutdown()
+    
+    def test_abandoned_request_stops_the_worker(self):
+        """Test that giving up on a request kills its worker instead of waiting for it."""
+        import threading
+        import time
+        from AdministrativeMesh.model_process_pool import RequestAbandoned
+        supervisor = ModelProcessSupervisor(
+            "echo",
+            loader=_echo_model_loader,
+            settings={"start_method": "fork", "load_timeout": 10.0, "request_timeout": 60.0}
+        )
+        try:
+            first_pid = supervisor.generate("hello")["choices"][0]["text"].split(":")[-1]
+            abandoned = threading.Event()
+            threading.Timer(0.2, abandoned.set).start()
+            start = time.monotonic()
+            with pytest.raises(RequestAbandoned):
+                supervisor.generate("hang", abandoned=abandoned)
+            assert time.monotonic() - start < 5
+            
+            second_pid = supervisor.generate("again")["choices"][0]["text"].split(":")[-1]
+            assert second_pid != first_pid
+            assert supervisor.status()["recent_restarts"] == 0
+        finally:
+            supervisor.shutdown()
+
+class TestOutputGrammar:
+    """Test output shape grammars and validators."""
+    
+    def test_grammars_define_every_rule(self):
+        """Test that each GBNF grammar defines root and every rule it references."""
+        import re
+        for shape, grammar in output_grammar.GRAMMARS.items():
+            without_literals = re.sub(r'"(\\.|[^"\\])*"|\[(\\.|[^\]\\])*\]', "", grammar)
+            defined = set(re.findall(r"^(\w+) ::=", grammar, re.MULTILINE))
+            referenced = set(re.findall(r"\b[a-z]+\b", without_literals))
+            assert "root" in defined, shape
+            assert referenced <= defined, (shape, referenced - defined)
+    
+    def test_validators(self):
+        """Test that outputs are checked against their expected shape."""
+        assert output_grammar.is_valid_code_block("```python\ndef f():\n    return 1\n```")
+        assert not output_grammar.is_valid_code_block("Here is the fix:\n```python\nx = 1\n```")
+        assert not output_grammar.is_valid_code_block("```python\ndef f(:\n```")
+        assert output_grammar.is_valid_unified_diff("--- a/x.py\n+++ b/x.py\n@@ -1 +1 @@\n-x = 1\n+x = 2\n")
+        assert output_grammar.is_valid_json_report('{"summary": "ok", "issues": [], "suggestions": ["a"]}')
+        assert not output_grammar.is_valid_json_report('{"summary": "ok"}')
+
+class TestGenerationLimits:
+    """Test adaptive max_tokens and learned stop sequences."""
+    
+    def test_max_tokens_follow_recorded_lengths(self, tmp_path):
+        """Test that max_tokens tracks a high percentile of recent outputs and grows on truncation."""
+        limits = GenerationLimits({"min_samples": 10, "save_every": 1000}, path=str(tmp_path / "limits.json"))
+        assert limits.max_tokens_for("clean", "m", 512) == 512
+        
+        for tokens in range(100, 200, 10):
+            limits.record("clean", "m", "", max_tokens=512, tokens=tokens)
+        assert limits.max_tokens_for("clean", "m", 512) == int(190 * 1.2)
+        
+        for _ in range(10):
+            limits.record("clean", "m", "", max_tokens=228, tokens=228)
+        assert limits.max_tokens_for("clean", "m", 512) > 228
+        
+        # The model's finish reason overrides the length estimate either way
+        for _ in range(10):
+            limits.record("fix", "m", "", max_tokens=300, tokens=300, truncated=False)
+        assert limits.max_tokens_for("fix", "m", 512) == 360
+        for _ in range(10):
+            limits.record("fix", "m", "", max_tokens=300, tokens=120, truncated=True)
+        assert limits.max_tokens_for("fix", "m", 512) > 300
+    
+    def test_stop_sequences_are_learned(self, tmp_path):
+        """Test that spillover markers become stops and the blank-line stop is dropped when it cuts code."""
+        limits = GenerationLimits({"min_samples": 3, "spillover_min_hits": 2, "save_every": 1000},
+                                  path=str(tmp_path / "limits.json"))
+        for _ in range(3):
+            limits.record("fix", "m", "```python\nx = 1", max_tokens=512, stop=["</s>", "\n\n"])
+            limits.record("analyze", "m", "Looks fine.\nUser: thanks", max_tokens=512)
+        
+        assert limits.stop_sequences_for("fix", ["</s>", "\n\n"]) == ["</s>"]
+        assert "\nUser:" in limits.stop_sequences_for("analyze", [])
+        assert limits.trim_spillover("analyze", "Looks fine.\nUser: thanks") == "Looks fine."
+
+@pytest.mark.asyncio
+class TestModelCascade:
+    """Test local-first answering with escalation to the mesh."""
+    
+    class FakeMesh:
+        def __init__(self):
+            self.calls = 0
+        
+        async def handle_task(self, task_type, payload):
+            self.calls += 1
+            return "mesh answer"
+    
+    async def _run(self, monkeypatch, local, payload=None):
+        from AdministrativeMesh import mesh_manager, model_cascade
+        local_calls = []
+        
+        async def fake_run_task(task_type, payload, model_name=None, logprobs=False):
+            local_calls.append(model_name)
+            return {**local, "model": model_name}
+        
+        monkeypatch.setattr(mesh_manager, "run_task", fake_run_task)
+        mesh = self.FakeMesh()
+        result = await model_cascade.run_cascade("fix", payload or {"code_str": "x = 1"}, mesh,
+                                                 settings={"local_model": "small"})
+        return result, mesh.calls, local_calls
+    
+    async def test_confident_local_answer_stays_local(self, monkeypatch):
+        """Test that a parseable, confident local answer is returned without the mesh."""
+        local = {"text": "```python\nx = 2\nprint(x)\n```", "confidence": 0.9, "fallback": False}
+        result, mesh_calls, _ = await self._run(monkeypatch, local)
+        assert (result.tier, result.model, mesh_calls) == ("local", "small", 0)
+    
+    async def test_cheap_checks_escalate(self, monkeypatch):
+        """Test escalation on low confidence, unparseable output and oversized input."""
+        low = {"text": "```python\nx = 2\nprint(x)\n```", "confidence": 0.2, "fallback": False}
+        result, mesh_calls, _ = await self._run(monkeypatch, low)
+        assert (result.tier, result.reason, mesh_calls) == ("mesh", "low confidence", 1)
+        
+        broken = {"text": "Here is the fix: x = (", "confidence": None, "fallback": False}
+        result, _, _ = await self._run(monkeypatch, broken)
+        assert result.reason == "output does not parse"
+        
+        result, _, local_calls = await self._run(monkeypatch, low, {"code_str": "x = 1\n" * 5000})
+        assert result.reason == "input too long" and local_calls == []
+
+@pytest.mark.asyncio
+class TestCandidateSearch:
+    """Test parallel fix candidates with sandboxed verification."""
+    
+    async def test_first_verified_candidate_wins(self):
+        """Test that broken candidates are rejected, slow ones cancelled and the winner cached."""
+        import time
+        candidates = {
+            0: "```python\ndef add(a, b)\n    return a + b\n```",
+            1: "```python\ndef add(a, b):\n    return a - b\n```",
+            2: "```python\ndef add(a, b):\n    return a + b\n```",
+        }
+        calls = []
+        
+        async def generate(seed):
+            calls.append(seed)
+            if seed == 3:
+                await asyncio.sleep(30)
+            return candidates[seed]
+        
+        tests = "from candidate import add\n\ndef test_add():\n    assert add(2, 3) == 5\n"
+        search = CandidateSearch({"candidates": 4, "verify_timeout": 20.0})
+        start = time.monotonic()
+        result = await search.search("def add(a, b) return a+b", "SyntaxError", generate, tests=tests)
+        
+        assert result.passed and result.seed == 2
+        assert time.monotonic() - start < 20
+        
+        again = await search.search("def add(a, b) return a+b", "SyntaxError", generate, tests=tests)
+        assert again.cached and again.code == result.code
+        assert len(calls) == 4
+
+class TestModelVariants:
+    """Test quantization variant selection."""
+    
+    def test_best_variant_fits_memory_and_latency(self):
+        """Test that the highest-quality variant within budget and speed target is chosen."""
+        assert select_variant("mistral-7b", memory_budget_gb=64).quant == "Q8_0"
+        assert select_variant("mistral-7b", memory_budget_gb=6).quant == "Q4_K_M"
+        assert select_variant("mistral-7b", memory_budget_gb=64, min_tps=3.0).quant == "Q5_K_M"
+        # Nothing meets the target: the fastest variant that fits
+        assert select_variant("mistral-7b", memory_budget_gb=64, min_tps=100.0).quant == "Q3_K_M"
+        assert select_variant("mistral-7b", memory_budget_gb=2) is None
+        assert select_variant("mistral-7b", memory_budget_gb=64, exists=lambda path: "Q4_K_M" in path).quant == "Q4_K_M"
+
+class TestCoreAllocator:
+    """Test disjoint, NUMA-local CPU sets for resident models."""
+    
+    def test_models_get_disjoint_numa_local_sets(self):
+        """Test partitioning, rebalancing on unload and throughput before/after."""
+        assert parse_cpulist("0-2,8") == [0, 1, 2, 8]
+        allocator = CoreAllocator(topology={0: [0, 1, 2, 3], 1: [4, 5, 6, 7]}, reserved_cores=0)
+        
+        allocator.register("a", weight=4)
+        allocator.record_throughput("a", 100, 10.0)
+        allocator.register("b", weight=4)
+        a, b = set(allocator.cpus_for("a")), set(allocator.cpus_for("b"))
+        assert len(a) == len(b) == 4 and not a & b
+        assert a in ({0, 1, 2, 3}, {4, 5, 6, 7})
+        
+        allocator.record_throughput("a", 60, 3.0)
+        stats = allocator.get_stats()["a"]
+        assert (stats["tokens_per_sec_before"], stats["tokens_per_sec_after"]) == (10.0, 20.0)
+        assert len(stats["numa_nodes"]) == 1
+        
+        allocator.release("b")
+        assert len(allocator.cpus_for("a")) == 8
+    
+    def test_concurrent_register_and_release(self):
+        """Test that loads and unloads from several threads leave consistent sets."""
+        import threading
+        allocator = CoreAllocator(topology={0: list(range(8))}, reserved_cores=0)
+        
+        def churn(name):
+            for _ in range(20):
+                allocator.register(name, weight=2)
+                allocator.release(name)
+            allocator.register(name, weight=2)
+        
+        threads = [threading.Thread(target=churn, args=(f"m{i}",)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        assert set(allocator.allocations) == set(allocator.weights) == {"m0", "m1", "m2", "m3"}
+        cpus = [cpu for name in allocator.allocations for cpu in allocator.cpus_for(name)]
+        assert len(cpus) == len(set(cpus)) == 8
+
+class TestRateLimiter:
+    """Test per API key token buckets for requests and model tokens."""
+    
+    def test_request_and_token_buckets(self):
+        """Test burst exhaustion, Retry-After timing, token quotas and settling."""
+        limits = {"requests_per_sec": 2.0, "request_burst": 2, "tokens_per_min": 600}
+        limiter = RateLimiter({"default_limits": limits, "backend": "memory"})
+        
+        assert limiter.acquire("alice", 10, now=0) is None
+        assert limiter.acquire("alice", 10, now=0) is None
+        assert limiter.acquire("alice", 10, now=0) == pytest.approx(0.5)
+        assert limiter.acquire("bob", 10, now=0) is None  # Keys are independent
+        
+        # 550 reserved, only 50 used: settling frees room for another large request
+        assert limiter.acquire("carol", 550, now=0) is None
+        assert limiter.acquire("carol", 100, now=0) == pytest.approx(5.0)
+        limiter.settle("carol", 550, 50, now=0)
+        assert limiter.acquire("carol", 100, now=0) is None
+        assert limiter.get_stats()["rejected"] == {"alice": 1, "carol": 1}
+        
+        assert estimate_chat_tokens(b'{"messages": [{"content": "abcdefgh"}], "max_tokens": 100}') == (2, 102)
+    
+    def test_unknown_keys_and_idle_buckets(self):
+        """Test that unlisted keys are limited by address and refilled buckets are dropped."""
+        from rate_limiter import get_api_key
+        settings = {**RATE_LIMIT_SETTINGS, "api_keys": ["team-key"], "key_limits": {"ci-key": {}}}
+        assert get_api_key({"authorization": "Bearer team-key"}, "10.0.0.1", settings) == "team-key"
+        assert get_api_key({"x-api-key": "ci-key"}, "10.0.0.1", settings) == "ci-key"
+        assert get_api_key({"authorization": "Bearer made-up"}, "10.0.0.1", settings) == "ip:10.0.0.1"
+        
+        limits = {"requests_per_sec": 1.0, "request_burst": 2, "tokens_per_min": 600}
+        limiter = RateLimiter({"default_limits": limits, "backend": "memory", "bucket_sweep_interval": 60})
+        for n in range(20):
+            limiter.acquire(f"ip:10.0.0.{n}", 10, now=0)
+        assert len(limiter.backend.buckets) == 40
+        limiter.acquire("team-key", 10, now=120)
+        assert set(limiter.backend.buckets) == {"team-key:requests", "team-key:tokens"}
+    
+    def test_sqlite_backend_is_shared(self, tmp_path):
+        """Test that two limiters on one SQLite file enforce a single limit."""
+        limits = {"default_limits": {"requests_per_sec": 1.0, "request_burst": 1, "tokens_per_min": 600}}
+        path = str(tmp_path / "limits.sqlite")
+        first = RateLimiter(limits, backend=SQLiteBackend(path))
+        second = RateLimiter(limits, backend=SQLiteBackend(path))
+        assert first.acquire("alice", now=100) is None
+        assert second.acquire("alice", now=100) == pytest.approx(1.0)
+        assert second.acquire("alice", now=101) is None
+    
+    @pytest.mark.asyncio
+    async def test_sqlite_calls_run_off_the_loop(self, tmp_path):
+        """Test that async callers reach the SQLite backend through a worker thread."""
+        import threading
+        limiter = RateLimiter({}, backend=SQLiteBackend(str(tmp_path / "limits.sqlite")))
+        threads = []
+        
+        def acquire(api_key, tokens):
+            threads.append(threading.current_thread())
+            return limiter.acquire(api_key, tokens)
+        
+        assert await limiter.run(acquire, "alice", 10) is None
+        assert threads and threads[0] is not threading.main_thread()
+
+class TestEditorSessions:
+    """Test server-side file state rebuilt from editor diffs."""
+    
+    def test_edits_rebuild_file_state(self):
+        """Test offset and range edits, selections, stale versions and session resume."""
+        manager = EditorSessionManager()
+        session = manager.get_or_create()
+        opened = manager.handle_edit_message(session, {"type": "open", "path": "a.py", "content": "def f():\n    return 1\n"})
+        assert opened["version"] == 1
+        
+        manager.handle_edit_message(session, {"type": "edit", "path": "a.py", "version": 1, "edits": [
+            {"offset": 4, "length": 1, "text": "g"},
+            {"range": {"start": {"line": 1, "character": 11}, "end": {"line": 1, "character": 12}}, "text": "2"}
+        ]})
+        assert session.files["a.py"].content == "def g():\n    return 2\n"
+        assert session.code_for("a.py", {"start": {"line": 1, "character": 4}, "end": {"line": 1, "character": 99}}) == "return 2"
+        
+        with pytest.raises(SessionError) as stale:
+            session.apply_edits("a.py", 1, [{"offset": 0, "length": 0, "text": "#"}])
+        assert stale.value.code == "version_mismatch" and stale.value.details["version"] == 2
+        assert manager.get_or_create(session.id) is session
+        
+        # Ids are issued by the server and bound to the key that created the session
+        owned = manager.get_or_create("chosen-by-client", owner="key-a")
+        assert owned.id != "chosen-by-client"
+        assert manager.get_or_create(owned.id, owner="key-a") is owned
+        assert manager.get_or_create(owned.id, owner="key-b") is not owned
+
+class TestSharedState:
+    """Test state shared between gateway workers."""
+    
+    @pytest.mark.asyncio
+    async def test_workers_share_hosts_breakers_cache_and_probe_lease(self, tmp_path):
+        """Test that one worker's view of hosts, breakers and cache reaches another."""
+        import time
+        from shared_state import SharedStateStore
+        from error_handling import CircuitBreaker, TaskExecutionError
+        from LLM_Mesh.distributed_models import DistributedModelRegistry, ModelHost, ModelInfo
+        path = str(tmp_path / "state.sqlite")
+        stores = [SharedStateStore(path), SharedStateStore(path)]
+        
+        registries = []
+        for store in stores:
+            registry = DistributedModelRegistry()
+            registry.models = {"tiny": ModelInfo("tiny", [ModelHost("http://node-a", 1.0, 0.1, [])], 0.0, 2048, [], "")}
+            registry.attach_shared_store(store)
+            registries.append(registry)
+        host = registries[0].models["tiny"].hosts[0]
+        host.available, host.last_response_time = False, 3.5
+        registries[0]._publish(host)
+        stores[0].flush()
+        registries[1]._last_sync = 0.0
+        assert await registries[1].find_best_host("tiny") is None
+        assert registries[1].models["tiny"].hosts[0].last_response_time == 3.5
+        
+        async def failing():
+            raise ConnectionError("down")
+        breakers = [CircuitBreaker(failure_threshold=1, name="node-a", store=store) for store in stores]
+        with pytest.raises(ConnectionError):
+            await breakers[0].call(failing)
+        stores[0].flush()
+        with pytest.raises(TaskExecutionError):
+            await breakers[1].call(failing)  # Opened by the other worker
+        
+        # Routing uses per-host breakers: failures seen by one worker keep the others off the host
+        calls = []
+        async def send_to_host(host, *args):
+            calls.append(host.host_url)
+            return {"error": "status 500", "success": False}
+        for registry in registries:
+            registry.models["tiny"].hosts[0].available = True
+            registry._send_to_host = send_to_host
+        node = registries[0].models["tiny"].hosts[0]
+        for _ in range(registries[0]._breaker(node).failure_threshold):
+            await registries[0]._call_host(node, "tiny", "x", 1, {}, 1.0)
+        stores[0].flush()
+        other = registries[1].models["tiny"].hosts[0]
+        result = await registries[1]._call_host(other, "tiny", "x", 1, {}, 1.0)
+        assert "breaker" in result["error"] and len(calls) == 5
+        registries[1]._last_sync = time.time()  # Keep the host table from resetting availability
+        assert await registries[1].find_best_host("tiny") is None
+        
+        stores[0].cache_set("chat:x", "cached answer", ttl=60)
+        assert stores[1].cache_get("chat:x") == "cached answer"
+        assert stores[0].acquire_lease("host_probe", "worker-1", ttl=60)
+        assert not stores[1].acquire_lease("host_probe", "worker-2", ttl=60)
+        assert stores[0].acquire_lease("host_probe", "worker-1", ttl=60)
+
+class TestWorkerGateway:
+    """Test that one process serves every worker route."""
+    
+    def test_all_worker_routes_share_one_app(self, monkeypatch):
+        """Test each worker URL path against the gateway app and its port list."""
+        from fastapi.testclient import TestClient
+        from LLM_Mesh.endpoints import worker_gateway
+        
+        async def handle_task(task_type, payload):
+            return f"{task_type} done"
+        for endpoint in ("analyzer", "cleaner", "debugger", "fixer", "refactor"):
+            monkeypatch.setattr(getattr(worker_gateway, f"{endpoint}_endpoint"), "handle_task", handle_task)
+        
+        assert worker_gateway.worker_ports() == [8001, 8002, 8003, 8004, 8005]
+        client = TestClient(worker_gateway.app)
+        requests = {
+            "/debug": {"code": "x", "error_message": "e"},
+            "/analyze": {"code_summary": "x", "component_path": "a.py"},
+            "/fix": {"code": "x", "context": ""},
+            "/clean": {"codebase": "x"},
+            "/refactor": {"code": "x"},
+        }
+        for path, body in requests.items():
+            response = client.post(path, json=body)
+            assert response.json()["status"] == "success", path
+        health = client.get("/health").json()
+        assert health["status"] == "healthy"
+        assert health["prompt_packing"]["tokens_saved"] >= 0
+
+class TestCodebasePipeline:
+    """Test archive-in, diffs-out codebase cleanup."""
+
+    def test_split_source_round_trips(self):
+        """Test that large Python files split at top-level definitions and rejoin exactly."""
+        from LLM_Mesh.codebase_pipeline import split_source
+        source = "".join(f"@dec\ndef f{i}():\n    return {i}\n\n" for i in range(40))
+        chunks = split_source(source, max_tokens=60)
+        assert len(chunks) > 1 and "".join(chunks) == source
+        assert all(chunk.startswith("@dec") for chunk in chunks)
+
+    @pytest.mark.asyncio
+    async def test_archive_cleaned_into_diffs_and_report(self):
+        """Test per-file results, skipped paths, unparsable output and the project report."""
+        import io
+        import tarfile
+        from LLM_Mesh.codebase_pipeline import clean_codebase, iter_archive
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+            for name, text in {"pkg/a.py": "x=1\n", "pkg/b.py": "y = 2\n", "pkg/c.py": "z=3\n",
+                               "pkg/e.js": "let v=5\n", "node_modules/d.py": "w=4\n", "README.md": "docs\n"}.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(text)
+                archive.addfile(info, io.BytesIO(text.encode()))
+
+        async def clean(code, path, rules, seed):
+            if path.endswith("c.py"):
+                return "```python\nz = (\n```"
+            if path.endswith(".js"):
+                return f"```javascript\n{code.replace('=', ' = ')}```"
+            return f"```python\n{code.replace('=', ' = ').replace('  ', ' ')}```"
+
+        items = [item async for item in clean_codebase(iter_archive(buffer), clean, settings={"parallel_files": 2})]
+        files = {item["path"]: item for item in items if item["type"] == "file"}
+        report = items[-1]
+        assert set(files) == {"pkg/a.py", "pkg/b.py", "pkg/c.py", "pkg/e.js"}
+        assert files["pkg/e.js"]["status"] == "changed" and "+let v = 5" in files["pkg/e.js"]["diff"]
+        assert files["pkg/a.py"]["status"] == "changed" and "+x = 1" in files["pkg/a.py"]["diff"]
+        assert files["pkg/b.py"]["status"] == "unchanged"
+        assert files["pkg/c.py"]["status"] == "failed"
+        assert report["type"] == "report" and report["changed"] == 2 and report["failed"] == 1
+        assert report["patch"].startswith("--- a/pkg/a.py")
+
+class TestPatchApplier:
+    """Test diff-mode fixes and fuzzy patch application."""
+
+    CODE = "def area(r):\n    pi = 3.14\n    return pi * r\n\n\ndef main():\n    print(area(2))\n"
+
+    def test_unified_diff_with_wrong_line_numbers_and_indent(self):
+        """Test that hunks are placed by context, not by their line numbers or indentation."""
+        from NeuralCodingAssistant.workers.fixer_helper import apply_patch
+        patch = "```diff\n--- a/geo.py\n+++ b/geo.py\n@@ -40,3 +40,3 @@\n def area(r):\n-  pi = 3.14\n-  return pi * r\n+  return 3.14159 * r * r\n```"
+        result = apply_patch(self.CODE, patch)
+        assert result.clean and result.fuzzy == 1
+        assert result.content == self.CODE.replace("    pi = 3.14\n    return pi * r", "    return 3.14159 * r * r")
+
+    def test_search_replace_and_conflicts(self):
+        """Test search/replace blocks, and that unplaceable hunks are reported, not forced in."""
+        from NeuralCodingAssistant.workers.fixer_helper import apply_patch, run_fixer_helper
+        patch = ("<<<<<<< SEARCH\n    print(area(2))\n=======\n    print(area(3))\n>>>>>>> REPLACE\n"
+                 "<<<<<<< SEARCH\nclass Circle:\n    radius = 0\n=======\nclass Circle:\n    radius = 1\n>>>>>>> REPLACE")
+        result = apply_patch(self.CODE, patch)
+        assert result.applied == 1 and len(result.conflicts) == 1 and result.conflicts[0].hunk == 1
+        assert "area(3)" in result.content
+        assert run_fixer_helper(patch, self.CODE).startswith("[PATCH ERROR]: hunk 2")
+        assert "area(3)" in run_fixer_helper(patch, self.CODE, allow_partial=True)
+
+    def test_ambiguous_and_overlapping_hunks_conflict(self):
+        """Test that guesses are refused: short fuzzy contexts, repeats and insertions inside other hunks."""
+        from NeuralCodingAssistant.workers.fixer_helper import apply_patch
+        code = "def f():\n    x = 1\n    y = 2\n    x = 1\n"
+        missing = apply_patch(code, "<<<<<<< SEARCH\n    x = 3\n=======\n    x = 4\n>>>>>>> REPLACE")
+        repeated = apply_patch(code, "<<<<<<< SEARCH\n    x = 1\n=======\n    x = 4\n>>>>>>> REPLACE")
+        assert not missing.clean and missing.content == code
+        assert not repeated.clean and "2 times" in repeated.conflicts[0].reason
+
+        overlapping = apply_patch(code, "@@ -2,2 +2,2 @@\n-    x = 1\n-    y = 2\n+    x = 5\n+    y = 6\n"
+                                        "@@ -2,0 +3,1 @@\n+    z = 0\n")
+        assert not overlapping.clean and overlapping.conflicts[0].reason == "Insertion falls inside another hunk"
+        assert overlapping.content == "def f():\n    x = 5\n    y = 6\n    x = 1\n"
+
+    def test_fix_endpoint_diff_mode(self, monkeypatch):
+        """Test that the endpoint applies the patch and falls back to the full file on conflict."""
+        from fastapi.testclient import TestClient
+        from LLM_Mesh.endpoints import fixer_endpoint
+        patches = []
+
+        async def handle_task(task_type, payload):
+            if payload.get("output_mode") == "diff":
+                return patches.pop(0)
+            return "full file"
+        monkeypatch.setattr(fixer_endpoint, "handle_task", handle_task)
+        client = TestClient(fixer_endpoint.app)
+        body = {"code": self.CODE, "context": "", "output_mode": "diff"}
+
+        patches.append("@@ -7 +7 @@\n-    print(area(2))\n+    print(area(5))\n")
+        response = client.post("/fix", json=body).json()
+        assert response["fixed_code"] == self.CODE.replace("area(2)", "area(5)")
+        assert response["output_mode"] == "diff" and response["hunks_applied"] == 1
+
+        patches.append("no patch here")
+        response = client.post("/fix", json=body).json()
+        assert response["fixed_code"] == "full file" and response["output_mode"] == "code"
+
+@pytest.mark.asyncio
+class TestRequestScheduler:
+    """Test priority classes, weighted fair queuing and starvation protection."""
+
+    async def _grant_order(self, scheduler, requests):
+        """Queue (name, class, tenant, cost) behind a held slot and record the order they run in."""
+        from LLM_Mesh.request_scheduler import request_priority
+        order = []
+
+        async def run(name, priority_class, tenant, cost):
+            with request_priority(priority_class, tenant):
+                async with scheduler.slot("model", 1, cost):
+                    order.append(name)
+
+        holder = await scheduler.acquire("model", 1)
+        tasks = [asyncio.ensure_future(run(*request)) for request in requests]
+        await asyncio.sleep(0)
+        scheduler.release("model", holder, 1)
+        await asyncio.gather(*tasks)
+        return order
+
+    async def test_classes_and_tenants_share_fairly(self):
+        """Test that interactive overtakes queued batch work and a light tenant is not stuck behind a heavy one."""
+        from LLM_Mesh.request_scheduler import RequestScheduler
+        scheduler = RequestScheduler({"enabled": True})
+        order = await self._grant_order(scheduler, [
+            ("batch1", "batch", "ci", 500), ("batch2", "batch", "ci", 500),
+            ("heavy1", "chat", "a", 500), ("heavy2", "chat", "a", 500), ("heavy3", "chat", "a", 500),
+            ("light", "chat", "b", 500), ("key", "interactive", "c", 100),
+        ])
+        assert order[0] == "key"
+        assert order.index("light") < order.index("heavy2")
+        assert order[-2:] == ["batch1", "batch2"]
+        stats = scheduler.get_stats()
+        assert stats["batch"]["served"] == 2 and stats["interactive"]["slo_attainment"] == 1.0
+        assert scheduler.last_finish == {} and scheduler.active == {}
+
+    async def test_finished_flows_are_forgotten(self):
+        """Test that per-tenant tags do not pile up while the pool stays busy."""
+        from LLM_Mesh.request_scheduler import RequestScheduler, request_priority
+        scheduler = RequestScheduler({"enabled": True})
+        holder = await scheduler.acquire("model", 2)
+        for tenant in range(50):
+            with request_priority("chat", f"key-{tenant}"):
+                async with scheduler.slot("model", 2, 100):
+                    pass
+        assert len(scheduler.last_finish) <= 1
+        scheduler.release("model", holder, 2)
+        assert scheduler.last_finish == {} and "model" not in scheduler.virtual_time
+
+    async def test_overdue_requests_go_first(self):
+        """Test that a request past its class's max_wait is served ahead of higher weights."""
+        from LLM_Mesh.request_scheduler import RequestScheduler, request_priority
+        now = [0.0]
+        scheduler = RequestScheduler({"enabled": True}, clock=lambda: now[0])
+        holder = await scheduler.acquire("model", 1)
+        with request_priority("batch", "ci"):
+            old = asyncio.ensure_future(scheduler.acquire("model", 1, 500))
+        await asyncio.sleep(0)
+        now[0] = 120.0
+        with request_priority("interactive", "c"):
+            new = asyncio.ensure_future(scheduler.acquire("model", 1, 10))
+            cancelled = asyncio.ensure_future(scheduler.acquire("model", 1, 10))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.gather(cancelled, return_exceptions=True)
+        assert len(scheduler.queues["model"]) == 2
+
+        scheduler.release("model", holder, 1)
+        await asyncio.sleep(0)
+        assert old.done() and not new.done()
+        scheduler.release("model", old.result(), 1)
+        await asyncio.sleep(0)
+        assert new.done()
+
+class TestStartup:
+    """Test lazy imports and single-flight initialization."""
+    
+    def test_dispatcher_import_is_lazy(self):
+        """Test that importing the dispatcher does not pull in aiohttp or llama_cpp."""
+        import subprocess
+        code = ("import sys, AdministrativeMesh.admin_dispatcher; "
+                "print(any(m in sys.modules for m in ('aiohttp', 'llama_cpp', 'LLM_Mesh.mesh_manager')))")
+        result = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True)
+        assert result.stdout.strip().splitlines()[-1] == "False"
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_initialization_runs_once(self):
+        """Test that concurrent first calls share one initialization."""
+        from LLM_Mesh.mesh_manager import MeshManager
+        manager = MeshManager()
+        calls = 0
+        
+        async def initialize():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            manager.models_initialized = True
+        
+        manager._initialize = initialize
+        await asyncio.gather(*(manager.initialize_models() for _ in range(5)))
+        assert calls == 1
+        assert manager.models_initialized
+    
+    @pytest.mark.asyncio
+    async def test_initialization_checks_distributed_hosts(self, monkeypatch):
+        """Test that the single-flight initialization sets up the distributed hosts."""
+        from LLM_Mesh import mesh_manager
+        calls = []
+        
+        async def initialize_distributed_models():
+            calls.append(1)
+        
+        monkeypatch.setattr(mesh_manager, "initialize_distributed_models", initialize_distributed_models)
+        manager = mesh_manager.MeshManager()
+        await manager.initialize_models()
+        await manager.initialize_models()
+        assert calls == [1]
+
+@pytest.mark.asyncio
+class TestCancellation:
+    """Test that client disconnects cancel work all the way down to the nodes."""
+    
+    async def test_disconnect_cancels_without_retry(self):
+        """Test that a disconnect cancels dispatch and the retry loop does not restart it."""
+        from error_handling import ClientDisconnected, RetryConfig, run_until_disconnected, with_timeout_and_retry
+        started, cancelled = 0, asyncio.Event()
+        
+        async def work():
+            nonlocal started
+            started += 1
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+        
+        async def is_disconnected():
+            return started > 0
+        
+        with pytest.raises(ClientDisconnected):
+            await run_until_disconnected(
+                with_timeout_and_retry(work, retry_config=RetryConfig(max_retries=2, base_delay=0)),
+                is_disconnected, poll_interval=0.01
+            )
+        assert cancelled.is_set()
+        assert started == 1
+    
+    async def test_cancelled_request_aborts_on_node(self):
+        """Test that cancelling route_request sends an abort for its request_id to the node."""
+        from aiohttp import web
+        from LLM_Mesh.distributed_models import DistributedModelRegistry, ModelHost, ModelInfo
+        received, aborted = {}, asyncio.Event()
+        
+        async def completions(request):
+            received.update(await request.json())
+            await asyncio.sleep(10)
+            return web.json_response({})
+        
+        async def abort(request):
+            aborted.set()
+            return web.json_response({"success": (await request.json())["request_id"] == received["request_id"]})
+        
+        app = web.Application()
+        app.router.add_post("/v1/completions", completions)
+        app.router.add_post("/v1/abort", abort)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            registry = DistributedModelRegistry()
+            host = ModelHost(f"http://127.0.0.1:{port}", 1.0, 0.1, [])
+            registry.models = {"tiny": ModelInfo("tiny", [host], 0.0, 2048, [], "")}
+            request = asyncio.ensure_future(registry.route_request("tiny", "hello"))
+            while not received:
+                await asyncio.sleep(0.01)
+            request.cancel()
+            await asyncio.wait_for(aborted.wait(), timeout=2)
+            assert request.cancelled()
+        finally:
+            await runner.cleanup()
+
+@pytest.mark.asyncio
+class TestDeadlines:
+    """Test one request deadline carried through every layer."""
+    
+    async def test_retries_stop_when_budget_runs_out(self):
+        """Test that retries are cut short by the deadline instead of multiplying."""
+        from error_handling import DeadlineExceeded, RetryConfig, request_deadline, with_timeout_and_retry
+        calls = 0
+        
+        async def flaky():
+            nonlocal calls
+            calls += 1
+            raise ConnectionError("node reset")
+        
+        with request_deadline(0.3):
+            with pytest.raises(DeadlineExceeded):
+                await with_timeout_and_retry(flaky, retry_config=RetryConfig(max_retries=5, base_delay=0.2))
+        assert calls == 2
+    
+    async def test_host_retry_within_budget(self):
+        """Test that a failed host is retried on another with the remaining budget sent along."""
+        from aiohttp import web
+        from error_handling import request_deadline
+        from LLM_Mesh.distributed_models import DistributedModelRegistry, ModelHost, ModelInfo
+        deadlines = []
+        
+        async def broken(request):
+            return web.json_response({}, status=500)
+        
+        async def healthy(request):
+            deadlines.append((await request.json())["deadline_ms"])
+            return web.json_response({"choices": [{"text": "ok"}]})
+        
+        app = web.Application()
+        app.router.add_post("/a/v1/completions", broken)
+        app.router.add_post("/b/v1/completions", healthy)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        base = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+        try:
+            registry = DistributedModelRegistry()
+            hosts = [ModelHost(f"{base}/a", 1.0, 0.1, []), ModelHost(f"{base}/b", 0.5, 0.1, [])]
+            registry.models = {"tiny": ModelInfo("tiny", hosts, 0.0, 2048, [], "")}
+            with request_deadline(5.0):
+                result = await registry.route_request("tiny", "hello")
+            assert result["success"] and result["response"] == "ok"
+            assert not hosts[0].available
+            assert 0 < deadlines[0] <= 5000
+        finally:
+            await runner.cleanup()
+
+@pytest.mark.asyncio
+class TestBatchJobs:
+    """Test persisted background batch jobs."""
+    
+    async def test_batch_runs_streams_and_resumes(self, tmp_path):
+        """Test running a JSONL batch, streaming its results and resuming after a restart."""
+        from AdministrativeMesh.batch_jobs import BatchJobManager, interactive_request
+        
+        async def runner(prompt):
+            await asyncio.sleep(0.01)
+            return "[ERROR]: bad" if "broken" in prompt else prompt.upper()
+        
+        upload = "\n".join([
+            '{"custom_id": "a.py", "prompt": "fix a"}',
+            '{"custom_id": "b.py", "messages": [{"role": "user", "content": "fix broken b"}]}',
+        ])
+        manager = BatchJobManager({"idle_poll_interval": 0.01}, directory=str(tmp_path), runner=runner)
+        with interactive_request():
+            job = manager.create_job(upload)
+            await asyncio.sleep(0.05)
+            assert job.counts()["pending"] == 2  # Batch work waits for interactive requests
+        
+        streamed = [result async for result in manager.stream_results(job.id)]
+        assert {r["custom_id"]: r["status"] for r in streamed} == {"a.py": "completed", "b.py": "failed"}
+        assert job.summary()["status"] == "completed"
+        
+        # A job interrupted mid-run resumes its pending tasks on the next start
+        pending = manager.create_job('{"prompt": "fix c"}')
+        manager.workers[pending.id].cancel()
+        restarted = BatchJobManager(directory=str(tmp_path), runner=runner)
+        assert restarted.start() == 1
+        await restarted.workers[pending.id]
+        assert restarted.get_job(pending.id).tasks[0].result == "FIX C"
+        
+        with pytest.raises(ValueError):
+            manager.create_job("not json")
+
+    async def test_only_lease_holder_runs_jobs(self, tmp_path, monkeypatch):
+        """Test that with a shared store one worker runs each job and the others read its record."""
+        import shared_state
+        from AdministrativeMesh.batch_jobs import BatchJobManager
+        store = shared_state.SharedStateStore(str(tmp_path / "state.sqlite"))
+        calls = []
+
+        async def runner(prompt):
+            from LLM_Mesh.request_scheduler import current_priority
+            calls.append((prompt, current_priority()))
+            return prompt.upper()
+
+        settings = {"lease_interval": 0.02, "shared_poll_interval": 0.02}
+        monkeypatch.setattr("AdministrativeMesh.batch_jobs.worker_id", lambda: "worker-a")
+        leader = BatchJobManager(settings, directory=str(tmp_path / "jobs"), runner=runner, store=store)
+        leader.start()
+        await asyncio.sleep(0.05)
+        monkeypatch.setattr("AdministrativeMesh.batch_jobs.worker_id", lambda: "worker-b")
+        follower = BatchJobManager(settings, directory=str(tmp_path / "jobs"), runner=runner, store=store)
+        follower.start()
+        await asyncio.sleep(0.05)
+        assert leader.leader and not follower.leader
+
+        job = follower.create_job('{"prompt": "fix a"}\n{"prompt": "fix b"}', owner="key-1")
+        streamed = [result async for result in follower.stream_results(job.id)]
+        assert [r["result"] for r in streamed] == ["FIX A", "FIX B"]
+        assert calls == [("fix a", ("batch", "key-1")), ("fix b", ("batch", "key-1"))]
+        assert follower.get_job(job.id).status == "completed"
+        assert follower.get_job("../../etc/passwd") is None
+        for manager in (leader, follower):
+            manager.lease_loop.cancel()
+
 @pytest.mark.asyncio
 class TestAsyncFunctionality:
     """Test async components."""
@@ -141,6 +1406,116 @@ class TestAsyncFunctionality:
             assert len(result) > 0
         except ImportError:
             pytest.skip("Dispatcher not available")
+    
+    async def test_tests_reach_candidate_search(self, monkeypatch):
+        """Test that tests given to dispatch are run against fix candidates."""
+        import AdministrativeMesh.admin_dispatcher as admin_dispatcher
+        from types import SimpleNamespace
+        seen = {}
+        
+        class Search:
+            async def search(self, code, error, generate, tests=""):
+                seen.update(code=code, tests=tests)
+                return SimpleNamespace(passed=True, text="fixed", stage="passed", attempts=1)
+        
+        async def mesh_manager():
+            return None
+        
+        monkeypatch.setitem(admin_dispatcher.CANDIDATE_SETTINGS, "enabled", True)
+        monkeypatch.setitem(admin_dispatcher.COUNCIL_SETTINGS, "enabled", False)
+        monkeypatch.setattr(admin_dispatcher, "get_candidate_search", Search)
+        monkeypatch.setattr(admin_dispatcher, "get_mesh_manager", mesh_manager)
+        monkeypatch.setattr(admin_dispatcher, "get_relevant_definitions", lambda task: "")
+        monkeypatch.setattr(admin_dispatcher, "log_task_event", lambda *args, **kwargs: None)
+        result = await admin_dispatcher.dispatch("Fix this code", code="def f(:\n", tests="assert True")
+        assert result == "fixed" and seen == {"code": "def f(:\n", "tests": "assert True"}
+
+    async def test_code_reaches_the_mesh_prompt(self, monkeypatch):
+        """Test that the code and error given to dispatch are packed into the model prompt."""
+        import AdministrativeMesh.admin_dispatcher as admin_dispatcher
+        from LLM_Mesh.mesh_manager import MeshManager
+        manager = MeshManager()
+        manager.models_initialized = True
+        prompts = []
+        
+        async def model_response(task_type, prompt, max_tokens=1000):
+            prompts.append(prompt)
+            return "fixed"
+        
+        async def mesh_manager():
+            return manager
+        
+        manager._get_model_response = model_response
+        monkeypatch.setitem(admin_dispatcher.CANDIDATE_SETTINGS, "enabled", False)
+        monkeypatch.setitem(admin_dispatcher.CASCADE_SETTINGS, "enabled", False)
+        monkeypatch.setitem(admin_dispatcher.COUNCIL_SETTINGS, "enabled", False)
+        monkeypatch.setattr(admin_dispatcher, "get_mesh_manager", mesh_manager)
+        monkeypatch.setattr(admin_dispatcher, "get_semantic_context_slice", lambda task: "")
+        monkeypatch.setattr(admin_dispatcher, "get_relevant_definitions", lambda task: "")
+        monkeypatch.setattr(admin_dispatcher, "log_task_event", lambda *args, **kwargs: None)
+        result = await admin_dispatcher.dispatch("Fix this code", code="def total(xs):\n    return sum(xs",
+                                                 error="SyntaxError: '(' was never closed")
+        assert result == "fixed"
+        assert "return sum(xs" in prompts[0] and "was never closed" in prompts[0]
+
+class TestChatRoute:
+    """Test status codes of the chat completions route."""
+    
+    def test_deadline_returns_504(self, monkeypatch):
+        """Test that a request over its deadline gets a 504, not a 200 error body."""
+        from fastapi.testclient import TestClient
+        import rest_api
+        
+        async def dispatch(prompt):
+            await asyncio.sleep(5)
+        
+        monkeypatch.setattr(rest_api, "dispatch", dispatch)
+        monkeypatch.setitem(rest_api.RATE_LIMIT_SETTINGS, "enabled", False)
+        monkeypatch.setitem(rest_api.DEADLINE_SETTINGS, "request_timeout", 0.1)
+        response = TestClient(rest_api.app).post("/v1/chat/completions", json={
+            "model": "nca", "messages": [{"role": "user", "content": "Fix this code"}]
+        })
+        assert response.status_code == 504
+    
+    def test_disconnect_returns_499(self, monkeypatch):
+        """Test that a client that went away gets a 499, not a 200 error body."""
+        from fastapi.testclient import TestClient
+        import rest_api
+        
+        async def disconnected(coro, is_disconnected):
+            coro.close()
+            raise rest_api.ClientDisconnected("gone")
+        
+        monkeypatch.setattr(rest_api, "run_until_disconnected", disconnected)
+        monkeypatch.setitem(rest_api.RATE_LIMIT_SETTINGS, "enabled", False)
+        response = TestClient(rest_api.app).post("/v1/chat/completions", json={
+            "model": "nca", "messages": [{"role": "user", "content": "Fix this code"}]
+        })
+        assert response.status_code == 499
+
+class TestEditorSocket:
+    """Test the editor WebSocket endpoint."""
+    
+    def test_client_tests_are_not_run(self, monkeypatch):
+        """Test that tests sent by an editor never reach dispatch."""
+        from fastapi.testclient import TestClient
+        import rest_api
+        calls = []
+        
+        async def dispatch(prompt, **kwargs):
+            calls.append(kwargs)
+            return "fixed"
+        
+        monkeypatch.setattr(rest_api, "dispatch", dispatch)
+        monkeypatch.setitem(rest_api.RATE_LIMIT_SETTINGS, "enabled", False)
+        with TestClient(rest_api.app).websocket_connect("/v1/editor") as socket:
+            assert socket.receive_json()["type"] == "session"
+            socket.send_json({"type": "open", "path": "a.py", "content": "def f(:\n"})
+            assert socket.receive_json()["type"] == "opened"
+            socket.send_json({"type": "request", "id": "r1", "prompt": "Fix this", "path": "a.py",
+                              "tests": "import os; os.system('id')"})
+            assert socket.receive_json() == {"type": "result", "id": "r1", "content": "fixed"}
+        assert calls == [{"code": "def f(:\n"}]
 
 def run_comprehensive_tests():
     """Run all tests and provide a summary."""